@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from boot_prober import BootProber
+from fake_frontend import FakeFrontend, FakeTestbed
+
+# Compares the former one-node-at-a-time boot_wait loop with BootProber against a local fake frontend.
+# Sequential wall time grows with the sum of the per-node hop latencies, the concurrent one with the slowest node.
+
+SCALES       = [2, 10, 50]
+MAX_BOOT     = 2.0   # s, boot delays are uniformly distributed in [0, MAX_BOOT]
+HOP_LATENCY  = 0.3   # s, cost of one 'ssh root@node-X' from the frontend
+RETRY_PAUSE  = 0.5
+DEADLINE     = 60
+
+
+def node_list(scale):
+	return ['a8-{0}.saclay.iot-lab.info'.format(i) for i in range(scale)]
+
+def probe_with(client):
+	def probe(node_name):
+		stdin, stdout, stderr = client.exec_command('ssh -o "StrictHostKeyChecking no" root@' + node_name + ' "cd A8;"')
+		return stdout.channel.recv_exit_status() == 0
+	return probe
+
+def discard(topic, message):
+	pass
+
+def sequential(probe, nodes):
+	# The boot_wait loop as it used to be: each node is probed until it answers before moving on
+	booted = []
+	for node in nodes:
+		node_name = 'node-' + node.split('.')[0]
+		started = time.time()
+		while time.time() - started < DEADLINE:
+			if probe(node_name):
+				booted.append(node)
+				break
+			time.sleep(RETRY_PAUSE)
+	return booted
+
+def concurrent(probe, nodes):
+	return BootProber(probe, discard, BootProber.CONCURRENCY, DEADLINE, RETRY_PAUSE).run(nodes)
+
+def run(scale, strategy):
+	random.seed(scale)
+	nodes = node_list(scale)
+	delays = dict(('node-' + node.split('.')[0], random.uniform(0, MAX_BOOT)) for node in nodes)
+
+	frontend = FakeFrontend(FakeTestbed(delays, HOP_LATENCY).handle).start()
+	client = frontend.client()
+
+	started = time.time()
+	booted = strategy(probe_with(client), nodes)
+	elapsed = time.time() - started
+
+	client.close()
+	frontend.stop()
+
+	assert len(booted) == scale
+	return elapsed, max(delays.values())
+
+def main():
+	print('{0:>6} {1:>14} {2:>14} {3:>14}'.format('nodes', 'slowest (s)', 'sequential (s)', 'concurrent (s)'))
+	for scale in SCALES:
+		seq_time, slowest = run(scale, sequential)
+		con_time, slowest = run(scale, concurrent)
+		print('{0:>6} {1:>14.2f} {2:>14.2f} {3:>14.2f}'.format(scale, slowest, seq_time, con_time))
+
+if __name__ == '__main__':
+	main()
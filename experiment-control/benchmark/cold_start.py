@@ -0,0 +1,111 @@
+import os
+import sys
+import __builtin__
+import argparse
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Cold start of the main.py actions: the time from spawning `python main.py --action <action>` to the action being
+# ready, i.e. its code loaded and about to do its first piece of work (SSH connection, MQTT connection, OV launch...),
+# which is where the button-to-first-event latency of the web UI goes before any network round trip. Every run is a
+# fresh process, stopped at that point, so nothing is done against IoT-LAB. The lazy rows are main.py as it is, the
+# eager rows first import what main.py used to import for every action. The UI relay is a FakeRelay.
+
+ACTIONS       = ['check', 'reserve', 'terminate', 'otbox', 'otbox-flash', 'ov-start', 'ov-monitor', 'ov-metrics', 'orchestrate']
+EAGER_MODULES = ['otbox_startup', 'otbox_flash', 'ov_startup', 'reservation', 'ov_log_monitor', 'metrics_stream', 'orchestrator']
+RUNS          = 5
+
+
+def ready(started, directory):
+	sys.setprofile(None)
+	sys.stdout.write('\n' + json.dumps({'ready': time.time() - started, 'modules': len([name for name in sys.modules if sys.modules[name] is not None])}) + '\n')
+	sys.stdout.flush()
+	shutil.rmtree(directory)
+	os._exit(0)
+
+# Runs main.py for the action up to its first call that is not one of its imports
+def child(action, eager, started):
+	if eager:
+		for name in EAGER_MODULES:
+			__import__(name)
+
+	import main
+	import experiment
+	from fake_relay import FakeRelay
+
+	directory = tempfile.mkdtemp()
+	experiment.EXPERIMENTS_DIR = directory
+	FakeRelay().install()
+	code = main.ACTIONS[action].func_code
+	original_import = __builtin__.__import__
+
+	def stop_at_first_call(frame, event, arg):
+		if event == 'call' and frame.f_back is not None and frame.f_back.f_code is code and frame.f_code.co_name != '<module>' and frame.f_code is not traced_import.func_code:
+			ready(started, directory)
+
+	def traced_import(*args, **kwargs):
+		module = original_import(*args, **kwargs)
+		if sys._getframe(1).f_code is code:
+			# Profiling from the first import of the action on, not to slow down loading what main.py needs
+			sys.setprofile(stop_at_first_call)
+		return module
+
+	__builtin__.__import__ = traced_import
+	sys.argv = ['main.py', '--action', action, '--exp-id', 'cold-start']
+	main.main()
+	ready(started, directory) # the action returned without calling anything
+
+def median(values):
+	values = sorted(values)
+	return values[len(values) // 2]
+
+def measure(action, eager, runs):
+	results = []
+	for run in range(runs):
+		started = time.time()
+		command = [sys.executable, __file__, '--child', action, '--started', repr(started)] + (['--eager'] if eager else [])
+		with open(os.devnull, 'w') as devnull:
+			output = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=devnull).communicate()[0]
+		try:
+			results.append(json.loads(output.strip().splitlines()[-1]))
+		except (ValueError, IndexError):
+			return None
+	return {'ready': median([result['ready'] for result in results]), 'modules': results[-1]['modules']}
+
+def interpreter(runs):
+	timings = []
+	for run in range(runs):
+		started = time.time()
+		subprocess.call([sys.executable, '-c', 'pass'])
+		timings.append(time.time() - started)
+	return median(timings)
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--actions', default=','.join(ACTIONS))
+	parser.add_argument('--runs', type=int, default=RUNS, help='processes per action and mode, the median is reported')
+	parser.add_argument('--child', help=argparse.SUPPRESS)
+	parser.add_argument('--started', type=float, help=argparse.SUPPRESS)
+	parser.add_argument('--eager', action='store_true', help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.child:
+		child(args.child, args.eager, args.started)
+
+	print('Python startup: {0:.0f} ms'.format(interpreter(args.runs) * 1000))
+	print('{0:>12} {1:>10} {2:>10} {3:>9} {4:>10} {5:>9}'.format('action', 'eager (ms)', 'modules', 'lazy (ms)', 'modules', 'saved'))
+	for action in args.actions.split(','):
+		eager = measure(action, True, args.runs)
+		lazy = measure(action, False, args.runs)
+		if eager is None or lazy is None:
+			print('{0:>12} {1:>10}'.format(action, 'failed'))
+			continue
+		print('{0:>12} {1:>10.0f} {2:>10} {3:>9.0f} {4:>10} {5:>8.0f}%'.format(action, eager['ready'] * 1000, eager['modules'], lazy['ready'] * 1000, lazy['modules'], 100 * (1 - lazy['ready'] / eager['ready'])))
+
+if __name__ == '__main__':
+	main()
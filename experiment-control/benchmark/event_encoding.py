@@ -0,0 +1,72 @@
+import os
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from socket_io_handler import SocketIoEmitter
+
+# Cost of getting a batch of OV log records from the log file to the browser, per batch of BATCH records:
+#   string    - the former path: the log lines are joined into a JSON array string, which the Socket.IO client
+#               encodes again as a JSON string; the browser parses the string, then the array, then each record
+#   envelope  - the records decoded by the monitor (it needs them for the metrics anyway) are published in an
+#               envelope, encoded once by the client and parsed once by the browser
+# Reports the bytes on the wire and the encoding and decoding times.
+
+BATCH   = 200
+BATCHES = 200
+
+
+class Relay:
+
+	def __init__(self):
+		self.frames = []
+
+	def connect(self):
+		return self
+
+	def emit(self, event, *args):
+		self.frames.append(json.dumps([event] + list(args))) # what socketIO_client puts on the wire
+
+	def disconnect(self):
+		pass
+
+
+def lines():
+	for n in range(BATCH):
+		yield json.dumps({'_timestamp': time.time(), '_type': 'openbenchmark.packetSent', '_mote_info': {'serial': 'emulated{0}'.format(n % 50)}, 'timestamp': n, 'packetToken': [n % 256, 1, 2, 3, 4], 'source': 'emulated1', 'destination': 'emulated2', 'hopLimit': 255})
+
+def string_path(lines, records):
+	relay = Relay()
+	relay.emit('LOG_MODIFICATION_BATCH', '[' + ','.join(lines) + ']')
+	return relay.frames[0]
+
+def envelope_path(lines, records):
+	relay = Relay()
+	relay.emit(SocketIoEmitter.EVENT, {'topic': 'LOG_MODIFICATION_BATCH', 'payload': records, 'exp': 'default', 'channel': '1', 'seq': 0, 'ts': time.time()})
+	return relay.frames[0]
+
+# As Home.vue does, down to the string handed to the components for each record
+def decode_string(frame):
+	return [json.dumps(record) for record in json.loads(json.loads(frame)[1])]
+
+def decode_envelope(frame):
+	return [json.dumps(record) for record in json.loads(frame)[1]['payload']]
+
+def main():
+	batch = list(lines())
+	records = [json.loads(line) for line in batch] # decoded by the monitor for the metrics in both cases
+	print('{0:>10} {1:>12} {2:>14} {3:>14}'.format('path', 'bytes/batch', 'encode (ms)', 'decode (ms)'))
+	for name, encode, decode in [('string', string_path, decode_string), ('envelope', envelope_path, decode_envelope)]:
+		started = time.time()
+		frames = [encode(batch, records) for n in range(BATCHES)]
+		encoding = (time.time() - started) / BATCHES
+		started = time.time()
+		for frame in frames:
+			decode(frame)
+		decoding = (time.time() - started) / BATCHES
+		print('{0:>10} {1:>12} {2:>14.2f} {3:>14.2f}'.format(name, len(frames[0]), encoding * 1000, decoding * 1000))
+
+if __name__ == '__main__':
+	main()
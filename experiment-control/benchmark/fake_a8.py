@@ -0,0 +1,60 @@
+import re
+import time
+
+# Stands in for the A8 directory of the SSH frontend, shared with the nodes, as far as OTBox provisioning goes
+# (use handle() as a FakeFrontend handler): the opentestbed checkout and its stamp, the dependency bundles, and the
+# head of the upstream branch. Every git and pip operation costs `cost` seconds and is counted in `calls`, node
+# hops included, as they would be the network-bound part of a startup.
+
+class FakeA8:
+
+	CHECKOUT = re.compile(r'git checkout -q(?: -f)? (\w+)')
+	STAMP    = re.compile(r"echo '(.*)' > \S+")
+	BUNDLE   = re.compile(r'mv -T (\S+) ([^\s"]+)')
+	TEST_DIR = re.compile(r'test -d (\S+)')
+
+	def __init__(self, upstream='1' * 40, cost=0.0):
+		self.upstream = upstream # head of the branch
+		self.cost     = cost
+		self.revision = None     # checked out, None while there is no tree
+		self.stamp    = None
+		self.bundles  = set()
+		self.calls    = {'ls-remote': 0, 'clone': 0, 'fetch': 0, 'pip': 0}
+		self.launched = []       # otbox.py launch commands
+
+	def network(self, operation):
+		self.calls[operation] += 1
+		time.sleep(self.cost)
+
+	def handle(self, command):
+		if 'echo "stamp' in command:
+			bundle = self.TEST_DIR.search(command).group(1)
+			return (0, 'stamp {0}\nrevision {1}\nbundle {2}\n'.format(self.stamp or '', self.revision or '', 'ok' if bundle in self.bundles else ''), '')
+
+		if 'git ls-remote' in command:
+			self.network('ls-remote')
+			return (0, self.upstream + '\trefs/heads/opentestbed-extension\n', '')
+
+		if 'git clone' in command or 'git fetch' in command:
+			if 'git fetch' in command and self.revision is None:
+				return (1, '', 'cd: no such directory\n')
+			self.network('clone' if 'git clone' in command else 'fetch')
+			checkout = self.CHECKOUT.search(command)
+			self.revision = checkout.group(1) if checkout else self.upstream
+			return (0, self.revision + '\n', '')
+
+		stamp = self.STAMP.search(command)
+		if stamp:
+			self.stamp = stamp.group(1)
+			return (0, '', '')
+
+		if 'pip install' in command:
+			self.network('pip')
+			bundle = self.BUNDLE.search(command)
+			if bundle:
+				self.bundles.add(bundle.group(2))
+			return (0, '', '')
+
+		if 'otbox.py' in command:
+			self.launched.append(command)
+		return (0, '', '')
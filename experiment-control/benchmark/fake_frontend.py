@@ -0,0 +1,204 @@
+import os
+import sys
+import paramiko
+import random
+import socket
+import threading
+import time
+import re
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ssh_pool import SshPool
+
+# A local stand-in for the IoT-LAB SSH frontend.
+# Every exec request is answered by handler(command) -> (exit_status, stdout, stderr),
+# which runs on its own thread so that concurrent channels do not serialize each other.
+# Port forwarding (direct-tcpip) is refused, as by IoT-LAB, unless `nodes` maps node names to the address of
+# another FakeFrontend standing in for the node, which the channel is then relayed to. A FakeFrontend created with
+# accept_auth=False rejects every login, as a node that does not know our key.
+
+HOST_KEY = None
+
+def host_key():
+	global HOST_KEY
+	if HOST_KEY is None:
+		HOST_KEY = paramiko.RSAKey.generate(2048)
+	return HOST_KEY
+
+
+class FakeServer(paramiko.ServerInterface):
+
+	def __init__(self, frontend):
+		self.frontend = frontend
+
+	def get_allowed_auths(self, username):
+		return 'password,publickey'
+
+	def check_auth_password(self, username, password):
+		return paramiko.AUTH_SUCCESSFUL if self.frontend.accept_auth else paramiko.AUTH_FAILED
+
+	def check_auth_publickey(self, username, key):
+		return paramiko.AUTH_SUCCESSFUL if self.frontend.accept_auth else paramiko.AUTH_FAILED
+
+	def check_channel_request(self, kind, chanid):
+		if kind == 'session':
+			return paramiko.OPEN_SUCCEEDED
+		return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+	def check_channel_direct_tcpip_request(self, chanid, origin, destination):
+		if self.frontend.nodes is None:
+			return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+		address = self.frontend.nodes.get(destination[0])
+		if address is None:
+			return paramiko.OPEN_FAILED_CONNECT_FAILED
+		self.frontend.forwards[chanid] = address
+		return paramiko.OPEN_SUCCEEDED
+
+	def check_channel_exec_request(self, channel, command):
+		thread = threading.Thread(target=self.frontend.run_command, args=(channel, command))
+		thread.daemon = True
+		thread.start()
+		return True
+
+
+class FakeFrontend:
+
+	REPLY_SETTLE = 0.01
+
+	FORWARD_POLL = 0.2
+
+	def __init__(self, handler, host='127.0.0.1', port=0, nodes=None, accept_auth=True):
+		self.handler     = handler
+		self.host        = host
+		self.port        = port
+		self.nodes       = nodes       # node name -> (host, port), None: port forwarding refused
+		self.accept_auth = accept_auth
+		self.commands    = 0
+		self.lock        = threading.Lock()
+		self.transports  = []
+		self.forwards    = {}          # channel id -> address the channel is relayed to
+
+	def start(self):
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.sock.bind((self.host, self.port))
+		self.sock.listen(100)
+		self.port = self.sock.getsockname()[1]
+
+		thread = threading.Thread(target=self.accept_loop)
+		thread.daemon = True
+		thread.start()
+		return self
+
+	def stop(self):
+		self.sock.close()
+		self.disconnect()
+
+	# Drops the connections of the clients, as a network failure would
+	def disconnect(self):
+		for transport in self.transports:
+			transport.close()
+
+	def accept_loop(self):
+		while True:
+			try:
+				conn, addr = self.sock.accept()
+			except socket.error:
+				return
+
+			transport = paramiko.Transport(conn)
+			transport.add_server_key(host_key())
+			transport.start_server(server=FakeServer(self))
+			self.transports.append(transport)
+
+			if self.nodes is not None:
+				thread = threading.Thread(target=self.forward_loop, args=(transport,))
+				thread.daemon = True
+				thread.start()
+
+	def forward_loop(self, transport):
+		while transport.is_active():
+			channel = transport.accept(self.FORWARD_POLL)
+			if channel is None:
+				continue
+			address = self.forwards.pop(channel.get_id(), None)
+			if address is None:
+				continue # session channel, served by its exec request
+
+			sock = socket.create_connection(address)
+			for source, target in [(channel, sock), (sock, channel)]:
+				thread = threading.Thread(target=self.relay, args=(source, target))
+				thread.daemon = True
+				thread.start()
+
+	def relay(self, source, target):
+		try:
+			while True:
+				data = source.recv(32768)
+				if not data:
+					break
+				target.sendall(data)
+		except (socket.error, EOFError):
+			pass
+		finally:
+			source.close()
+			target.close()
+
+	def run_command(self, channel, command):
+		with self.lock:
+			self.commands += 1
+
+		# Lets the transport thread acknowledge the exec request before the channel can be closed
+		time.sleep(self.REPLY_SETTLE)
+
+		try:
+			status, out, err = self.handler(command)
+			if out:
+				channel.sendall(out)
+			if err:
+				channel.sendall_stderr(err)
+			channel.send_exit_status(status)
+		except Exception, e:
+			channel.sendall_stderr(str(e))
+			channel.send_exit_status(255)
+		finally:
+			channel.close()
+
+	def client(self, username='user'):
+		client = paramiko.SSHClient()
+		client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+		client.connect(self.host, port=self.port, username=username, password='fake', look_for_keys=False, allow_agent=False)
+		return client
+
+	def pool(self, username='user'):
+		return SshPool(username, self.host, self.port, password='fake', look_for_keys=False, allow_agent=False)
+
+
+class FakeTestbed:
+
+	NODE_HOP = re.compile(r'root@(node-[\w-]+)')
+
+	# boot_delays: {node_name: seconds after start() before the node answers}
+	# failure_rate: probability for any hop to fail as a refused connection would, booted node or not
+	def __init__(self, boot_delays, hop_latency=0.0, failure_rate=0.0):
+		self.boot_delays  = boot_delays
+		self.hop_latency  = hop_latency
+		self.failure_rate = failure_rate
+		self.started_at   = time.time()
+
+	def handle(self, command):
+		match = self.NODE_HOP.search(command)
+		if match:
+			return self.node_hop(match.group(1))
+		return (0, '', '')
+
+	def node_hop(self, node_name):
+		# Every hop pays the SSH latency of the frontend -> node connection, booted or not
+		time.sleep(self.hop_latency)
+
+		if node_name not in self.boot_delays:
+			return (255, '', 'ssh: Could not resolve hostname ' + node_name + '\n')
+		if time.time() - self.started_at < self.boot_delays[node_name] or random.random() < self.failure_rate:
+			return (255, '', 'ssh: connect to host ' + node_name + ' port 22: Connection refused\n')
+		return (0, '', '')
@@ -0,0 +1,45 @@
+import json
+import time
+
+# Stands in for the iotlab-experiment CLI of the SSH frontend (use handle() as a FakeFrontend handler).
+# The experiment goes through the states of `timeline`, [(state, seconds), ...], from the moment it is submitted
+# (or from the creation of the fake if submitted=True), and stays in the last one.
+
+class FakeIotlabCli:
+
+	EXPERIMENT_ID = 123456
+
+	def __init__(self, nodes, timeline=None, submitted=True):
+		self.nodes        = nodes # e.g. ['a8-106.saclay.iot-lab.info', ...]
+		self.timeline     = timeline if timeline is not None else [('Waiting', 1), ('Launching', 1), ('Running', 0)]
+		self.submitted_at = time.time() if submitted else None
+		self.calls        = []
+
+	def state(self):
+		if self.submitted_at is None:
+			return None
+
+		elapsed = time.time() - self.submitted_at
+		for state, duration in self.timeline:
+			if elapsed < duration:
+				return state
+			elapsed -= duration
+		return self.timeline[-1][0]
+
+	def handle(self, command):
+		self.calls.append(command)
+		state = self.state()
+
+		if command.startswith('iotlab-experiment submit'):
+			self.submitted_at = time.time()
+			return (0, json.dumps({'id': self.EXPERIMENT_ID}), '')
+		if state is None:
+			return (1, '', 'Error: no experiment running\n')
+		if command.startswith('iotlab-experiment get -s'):
+			return (0, json.dumps({'state': state}), '')
+		if command.startswith('iotlab-experiment get -p'):
+			return (0, json.dumps({'id': self.EXPERIMENT_ID, 'state': state, 'nodes': self.nodes}), '')
+		if command.startswith('iotlab-experiment stop'):
+			self.submitted_at = None
+			return (0, json.dumps({'id': self.EXPERIMENT_ID, 'status': 'Delete request registered'}), '')
+		return (0, '', '')
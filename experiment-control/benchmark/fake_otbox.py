@@ -0,0 +1,139 @@
+import os
+import sys
+import base64
+import json
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import firmware_chunks
+
+# Emulates the program command handling of otbox.py for one mote, on any paho-compatible client.
+# drop(seq) -> True makes the mote lose that chunk the first time it is sent.
+
+class FakeMote:
+
+	def __init__(self, client, testbed, device_id, drop=None, fail_attempts=0):
+		self.client            = client
+		self.testbed           = testbed
+		self.device_id         = device_id
+		self.drop              = drop
+		self.fail_attempts     = fail_attempts # number of program commands answered with a failure first
+		self.dropped           = set()
+
+		self.assembler         = None
+		self.image             = None
+		self.image_id          = None  # id of the image it runs, reported by its box
+		self.done_at           = None
+		self.requests          = 0
+		self.last_requested    = None
+		self.attempts          = 0
+		self.token             = None
+
+		self.client.on_connect = self.on_connect
+		self.client.on_message = self.on_message
+
+	def topic(self, device_id, suffix):
+		return '{0}/deviceType/mote/deviceId/{1}/{2}'.format(self.testbed, device_id, suffix)
+
+	def start(self, broker='localhost'):
+		self.client.connect(broker)
+		self.client.loop_start()
+		return self
+
+	def stop(self):
+		self.client.disconnect()
+		self.client.loop_stop()
+
+	def on_connect(self, client, userdata, flags, rc):
+		self.client.subscribe(self.topic('all', 'cmd/#'), 1)
+		self.client.subscribe(self.topic(self.device_id, 'cmd/#'), 1)
+
+	def on_message(self, client, userdata, message):
+		command = message.topic.split('/cmd/')[1]
+
+		if command == 'program':
+			payload = json.loads(message.payload)
+			self.token = payload.get('token')
+			self.flashed(base64.b64decode(payload['hex']))
+		elif command == 'program/manifest':
+			manifest = json.loads(message.payload)
+			self.token = manifest.get('token')
+			self.image = None
+			self.assembler = firmware_chunks.FirmwareAssembler(manifest)
+		elif command == 'program/chunk' and self.assembler is not None:
+			self.on_chunk(message.payload)
+
+	def on_chunk(self, payload):
+		prefix, seq, total, piece = firmware_chunks.decode_chunk(payload)
+
+		if self.drop is not None and seq not in self.dropped and self.drop(seq):
+			self.dropped.add(seq)
+		else:
+			self.assembler.add(payload)
+
+		if self.assembler.complete():
+			self.flashed(self.assembler.image())
+		elif seq == total - 1 or seq == self.last_requested:
+			self.request_missing()
+
+	def request_missing(self):
+		missing = self.assembler.missing()
+		self.last_requested = missing[-1]
+		self.requests += 1
+		self.client.publish(self.topic(self.device_id, 'resp/program/missing'), json.dumps({'id': self.assembler.manifest['id'], 'missing': missing}), 1)
+
+	def flashed(self, image):
+		self.assembler = None # chunks still in flight belong to this attempt
+		self.attempts += 1
+		success = self.attempts > self.fail_attempts
+
+		if success:
+			self.image    = image
+			self.image_id = firmware_chunks.image_id(image)
+			self.done_at  = time.time()
+		self.client.publish(self.topic(self.device_id, 'resp/program'), json.dumps({'token': self.token, 'success': success}), 1)
+
+
+# Emulates the status command of an otbox, reporting the EUI64 of the motes attached to it and the image they run.
+
+class FakeBox:
+
+	def __init__(self, client, testbed, box_id, motes, report_images=True):
+		self.client            = client
+		self.testbed           = testbed
+		self.box_id            = box_id
+		self.motes             = motes
+		self.report_images     = report_images # False: an otbox that does not know the image of its motes
+
+		self.client.on_connect = self.on_connect
+		self.client.on_message = self.on_message
+
+	def start(self, broker='localhost'):
+		self.client.connect(broker)
+		self.client.loop_start()
+		return self
+
+	def stop(self):
+		self.client.disconnect()
+		self.client.loop_stop()
+
+	def on_connect(self, client, userdata, flags, rc):
+		self.client.subscribe('{0}/deviceType/box/deviceId/all/cmd/status'.format(self.testbed), 1)
+		self.client.subscribe('{0}/deviceType/box/deviceId/{1}/cmd/status'.format(self.testbed, self.box_id), 1)
+
+	def on_message(self, client, userdata, message):
+		request = json.loads(message.payload)
+		motes = []
+		for mote in self.motes:
+			status = {'EUI64': mote.device_id}
+			if self.report_images and mote.image_id is not None:
+				status['image_id'] = mote.image_id
+			motes.append(status)
+
+		response = {
+			'token'     : request.get('token'),
+			'success'   : True,
+			'returnVal' : {'motes': motes}
+		}
+		self.client.publish('{0}/deviceType/box/deviceId/{1}/resp/status'.format(self.testbed, self.box_id), json.dumps(response), 1)
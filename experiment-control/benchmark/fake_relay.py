@@ -0,0 +1,45 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from socket_io_handler import SocketIoEmitter
+
+# A local stand-in for the Socket.IO relay (nodejs_websocket), counting the envelopes it receives per topic.
+# install() makes it the relay of the process emitter, which every SocketIoHandler publishes through.
+
+class FakeRelay:
+
+	def __init__(self, emit_cost=0.0):
+		self.emit_cost = emit_cost # s per emit, the round trip to the relay
+		self.topics    = {}
+		self.events    = 0
+		self.records   = 0         # envelopes, plus the records of the batched topics
+		self.last_at   = None
+		self.lock      = threading.Lock()
+
+	def install(self):
+		SocketIoEmitter.emitter = SocketIoEmitter(self.connect)
+		return self
+
+	def connect(self):
+		return self
+
+	def emit(self, name, envelope):
+		if self.emit_cost:
+			time.sleep(self.emit_cost)
+		with self.lock:
+			topic = envelope['topic']
+			self.topics[topic] = self.topics.get(topic, 0) + 1
+			self.events += 1
+			self.records += len(envelope['payload']) if topic.endswith('_BATCH') else 1
+			self.last_at = time.time()
+
+	def count(self, topic):
+		with self.lock:
+			return self.topics.get(topic, 0)
+
+	def disconnect(self):
+		pass
@@ -0,0 +1,85 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import paho.mqtt.client as mqtt
+
+from firmware_store import FirmwareStore
+from otbox_flash import OTBoxFlash
+from inproc_broker import InProcessBroker
+from fake_otbox import FakeMote
+
+# Compares the single-blob program command with the chunked transfer: bytes on the wire, time until
+# every emulated mote holds the image (time-to-flash) and the resulting image throughput.
+# Runs on the in-process broker by default, or against a real broker (e.g. a local mosquitto) with --broker.
+
+FIRMWARE      = os.path.join(os.path.dirname(__file__), '..', 'firmware', '03oos_openwsn_prog')
+TESTBED       = 'bench'
+BANDWIDTH     = 1000000    # bytes/s between the control host and the in-process broker
+LOSS_EVERY    = 7          # every n-th chunk is lost once by each mote in the chunked runs
+FLASH_TIMEOUT = 30
+
+
+def make_client(broker, client_id):
+	if broker is None:
+		return INPROC.client(client_id)
+	return mqtt.Client(client_id)
+
+def run(mode, motes, broker):
+	drop = (lambda seq: seq % LOSS_EVERY    == 0) if mode == OTBoxFlash.MODE_CHUNKED else None
+	fleet = [FakeMote(make_client(broker, 'mote-{0}'.format(i)), TESTBED, 'mote-{0}'.format(i), drop).start(broker or 'inproc') for i in range(motes)]
+	time.sleep(0.5) # subscriptions
+
+	store_dir = tempfile.mkdtemp() # cold: the payloads are encoded by the run, as before the store
+	flasher = OTBoxFlash(FIRMWARE, broker or 'inproc', TESTBED, mode, make_client(broker, 'bench-flash'), store=FirmwareStore(store_dir))
+	flasher.RESEND_WINDOW = 1
+
+	started = time.time()
+	thread = threading.Thread(target=flasher.flash)
+	thread.start()
+	thread.join()
+	shutil.rmtree(store_dir)
+
+	# The blob publish returns as soon as the message is handed to the network, wait for the motes
+	while time.time() - started < FLASH_TIMEOUT and any(mote.image is None for mote in fleet):
+		time.sleep(0.1)
+
+	for mote in fleet:
+		mote.stop()
+
+	flashed = [mote for mote in fleet if mote.image is not None]
+	ttf = max(mote.done_at for mote in flashed) - started if flashed else float('nan')
+	size = os.path.getsize(FIRMWARE)
+
+	return {
+		'mode'       : mode,
+		'flashed'    : '{0}/{1}'.format(len(flashed), motes),
+		'messages'   : flasher.stats['messages'],
+		'bytes'      : flasher.stats['bytes'],
+		'ttf'        : ttf,
+		'throughput' : size / ttf / 1000 if flashed else 0.0
+	}
+
+def main():
+	global INPROC
+
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--broker', default=None, help='MQTT broker host, in-process stand-in if omitted')
+	parser.add_argument('--motes', type=int, default=10)
+	parser.add_argument('--max-payload', type=int, default=None, help='message size limit of the in-process broker')
+	args = parser.parse_args()
+
+	print('{0:>8} {1:>8} {2:>9} {3:>10} {4:>17} {5:>18}'.format('mode', 'flashed', 'messages', 'bytes', 'time-to-flash (s)', 'throughput (kB/s)'))
+	for mode in (OTBoxFlash.MODE_BLOB, OTBoxFlash.MODE_CHUNKED):
+		INPROC = InProcessBroker(args.max_payload, BANDWIDTH)
+		row = run(mode, args.motes, args.broker)
+		print('{mode:>8} {flashed:>8} {messages:>9} {bytes:>10} {ttf:>17.2f} {throughput:>18.1f}'.format(**row))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,90 @@
+import os
+import sys
+import argparse
+import base64
+import json
+import shutil
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import firmware_chunks
+from firmware_store import FirmwareStore
+from otbox_flash import OTBoxFlash
+from inproc_broker import InProcessBroker
+from fake_otbox import FakeBox, FakeMote
+from fake_relay import FakeRelay
+
+# What a flash costs on the control host and on the broker when the motes already run the firmware.
+# Payloads: preparing the program command and the chunked transfer as every run did (read, base64, JSON, zlib),
+# against taking them from a cold then a warm FirmwareStore.
+# Back-to-back runs: two tracked flashes of the same fleet, the second finding the image reported by the boxes.
+
+FIRMWARE = os.path.join(os.path.dirname(__file__), '..', 'firmware', '03oos_openwsn_prog')
+TESTBED  = 'bench'
+REPEAT   = 5
+
+
+def timed(function):
+	started = time.time()
+	for i in range(REPEAT):
+		function()
+	return (time.time() - started) / REPEAT
+
+def encode_every_run():
+	with open(FIRMWARE, 'rb') as f:
+		data = f.read()
+	json.dumps({'token': 'abcd', 'hex': base64.b64encode(data), 'description': ''})
+	firmware_chunks.encode_firmware(data)
+
+def from_store(directory, cold):
+	def prepare():
+		if cold:
+			shutil.rmtree(directory, True)
+		artifact = FirmwareStore(directory).add(FIRMWARE)
+		artifact.program_payload('abcd')
+		artifact.manifest_and_chunks()
+	return prepare
+
+def flash(broker, store, mode):
+	flasher = OTBoxFlash(FIRMWARE, 'inproc', TESTBED, mode, broker.client('bench-flash'), track=True, store=store)
+	flasher.DISCOVERY_TIMEOUT = 0.5
+	flasher.RESEND_WINDOW = 0.5
+	bytes_before = broker.bytes
+	started = time.time()
+	summary = flasher.flash()
+	return time.time() - started, summary, broker.bytes - bytes_before
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--motes', type=int, default=20)
+	parser.add_argument('--mode', default=OTBoxFlash.MODE_BLOB, choices=[OTBoxFlash.MODE_BLOB, OTBoxFlash.MODE_CHUNKED])
+	args = parser.parse_args()
+
+	FakeRelay().install()
+	directory = tempfile.mkdtemp()
+	store_dir = os.path.join(directory, 'store')
+	try:
+		print('payloads of a {0} kB image, per run'.format(os.path.getsize(FIRMWARE) // 1024))
+		print('  encoded by the run:   {0:8.1f} ms'.format(timed(encode_every_run) * 1000))
+		print('  cold store:           {0:8.1f} ms'.format(timed(from_store(store_dir, True)) * 1000))
+		print('  warm store:           {0:8.1f} ms'.format(timed(from_store(store_dir, False)) * 1000))
+
+		broker = InProcessBroker()
+		fleet = []
+		for i in range(args.motes):
+			mote = FakeMote(broker.client('mote-{0}'.format(i)), TESTBED, 'mote-{0}'.format(i)).start()
+			fleet.append(FakeBox(broker.client('box-{0}'.format(i)), TESTBED, 'box-{0}'.format(i), [mote]).start())
+		store = FirmwareStore(store_dir)
+
+		print('{0} motes, {1} mode'.format(args.motes, args.mode))
+		for run in ['first run', 'second run']:
+			elapsed, summary, sent = flash(broker, store, args.mode)
+			print('  {0:<12} {1:>3} flashed {2:>3} skipped {3:>10} bytes {4:>8.2f} s'.format(run, len(summary['flashed']), len(summary['skipped']), sent, elapsed))
+	finally:
+		shutil.rmtree(directory)
+	os._exit(0)
+
+if __name__ == '__main__':
+	main()
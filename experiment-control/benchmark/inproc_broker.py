@@ -0,0 +1,144 @@
+import Queue
+import threading
+import time
+import traceback
+
+import paho.mqtt.client as mqtt
+
+# An in-process stand-in for an MQTT broker, exposing the subset of the paho client API used by experiment-control.
+# Messages are routed in publish order by a single dispatcher thread. max_payload mimics the size limit of
+# public brokers (larger messages are dropped) and bandwidth (bytes/s) the uplink to the broker.
+
+class MessageInfo:
+
+	def __init__(self):
+		self.rc    = mqtt.MQTT_ERR_SUCCESS
+		self.event = threading.Event()
+
+	def wait_for_publish(self):
+		self.event.wait()
+
+	def is_published(self):
+		return self.event.is_set()
+
+
+class Message:
+
+	def __init__(self, topic, payload, qos):
+		self.topic   = topic
+		self.payload = payload
+		self.qos     = qos
+
+
+class FakeClient:
+
+	def __init__(self, broker, client_id=''):
+		self.broker        = broker
+		self.client_id     = client_id
+		self.subscriptions = []
+		self.on_connect    = None
+		self.on_message    = None
+		self.on_disconnect = None
+		self.stopped       = threading.Event()
+
+	def connect(self, host, port=1883, keepalive=60):
+		self.stopped.clear()
+		self.broker.attach(self)
+		return mqtt.MQTT_ERR_SUCCESS
+
+	def disconnect(self):
+		self.broker.detach(self)
+		self.stopped.set()
+		if self.on_disconnect is not None:
+			self.on_disconnect(self, None, 0)
+		return mqtt.MQTT_ERR_SUCCESS
+
+	def subscribe(self, topic, qos=0):
+		self.subscriptions.append(topic)
+		return (mqtt.MQTT_ERR_SUCCESS, 0)
+
+	def publish(self, topic, payload=None, qos=0, retain=False):
+		return self.broker.publish(topic, payload, qos)
+
+	def loop_start(self):
+		pass
+
+	def loop_stop(self, force=False):
+		pass
+
+	def loop_forever(self):
+		self.stopped.wait()
+
+	def matches(self, topic):
+		for subscription in self.subscriptions:
+			if mqtt.topic_matches_sub(subscription, topic):
+				return True
+		return False
+
+
+class InProcessBroker:
+
+	def __init__(self, max_payload=None, bandwidth=None):
+		self.max_payload = max_payload
+		self.bandwidth   = bandwidth
+		self.clients     = []
+		self.lock        = threading.Lock()
+		self.queue       = Queue.Queue()
+		self.dropped     = 0
+		self.delivered   = 0
+		self.bytes       = 0
+
+		thread = threading.Thread(target=self.dispatch)
+		thread.daemon = True
+		thread.start()
+
+	def client(self, client_id=''):
+		return FakeClient(self, client_id)
+
+	def attach(self, client):
+		with self.lock:
+			self.clients.append(client)
+		# CONNACK goes through the dispatcher, as on_connect runs on the network thread with paho
+		self.queue.put((client, None))
+
+	def detach(self, client):
+		with self.lock:
+			if client in self.clients:
+				self.clients.remove(client)
+
+	def publish(self, topic, payload, qos):
+		info = MessageInfo()
+		self.queue.put((Message(topic, payload, qos), info))
+		return info
+
+	def dispatch(self):
+		while True:
+			item, info = self.queue.get()
+
+			if isinstance(item, FakeClient):
+				if item.on_connect is not None:
+					item.on_connect(item, None, {}, 0)
+				continue
+
+			size = len(item.payload or '')
+			if self.bandwidth is not None:
+				time.sleep(float(size) / self.bandwidth)
+
+			if self.max_payload is not None and size > self.max_payload:
+				self.dropped += 1
+				info.rc = mqtt.MQTT_ERR_PAYLOAD_SIZE
+				info.event.set()
+				continue
+
+			self.bytes += size
+			info.event.set()
+
+			with self.lock:
+				receivers = [client for client in self.clients if client.matches(item.topic)]
+			for client in receivers:
+				self.delivered += 1
+				if client.on_message is not None:
+					try:
+						client.on_message(client, None, item)
+					except Exception:
+						traceback.print_exc()
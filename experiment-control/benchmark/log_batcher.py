@@ -0,0 +1,64 @@
+import os
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from log_batcher import LogBatcher
+
+# Publishes a burst of log records through a publisher that takes EMIT_COST per emit (the Socket.IO round trip),
+# once with one synchronous emit per record as the monitor used to, and once through LogBatcher with each policy.
+# Reports how long the file watching thread is held and how many messages reach the relay.
+
+RECORDS   = 20000
+MOTES     = 50
+METRICS   = ['cpu', 'radioDutyCycle', 'latency']
+EMIT_COST = 0.002 # s
+
+
+class SlowPublisher:
+
+	def __init__(self):
+		self.messages = 0
+		self.bytes    = 0
+
+	def publish(self, topic, message):
+		time.sleep(EMIT_COST)
+		self.messages += 1
+		self.bytes    += len(json.dumps(message)) # as encoded by the Socket.IO client
+
+
+def records():
+	for n in range(RECORDS):
+		mote   = 'emulated{0}'.format(n % MOTES)
+		metric = METRICS[n % len(METRICS)]
+		yield {'_timestamp': time.time(), '_type': 'openbenchmark.' + metric, '_mote_info': {'serial': mote}, metric: n}, (metric, mote)
+
+def per_record():
+	publisher = SlowPublisher()
+	started = time.time()
+	for record, key in records():
+		publisher.publish('LOG_MODIFICATION', record)
+	held = time.time() - started
+	return held, held, publisher, RECORDS
+
+def batched(policy):
+	publisher = SlowPublisher()
+	batcher = LogBatcher(publisher.publish, policy, max_queue=1000)
+	started = time.time()
+	for record, key in records():
+		batcher.put(record, key)
+	held = time.time() - started
+	batcher.close()
+	return held, time.time() - started, publisher, batcher.stats['published']
+
+def main():
+	print('{0:>12} {1:>10} {2:>10} {3:>9} {4:>10} {5:>10}'.format('publishing', 'held (s)', 'total (s)', 'messages', 'delivered', 'kB'))
+	runs = [('per-record', per_record)] + [(policy, lambda policy=policy: batched(policy)) for policy in LogBatcher.POLICIES]
+	for name, run in runs:
+		held, total, publisher, delivered = run()
+		print('{0:>12} {1:>10.2f} {2:>10.2f} {3:>9} {4:>10} {5:>10}'.format(name, held, total, publisher.messages, delivered, publisher.bytes // 1024))
+
+if __name__ == '__main__':
+	main()
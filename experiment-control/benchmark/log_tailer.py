@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+import logging.handlers
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+from log_tailer import LogTailer
+
+# Feeds a synthetic networkEvent.log (with rotation) at a fixed record rate and compares how many records
+# reach the publisher, and at which CPU cost, with the former 'tail -1' per event and with LogTailer.
+
+RATES       = [200, 1000, 5000] # records/s
+DURATION    = 5                 # s per run
+MAX_BYTES   = 2000000           # rotation size of the synthetic log
+DRAIN_PAUSE = 1
+
+
+class TailLastLine(FileSystemEventHandler):
+
+	def __init__(self):
+		self.records = 0
+		self.last_timestamp = 0.0
+
+	def on_modified(self, event):
+		if event.is_directory or not os.path.isfile(event.src_path):
+			return
+		try:
+			timestamp = float(json.loads(subprocess.check_output(['tail', '-1', event.src_path]))['_timestamp'])
+		except Exception:
+			return
+		if timestamp > self.last_timestamp:
+			self.records += 1
+			self.last_timestamp = timestamp
+
+
+class Tail(FileSystemEventHandler):
+
+	def __init__(self):
+		self.records = 0
+		self.tailer = LogTailer()
+
+	def on_modified(self, event):
+		if not event.is_directory:
+			self.count(self.tailer.read(event.src_path))
+
+	def on_created(self, event):
+		self.on_modified(event)
+
+	def on_moved(self, event):
+		if not event.is_directory:
+			self.count(self.tailer.read(event.dest_path))
+
+	def count(self, lines):
+		for line in lines:
+			json.loads(line)
+			self.records += 1
+
+
+def write_log(log_dir, rate, duration):
+	logger = logging.getLogger('bench-{0}'.format(time.time()))
+	handler = logging.handlers.RotatingFileHandler(os.path.join(log_dir, 'networkEvent.log'), maxBytes=MAX_BYTES, backupCount=5)
+	logger.addHandler(handler)
+	logger.setLevel(logging.INFO)
+
+	written = 0
+	started = time.time()
+	while time.time() - started < duration:
+		# Records are written in small bursts, as OpenVisualizer does for each serial frame
+		target = int((time.time() - started) * rate)
+		while written < target:
+			logger.info(json.dumps({'_timestamp': time.time(), '_type': 'packetReceived', 'source': 'bbbb::1', 'hopLimit': 64 - written % 5, 'n': written}))
+			written += 1
+		time.sleep(0.005)
+
+	handler.close()
+	return written
+
+def cpu_time():
+	times = os.times()
+	return times[0] + times[1] + times[2] + times[3]
+
+def run(handler_class, rate):
+	log_dir = tempfile.mkdtemp()
+	handler = handler_class()
+	observer = Observer()
+	observer.schedule(handler, path=log_dir, recursive=False)
+	observer.start()
+
+	cpu = cpu_time()
+	written = write_log(log_dir, rate, DURATION)
+	time.sleep(DRAIN_PAUSE)
+	cpu = cpu_time() - cpu
+
+	observer.stop()
+	observer.join()
+	shutil.rmtree(log_dir)
+
+	return written, handler.records, cpu
+
+def main():
+	print('{0:>8} {1:>14} {2:>9} {3:>10} {4:>11} {5:>9}'.format('rate', 'monitor', 'written', 'published', 'records/s', 'cpu (s)'))
+	for rate in RATES:
+		for handler_class in (TailLastLine, Tail):
+			written, published, cpu = run(handler_class, rate)
+			print('{0:>8} {1:>14} {2:>9} {3:>10} {4:>11.0f} {5:>9.2f}'.format(rate, handler_class.__name__, written, published, published / float(DURATION), cpu))
+
+if __name__ == '__main__':
+	main()
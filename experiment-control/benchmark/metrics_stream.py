@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from metrics_stream import MetricsStream
+
+# A multi-hour experiment written as a JSON-lines event log: summarizing it by parsing the whole log again after the
+# run, as done so far, against streaming the events into MetricsStream during the run and loading its column files.
+
+NODES       = 50
+HOURS       = 4
+PERIOD      = 30  # s between two packets of a node
+MEASUREMENT = 300 # s between two duty cycle / clock drift measurements
+SLOT        = 0.01
+
+
+def events():
+	random.seed(1)
+	token = 0
+	for second in range(0, HOURS * 3600, PERIOD):
+		for node in range(NODES):
+			source = 'bbbb::{0:x}'.format(node + 2)
+			asn = int((second + node * PERIOD / float(NODES)) / SLOT)
+			token += 1
+			yield {'event': 'packetSent', 'timestamp': asn, 'packetToken': [token & 0xff, token >> 8 & 0xff, token >> 16], 'source': source, 'destination': 'bbbb::1', 'hopLimit': 255}
+			if random.random() < 0.95:
+				yield {'event': 'packetReceived', 'timestamp': asn + random.randint(20, 400), 'packetToken': [token & 0xff, token >> 8 & 0xff, token >> 16], 'source': source, 'destination': 'bbbb::1', 'hopLimit': 255 - random.randint(1, 4)}
+			if second % MEASUREMENT == 0:
+				yield {'event': 'radioDutyCycleMeasurement', 'timestamp': asn, 'dutyCycle': random.uniform(0.5, 2.0), 'source': source}
+				yield {'event': 'clockDriftMeasurement', 'timestamp': asn, 'clockDrift': random.uniform(-200, 200), 'source': source}
+
+def reparse(log_path):
+	stream = MetricsStream()
+	with open(log_path) as f:
+		for line in f:
+			stream.add(json.loads(line))
+	return stream.summary()
+
+def size(directory):
+	return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+def main():
+	directory = tempfile.mkdtemp()
+	log_path = os.path.join(directory, 'networkEvent.log')
+	metrics_dir = os.path.join(directory, 'metrics')
+
+	lines = [json.dumps(event) for event in events()]
+	with open(log_path, 'w') as f:
+		f.write('\n'.join(lines) + '\n')
+
+	stream = MetricsStream()
+	started = time.time()
+	for line in lines:
+		stream.add(json.loads(line))
+	ingest = time.time() - started
+	stream.persist(metrics_dir)
+
+	started = time.time()
+	reparsed = reparse(log_path)
+	reparse_time = time.time() - started
+
+	started = time.time()
+	loaded = MetricsStream.load(metrics_dir).summary()
+	load_time = time.time() - started
+
+	assert loaded == reparsed
+
+	print('{0} events, {1} nodes, {2} h'.format(len(lines), NODES, HOURS))
+	print('streaming ingest:        {0:8.0f} events/s'.format(len(lines) / ingest))
+	print('re-parse log + summary:  {0:8.2f} s ({1} kB of JSON)'.format(reparse_time, os.path.getsize(log_path) // 1024))
+	print('load columns + summary:  {0:8.2f} s ({1} kB of columns)'.format(load_time, size(metrics_dir) // 1024))
+
+	shutil.rmtree(directory)
+
+if __name__ == '__main__':
+	main()
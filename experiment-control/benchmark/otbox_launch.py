@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from otbox_startup import OTBoxStartup
+from otbox_provision import OTBoxProvisioner
+from command_executor import CommandExecutor
+from fake_frontend import FakeFrontend, FakeTestbed
+
+# Measures otbox.py bring-up time on booted nodes against a local fake frontend:
+# with a single worker it grows as nodes x hop latency, with the default pool it stays close to one hop.
+
+SCALES       = [2, 10, 50]
+HOP_LATENCY  = 0.3
+
+
+class NullPublisher:
+
+	def publish(self, topic, message):
+		pass
+
+
+class BenchStartup(OTBoxStartup):
+
+	# Skips the reservation lookup and the provisioning done by OTBoxStartup.__init__, as on a provisioned frontend
+	def __init__(self, ssh_pool, nodes, concurrency):
+		self.ssh_pool           = ssh_pool
+		self.executor           = CommandExecutor(ssh_pool)
+		self.socketIoHandler    = NullPublisher()
+		self.nodes              = nodes
+		self.booted_nodes       = nodes
+		self.provisioner        = OTBoxProvisioner(self.executor)
+		self.provisioner.bundle_ready = True
+		self.bundle             = None
+		self.active_nodes       = []
+		self.launch_results     = []
+		self.LAUNCH_CONCURRENCY = concurrency
+
+	def boot_wait(self):
+		pass
+
+
+def run(scale, concurrency):
+	nodes = ['a8-{0}.saclay.iot-lab.info'.format(i) for i in range(scale)]
+	delays = dict(('node-a8-{0}'.format(i), 0) for i in range(scale))
+
+	frontend = FakeFrontend(FakeTestbed(delays, HOP_LATENCY).handle).start()
+	ssh_pool = frontend.pool()
+
+	startup = BenchStartup(ssh_pool, nodes, concurrency)
+	started = time.time()
+	startup.start()
+	elapsed = time.time() - started
+
+	ssh_pool.close()
+	frontend.stop()
+
+	assert len(startup.active_nodes) == scale
+	return elapsed, max(result['elapsed'] for result in startup.launch_results)
+
+def main():
+	rows = []
+	for scale in SCALES:
+		seq_time, seq_slowest = run(scale, 1)
+		par_time, par_slowest = run(scale, OTBoxStartup.LAUNCH_CONCURRENCY)
+		rows.append((scale, seq_time, par_time, par_slowest))
+
+	print('{0:>6} {1:>14} {2:>14} {3:>18}'.format('nodes', 'sequential (s)', 'parallel (s)', 'slowest node (s)'))
+	for row in rows:
+		print('{0:>6} {1:>14.2f} {2:>14.2f} {3:>18.2f}'.format(*row))
+
+if __name__ == '__main__':
+	main()
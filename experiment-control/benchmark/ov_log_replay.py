@@ -0,0 +1,268 @@
+import os
+import sys
+import argparse
+import glob
+import itertools
+import json
+import logging
+import logging.handlers
+import random
+import shutil
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from watchdog.observers import Observer
+
+from experiment import Experiment
+from log_batcher import LogBatcher
+from metrics_stream import JOIN_EVENTS
+from ov_log_monitor import MyHandler
+from fake_relay import FakeRelay
+
+# Replays OpenVisualizer event logs, recorded (networkEvent.log and its rotations) or generated for a number of nodes
+# at a line rate, to load the log monitor without motes:
+#   generate - writes a synthetic log, deterministic for a given seed
+#   replay   - writes the lines into a watched directory at their recorded pace, accelerated by --speed (0: as fast
+#              as possible). With --dir the lines go to that directory, e.g. the log directory of a running experiment,
+#              otherwise to a temporary one followed by an in-process monitor (observer + MyHandler) that is measured
+#   direct   - feeds the lines straight into MyHandler, parsing, metrics, batching and publishing, without the files
+#   sweep    - replays generated logs at increasing rates until the monitor drops records or falls behind
+# Lines are paced on the _timestamp of their records, relative to the first one, so that a recorded incident is
+# reproduced with its bursts. The UI relay is a FakeRelay, --emit-cost emulates its round trip.
+
+LOG_NAME      = 'networkEvent.log'
+START         = 1500000000.0 # _timestamp of the first generated record
+SLOT          = 0.01         # s, one ASN
+DELIVERY      = 0.95         # probability for a generated packet to be received
+MEASURE_EVERY = 10           # packets of a node between two duty cycle / clock drift measurements
+BURST         = 0.005        # s, lines due within it are written together, as OpenVisualizer does per serial frame
+BACKUP_COUNT  = 5
+MAX_LAG       = 1.0          # s after the last line within which the monitor must have parsed everything
+SETTLE        = 0.2          # s without progress after which the monitor is considered done
+SWEEP_RATES   = [250, 500, 1000, 2000, 4000, 8000, 16000]
+
+
+def node_events(nodes, rng):
+	for node in range(nodes):
+		for event in JOIN_EVENTS:
+			yield node, {'event': event}
+
+	for packet in itertools.count():
+		for node in range(nodes):
+			source = 'bbbb::{0:x}'.format(node + 2)
+			token = [node & 0xff, node >> 8 & 0xff, packet & 0xff, packet >> 8 & 0xff]
+			yield node, {'event': 'packetSent', 'packetToken': token, 'source': source, 'destination': 'bbbb::1', 'hopLimit': 255}
+			if rng.random() < DELIVERY:
+				yield node, {'event': 'packetReceived', 'packetToken': token, 'source': source, 'destination': 'bbbb::1', 'hopLimit': 255 - rng.randint(1, 4), 'delay': rng.randint(20, 400)}
+			if packet % MEASURE_EVERY == 0:
+				yield node, {'event': 'radioDutyCycleMeasurement', 'dutyCycle': rng.uniform(0.5, 2.0), 'source': source}
+				yield node, {'event': 'clockDriftMeasurement', 'clockDrift': rng.uniform(-200, 200), 'source': source}
+
+# (offset, line) of a log of nodes motes written at rate lines/s for duration s, header line first
+def generate(nodes, rate, duration, seed=1):
+	rng = random.Random(seed)
+	yield 0.0, json.dumps({'date': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(START)), 'experimentId': 'replay', 'testbed': 'iotlab', 'firmware': 'openwsn', 'nodes': ['emulated{0}'.format(node + 1) for node in range(nodes)], 'scenario': 'demo-scenario'})
+
+	for n, (node, body) in enumerate(itertools.islice(node_events(nodes, rng), int(rate * duration))):
+		offset = n / float(rate)
+		event = body.pop('event')
+		record = {'_type': 'openbenchmark.' + event, '_mote_info': {'serial': 'emulated{0}'.format(node + 1)}, '_timestamp': START + offset}
+		record['timestamp'] = int(offset / SLOT) + body.pop('delay', 0)
+		record.update(body)
+		yield offset, json.dumps(record)
+
+# networkEvent.log.5 ... networkEvent.log.1, networkEvent.log: the files of a rotated log, oldest first
+def log_files(path):
+	if os.path.isdir(path):
+		path = os.path.join(path, LOG_NAME)
+	rotated = [name for name in glob.glob(path + '.*') if name.rsplit('.', 1)[1].isdigit()]
+	rotated.sort(key=lambda name: -int(name.rsplit('.', 1)[1]))
+	return rotated + ([path] if os.path.exists(path) else [])
+
+# (offset, line) of recorded logs, offsets from the _timestamp of their records (lines without one keep the previous)
+def load(paths, skip=0.0):
+	first = None
+	offset = 0.0
+	for path in paths:
+		with open(path) as f:
+			for line in f:
+				line = line.rstrip('\n')
+				try:
+					timestamp = float(json.loads(line)['_timestamp'])
+					if first is None:
+						first = timestamp
+					offset = max(offset, timestamp - first)
+				except (ValueError, KeyError, TypeError):
+					pass
+				if offset >= skip:
+					yield offset - skip, line
+
+# Yields the lines when they are due, speed times faster than recorded (0: without waiting)
+def pace(lines, speed):
+	started = time.time()
+	for offset, line in lines:
+		if speed:
+			wait = started + offset / speed - time.time()
+			if wait > BURST:
+				time.sleep(wait)
+		yield line
+
+def write(lines, log_dir, speed=1.0, max_bytes=0):
+	logger = logging.getLogger('replay-{0}'.format(time.time()))
+	logger.propagate = False
+	handler = logging.handlers.RotatingFileHandler(os.path.join(log_dir, LOG_NAME), maxBytes=max_bytes, backupCount=BACKUP_COUNT)
+	logger.addHandler(handler)
+	logger.setLevel(logging.INFO)
+
+	written = 0
+	for line in pace(lines, speed):
+		logger.info(line)
+		written += 1
+
+	handler.close()
+	return written
+
+def cpu_time():
+	times = os.times()
+	return times[0] + times[1]
+
+def records(lines):
+	# Lines the monitor is expected to publish
+	count = 0
+	for offset, line in lines:
+		try:
+			float(json.loads(line)['_timestamp'])
+			count += 1
+		except (ValueError, KeyError, TypeError):
+			pass
+	return count
+
+# Waits for the batcher to have received expected records or to stop progressing, returns the time waited
+def settle(batcher, expected):
+	started = time.time()
+	received, changed = -1, time.time()
+	while batcher.stats['received'] < expected:
+		if batcher.stats['received'] != received:
+			received, changed = batcher.stats['received'], time.time()
+		elif time.time() - changed > SETTLE:
+			break
+		time.sleep(0.01)
+	return time.time() - started
+
+def measure(lines, speed, direct, policy, emit_cost, max_bytes=0):
+	lines = list(lines)
+	expected = records(lines)
+	relay = FakeRelay(emit_cost).install()
+	handler = MyHandler(Experiment('replay'), policy)
+	cpu = cpu_time()
+
+	if direct:
+		started = time.time()
+		for line in pace(lines, speed):
+			handler.on_record(line)
+		duration = time.time() - started
+		lag = 0.0
+	else:
+		log_dir = tempfile.mkdtemp()
+		observer = Observer()
+		observer.schedule(handler, path=log_dir, recursive=False)
+		observer.start()
+		started = time.time()
+		write(lines, log_dir, speed, max_bytes)
+		duration = time.time() - started
+		lag = settle(handler.batcher, expected)
+		observer.stop()
+		observer.join()
+		shutil.rmtree(log_dir)
+
+	handler.batcher.close()
+	stats = handler.batcher.stats
+	return {
+		'lines'     : len(lines),
+		'expected'  : expected,
+		'received'  : stats['received'],
+		'published' : relay.records,
+		'dropped'   : stats['dropped'] + stats['coalesced'],
+		'duration'  : duration,
+		'rate'      : len(lines) / duration if duration else 0,
+		'lag'       : lag,
+		'cpu'       : cpu_time() - cpu
+	}
+
+def falls_behind(result):
+	return result['received'] < result['expected'] or result['dropped'] > 0 or result['lag'] > MAX_LAG
+
+HEADER = '{0:>9} {1:>10} {2:>9} {3:>9} {4:>10} {5:>8} {6:>7} {7:>8}'
+ROW    = '{target:>9} {rate:>10.0f} {expected:>9} {received:>9} {published:>10} {dropped:>8} {lag:>7.2f} {cpu:>8.2f}'
+
+def print_result(result, target='-'):
+	print(ROW.format(target=target, **result))
+
+def source(args):
+	if args.logs:
+		return list(load([name for path in args.logs for name in log_files(path)], args.skip))
+	return list(generate(args.nodes, args.rate, args.duration, args.seed))
+
+def main():
+	parser = argparse.ArgumentParser()
+	commands = parser.add_subparsers(dest='command')
+
+	generator = argparse.ArgumentParser(add_help=False)
+	generator.add_argument('--nodes', type=int, default=50)
+	generator.add_argument('--rate', type=float, default=1000, help='lines/s of the generated log')
+	generator.add_argument('--duration', type=float, default=10, help='s of the generated log')
+	generator.add_argument('--seed', type=int, default=1)
+
+	monitor = argparse.ArgumentParser(add_help=False)
+	monitor.add_argument('logs', nargs='*', help='recorded logs or log directories, a generated log if none')
+	monitor.add_argument('--skip', type=float, default=0.0, help='s of the recorded logs to skip')
+	monitor.add_argument('--speed', type=float, default=1.0, help='speed-up of the replay, 0: as fast as possible')
+	monitor.add_argument('--policy', default=LogBatcher.COALESCE, choices=LogBatcher.POLICIES)
+	monitor.add_argument('--emit-cost', type=float, default=0.0, help='s per emit to the relay')
+
+	generate_command = commands.add_parser('generate', parents=[generator])
+	generate_command.add_argument('output')
+
+	replay_command = commands.add_parser('replay', parents=[generator, monitor])
+	replay_command.add_argument('--dir', help='directory to write to, measured in-process if not given')
+	replay_command.add_argument('--max-bytes', type=int, default=0, help='rotation size of the written log')
+
+	commands.add_parser('direct', parents=[generator, monitor])
+
+	sweep_command = commands.add_parser('sweep', parents=[generator, monitor])
+	sweep_command.add_argument('--rates', default=','.join(str(rate) for rate in SWEEP_RATES))
+	sweep_command.add_argument('--direct', action='store_true')
+
+	args = parser.parse_args()
+
+	if args.command == 'generate':
+		with open(args.output, 'w') as f:
+			for offset, line in generate(args.nodes, args.rate, args.duration, args.seed):
+				f.write(line + '\n')
+
+	elif args.command == 'replay' and args.dir:
+		started = time.time()
+		written = write(source(args), args.dir, args.speed, args.max_bytes)
+		print('{0} lines written to {1} in {2:.1f} s'.format(written, args.dir, time.time() - started))
+
+	elif args.command in ['replay', 'direct']:
+		print(HEADER.format('target', 'lines/s', 'records', 'parsed', 'published', 'dropped', 'lag (s)', 'cpu (s)'))
+		print_result(measure(source(args), args.speed, args.command == 'direct', args.policy, args.emit_cost, getattr(args, 'max_bytes', 0)))
+
+	else:
+		print(HEADER.format('target', 'lines/s', 'records', 'parsed', 'published', 'dropped', 'lag (s)', 'cpu (s)'))
+		last = None
+		for rate in [float(rate) for rate in args.rates.split(',')]:
+			result = measure(generate(args.nodes, rate, args.duration, args.seed), 1.0, args.direct, args.policy, args.emit_cost)
+			print_result(result, int(rate))
+			if falls_behind(result):
+				print('The monitor drops records or falls behind between {0} and {1:.0f} lines/s'.format(last or 0, rate))
+				break
+			last = int(rate)
+		else:
+			print('The monitor keeps up with {0} lines/s'.format(last))
+
+if __name__ == '__main__':
+	main()
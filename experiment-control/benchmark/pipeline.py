@@ -0,0 +1,221 @@
+import os
+import sys
+import argparse
+import json
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import experiment
+from experiment import Experiment
+from firmware_store import FirmwareStore
+from log_batcher import LogBatcher
+from otbox_flash import OTBoxFlash
+from otbox_startup import OTBoxStartup
+from ov_log_monitor import OVLogMonitor
+from reservation import Reservation
+from ssh_pool import SshPool
+from fake_frontend import FakeFrontend, FakeTestbed
+from fake_iotlab import FakeIotlabCli
+from fake_otbox import FakeBox, FakeMote
+from fake_relay import FakeRelay
+from inproc_broker import InProcessBroker
+
+# End-to-end benchmark of the experiment pipeline against local stand-ins, no IoT-LAB access needed:
+#   reserve - Reservation, submit and wait for Running, through a paramiko fake frontend emulating iotlab-experiment
+#   otbox   - OTBoxStartup, boot probing and otbox.py launch through per-node hops (latency, boot delays, failures)
+#   flash   - OTBoxFlash in tracked mode, box discovery and programming of one emulated mote per node on an
+#             in-process MQTT broker
+#   monitor - OVLogMonitor following the OV logs of a fake OpenVisualizer, RECORDS records per node
+# UI events go to a fake Socket.IO relay. Every (stage, scale) runs in its own process, so that the reported peak
+# memory (max RSS) is that of the stage alone. events/s counts the events reaching the relay (log records for the
+# monitor) over the wall time of the stage.
+
+SCALES   = [2, 50, 500]
+STAGES   = ['reserve', 'otbox', 'flash', 'monitor']
+USER     = 'bench'
+TESTBED  = 'bench'
+FIRMWARE = os.path.join(os.path.dirname(__file__), '..', 'firmware', '03oos_openwsn_prog')
+
+
+def hosts(scale):
+	return ['a8-{0}.saclay.iot-lab.info'.format(i + 1) for i in range(scale)]
+
+def free_port():
+	probe = socket.socket()
+	probe.bind(('localhost', 0))
+	port = probe.getsockname()[1]
+	probe.close()
+	return port
+
+def frontend_handler(cli, testbed, latency):
+	def handle(command):
+		time.sleep(latency)
+		if command.startswith('iotlab-experiment'):
+			return cli.handle(command)
+		return testbed.handle(command)
+	return handle
+
+
+def reserve(scale, args, run):
+	cli = FakeIotlabCli(hosts(scale), [('Waiting', args.wait), ('Launching', args.launch), ('Running', 0)], submitted=False)
+	frontend = FakeFrontend(frontend_handler(cli, FakeTestbed({}), args.frontend_latency)).start()
+	try:
+		reservation = Reservation(USER, frontend.host, frontend.pool(), run)
+		started = time.time()
+		reservation.reserve_experiment(run.duration, 'saclay,a8,1-{0}'.format(scale))
+		reserved = reservation.get_reserved_nodes(True)
+		return time.time() - started, len(reserved)
+	finally:
+		frontend.stop()
+
+def otbox(scale, args, run):
+	random.seed(scale)
+	delays = dict(('node-' + host.split('.')[0], random.uniform(0, args.max_boot)) for host in hosts(scale))
+	testbed = FakeTestbed(delays, args.hop_latency, args.failure_rate)
+	frontend = FakeFrontend(frontend_handler(FakeIotlabCli(hosts(scale)), testbed, args.frontend_latency)).start()
+	try:
+		# What OTBoxStartup gets from SshPool.get(user, domain)
+		SshPool.pools[(USER, frontend.host, 22)] = frontend.pool()
+		startup = OTBoxStartup(USER, frontend.host, TESTBED, hosts(scale), run)
+		testbed.started_at = started = time.time()
+		startup.start()
+		return time.time() - started, len(startup.active_nodes)
+	finally:
+		frontend.stop()
+
+def flash(scale, args, run):
+	broker = InProcessBroker()
+	fleet = []
+	for host in hosts(scale):
+		box_id = 'node-' + host.split('.')[0]
+		mote = FakeMote(broker.client('mote-' + box_id), TESTBED, 'eui64-' + box_id)
+		fleet.append(mote.start())
+		fleet.append(FakeBox(broker.client(box_id), TESTBED, box_id, [mote]).start())
+	run.update(reserved=hosts(scale))
+
+	store = FirmwareStore(os.path.join(run.run_dir, 'firmware-store')) # cold: the payloads are encoded by the run
+	flasher = OTBoxFlash(FIRMWARE, 'inproc', TESTBED, args.flash_mode, broker.client('bench-flash'), track=True, experiment=run, store=store)
+	flasher.RESEND_WINDOW = 1
+	started = time.time()
+	if not flasher.open():
+		return time.time() - started, 0
+	try:
+		flasher.devices = flasher.wait_for_boxes(scale, 60)
+		summary = flasher.flash()
+	finally:
+		flasher.close()
+	return time.time() - started, len(summary['flashed']) if summary else 0
+
+def log_records(scale, records):
+	for n in range(records // 2):
+		for i in range(scale):
+			mote = {'serial': 'emulated{0}'.format(i + 1)}
+			token = [i % 256, n % 256, 0, 0, 0]
+			yield {'_type': 'openbenchmark.packetSent', '_mote_info': mote, '_timestamp': time.time(), 'timestamp': n * 100, 'packetToken': token, 'source': mote['serial'], 'destination': 'emulated0', 'hopLimit': 255}
+			yield {'_type': 'openbenchmark.packetReceived', '_mote_info': {'serial': 'emulated0'}, '_timestamp': time.time(), 'timestamp': n * 100 + 7, 'packetToken': token, 'source': mote['serial'], 'destination': 'emulated0', 'hopLimit': 253}
+
+def monitor(scale, args, run):
+	ov = socket.socket() # stands in for the OpenVisualizer web server
+	ov.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	ov.bind(('localhost', run.ov_port))
+	ov.listen(5)
+	os.makedirs(run.log_dir)
+
+	monitor = OVLogMonitor(LogBatcher.COALESCE, run, args.idle_timeout)
+	thread = threading.Thread(target=monitor.start)
+	thread.start()
+	while not monitor.observer.is_alive():
+		time.sleep(0.01)
+
+	expected = scale * (args.records // 2 * 2)
+	started = time.time()
+	with open(os.path.join(run.log_dir, 'openbenchmark.log'), 'a') as f:
+		for n, record in enumerate(log_records(scale, args.records)):
+			f.write(json.dumps(record) + '\n')
+			if n % 100 == 99:
+				f.flush()
+
+	batcher = monitor.event_handler.batcher
+	deadline = time.time() + 120
+	while time.time() < deadline and batcher.stats['received'] < expected:
+		time.sleep(0.01)
+	while time.time() < deadline and batcher.pending:
+		time.sleep(0.01)
+	elapsed = time.time() - started
+
+	thread.join()
+	ov.close()
+	return elapsed, batcher.stats['published']
+
+def run_stage(stage, scale, args):
+	relay = FakeRelay(args.emit_cost).install()
+	directory = tempfile.mkdtemp()
+	experiment.EXPERIMENTS_DIR = directory
+	try:
+		run = Experiment.load('bench', ov_dir=os.path.join(directory, 'ov'), ov_port=free_port())
+		run.save()
+		elapsed, done = globals()[stage](scale, args, run)
+		records = relay.records
+	finally:
+		shutil.rmtree(directory)
+
+	return {
+		'stage'   : stage,
+		'nodes'   : scale,
+		'elapsed' : elapsed,
+		'done'    : done,
+		'events'  : records,
+		'rate'    : records / elapsed if elapsed else 0,
+		'peak_mb' : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+	}
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--scales', default=','.join(str(scale) for scale in SCALES))
+	parser.add_argument('--stages', default=','.join(STAGES))
+	parser.add_argument('--hop-latency', type=float, default=0.05, help='s per frontend -> node ssh hop')
+	parser.add_argument('--frontend-latency', type=float, default=0.01, help='s per command on the frontend')
+	parser.add_argument('--failure-rate', type=float, default=0.0, help='probability for a node hop to fail')
+	parser.add_argument('--max-boot', type=float, default=2.0, help='node boot delays are uniform in [0, max-boot] s')
+	parser.add_argument('--wait', type=float, default=1.0, help='s the experiment stays Waiting')
+	parser.add_argument('--launch', type=float, default=0.5, help='s the experiment stays Launching')
+	parser.add_argument('--flash-mode', default=OTBoxFlash.MODE_BLOB, choices=[OTBoxFlash.MODE_BLOB, OTBoxFlash.MODE_CHUNKED])
+	parser.add_argument('--records', type=int, default=20, help='log records per node for the monitor')
+	parser.add_argument('--idle-timeout', type=float, default=2.0)
+	parser.add_argument('--emit-cost', type=float, default=0.0, help='s per emit to the relay')
+	parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.child:
+		# One stage at one scale, the result on the last line of stdout
+		result = run_stage(args.stages, int(args.scales), args)
+		sys.stdout.write('\n' + json.dumps(result) + '\n')
+		sys.stdout.flush()
+		os._exit(0) # the stand-ins leave non-daemon threads behind
+
+	options = []
+	for name in ['hop_latency', 'frontend_latency', 'failure_rate', 'max_boot', 'wait', 'launch', 'flash_mode', 'records', 'idle_timeout', 'emit_cost']:
+		options += ['--' + name.replace('_', '-'), str(getattr(args, name))]
+	print('{0:>8} {1:>6} {2:>10} {3:>8} {4:>8} {5:>10} {6:>10}'.format('stage', 'nodes', 'wall (s)', 'done', 'events', 'events/s', 'peak (MB)'))
+	for stage in args.stages.split(','):
+		for scale in [int(scale) for scale in args.scales.split(',')]:
+			with open(os.devnull, 'w') as devnull:
+				output = subprocess.Popen([sys.executable, __file__, '--child', '--stages', stage, '--scales', str(scale)] + options, stdout=subprocess.PIPE, stderr=devnull).communicate()[0]
+			try:
+				result = json.loads(output.strip().splitlines()[-1])
+			except (ValueError, IndexError):
+				print('{0:>8} {1:>6} {2:>10}'.format(stage, scale, 'failed'))
+				continue
+			result['done'] = '{0}/{1}'.format(result['done'], scale if stage != 'monitor' else scale * (args.records // 2 * 2))
+			print('{stage:>8} {nodes:>6} {elapsed:>10.2f} {done:>8} {events:>8} {rate:>10.1f} {peak_mb:>10.1f}'.format(**result))
+
+if __name__ == '__main__':
+	main()
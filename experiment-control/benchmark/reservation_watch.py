@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from reservation_watcher import ReservationWatcher
+from fake_iotlab import FakeIotlabCli
+
+# Delay between the experiment reaching Running and the controller noticing it, with the former fixed 10 s polling
+# and with ReservationWatcher. Time is scaled down by SCALE so that a run takes seconds.
+
+SCALE      = 0.02
+RUNS       = 10
+FIXED_POLL = 10
+
+
+def timeline():
+	return [('Waiting', random.uniform(5, 40) * SCALE), ('Launching', random.uniform(30, 90) * SCALE), ('Running', 0)]
+
+def running_at(cli):
+	return cli.submitted_at + sum(duration for state, duration in cli.timeline[:-1])
+
+def fixed(cli):
+	while cli.state() != 'Running':
+		time.sleep(FIXED_POLL * SCALE)
+	return time.time()
+
+def watcher(cli):
+	watcher = ReservationWatcher(cli.state, lambda topic, message: None, 600, ReservationWatcher.POLL_MIN * SCALE, ReservationWatcher.POLL_MAX * SCALE)
+	watcher.watch()
+	return time.time()
+
+def main():
+	random.seed(1)
+	timelines = [timeline() for run in range(RUNS)]
+
+	for name, wait in [('fixed 10 s', fixed), ('backoff', watcher)]:
+		lags = []
+		for states in timelines:
+			cli = FakeIotlabCli([], states)
+			detected = wait(cli)
+			lags.append((detected - running_at(cli)) / SCALE)
+		print("{0:>12}: detection lag mean {1:5.1f} s, max {2:5.1f} s".format(name, sum(lags) / len(lags), max(lags)))
+
+if __name__ == '__main__':
+	main()
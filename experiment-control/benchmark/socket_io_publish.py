@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from socket_io_handler import SocketIoEmitter
+
+# Time spent in publish() by a caller (an SSH or MQTT worker) when the relay takes EMIT_COST per event,
+# with the former synchronous emit and with the buffered emitter. Also checks that publishing while the relay
+# is down neither fails nor blocks, and that the events are delivered once it is back.
+
+EVENTS    = 500
+EMIT_COST = 0.005 # s
+DOWNTIME  = 1     # s
+
+
+class FakeRelay:
+
+	def __init__(self, up_at=0):
+		self.up_at  = up_at
+		self.events = 0
+
+	def connect(self):
+		if time.time() < self.up_at:
+			raise IOError("Connection refused")
+		return self
+
+	def emit(self, topic, message):
+		time.sleep(EMIT_COST)
+		self.events += 1
+
+	def disconnect(self):
+		pass
+
+
+def synchronous():
+	relay = FakeRelay()
+	started = time.time()
+	for n in range(EVENTS):
+		relay.emit('CMD_OUTPUT', str(n))
+	return time.time() - started, time.time() - started, relay.events
+
+def buffered(downtime):
+	relay = FakeRelay(time.time() + downtime)
+	emitter = SocketIoEmitter(relay.connect, retry_min=0.1, retry_max=0.5)
+	started = time.time()
+	for n in range(EVENTS):
+		emitter.publish('CMD_OUTPUT', str(n))
+	held = time.time() - started
+	emitter.close(60)
+	return held, time.time() - started, relay.events
+
+def main():
+	print('{0:>22} {1:>14} {2:>14} {3:>10}'.format('publishing', 'caller (ms)', 'delivery (s)', 'delivered'))
+	for name, run in [('synchronous', synchronous), ('buffered', lambda: buffered(0)), ('buffered, relay down', lambda: buffered(DOWNTIME))]:
+		held, total, delivered = run()
+		print('{0:>22} {1:>14.1f} {2:>14.2f} {3:>10}'.format(name, held * 1000, total, delivered))
+
+if __name__ == '__main__':
+	main()
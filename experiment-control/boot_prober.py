@@ -0,0 +1,95 @@
+import Queue
+import threading
+import time
+
+from node_inventory import box_id
+from tracer import span, propagate
+
+class BootProber:
+
+	CONCURRENCY     = 32   # max number of nodes probed at the same time
+	DEADLINE        = 600  # global time budget (s) for all the nodes to boot
+	RETRY_PAUSE     =   6
+	QUEUE_POLL      = 0.2
+
+	def __init__(self, probe, publish, concurrency=CONCURRENCY, deadline=DEADLINE, retry_pause=RETRY_PAUSE):
+		self.probe           = probe    # probe(node_name) -> True if the node answered
+		self.publish         = publish  # publish(topic, message)
+		self.concurrency     = max(1, concurrency)
+		self.deadline        = deadline
+		self.retry_pause     = retry_pause
+
+		self.lock            = threading.Lock()
+
+	def node_name(self, node):
+		return box_id(node)
+
+	def run(self, nodes):
+		self.queue           = Queue.Queue()
+		self.unresolved      = len(nodes)
+		self.booted          = set()
+		self.num_of_retries  = int(self.deadline / self.retry_pause)
+		self.deadline_at     = time.time() + self.deadline
+
+		for node in nodes:
+			self.queue.put((node, 0, 0.0))
+
+		workers = []
+		target = propagate(self.worker)
+		for i in range(min(self.concurrency, len(nodes))):
+			worker = threading.Thread(target=target)
+			worker.daemon = True
+			worker.start()
+			workers.append(worker)
+
+		for worker in workers:
+			worker.join()
+
+		return [node for node in nodes if node in self.booted]
+
+	def worker(self):
+		while True:
+			with self.lock:
+				if self.unresolved == 0:
+					return
+			try:
+				node, retries, not_before = self.queue.get(timeout=self.QUEUE_POLL)
+			except Queue.Empty:
+				continue
+
+			# Retries are re-queued in the order they failed, so the head of the queue is always the next one due
+			wait = min(not_before, self.deadline_at) - time.time()
+			if wait > 0:
+				time.sleep(wait)
+
+			self.probe_node(node, retries)
+
+	def probe_node(self, node, retries):
+		node_name = self.node_name(node)
+		if retries == 0:
+			print("Probing node: " + node_name)
+
+		with span('boot.probe', node=node_name, attempt=retries) as traced:
+			try:
+				booted = self.probe(node_name)
+			except Exception, e:
+				print("Error probing " + node_name + ": " + str(e))
+				booted = False
+			traced.set(booted=booted)
+
+		if booted:
+			self.publish('NODE_BOOTED', node_name)
+			self.resolve(node, True)
+		elif time.time() + self.retry_pause < self.deadline_at:
+			print("Node " + node_name + ": retrying")
+			self.publish('BOOT_RETRY', node_name + ": " + str(retries) + "/" + str(self.num_of_retries))
+			self.queue.put((node, retries + 1, time.time() + self.retry_pause))
+		else:
+			self.publish('BOOT_FAIL', node_name)
+			self.resolve(node, False)
+
+	def resolve(self, node, booted):
+		with self.lock:
+			if booted:
+				self.booted.add(node)
+			self.unresolved -= 1
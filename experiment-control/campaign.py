@@ -0,0 +1,280 @@
+import itertools
+import json
+import math
+import os
+import threading
+import time
+
+from experiment import Experiment
+from orchestrator import Orchestrator
+from tracer import span
+
+# A campaign runs the experiments of a sweep one after the other, unattended. Its definition gives the run options
+# to sweep and those common to all the runs, e.g.
+#   {"name": "tsch", "sweep": {"firmware": ["a", "b"], "nodes": ["saclay,a8,106+107", "saclay,a8,1-10"],
+#    "duration": [30, 60]}, "options": {"site": "saclay", "log_policy": "coalesce"}, "repeat": 2}
+# Every combination of the swept values is one run, the whole sweep being queued `repeat` times. The values are
+# checked as those of the command line would be, so that a typo fails the campaign before its first run. A run is an
+# experiment run of its own, exp_id <name>-<n>, whose run directory gets result.json (options, outcome, stage
+# timings, metrics summary) next to its state, metrics and archived logs.
+# The queue is saved in CAMPAIGNS_DIR/<name>.json as the runs progress, so that a campaign started again resumes
+# with the runs that are not over, reusing the IoT-LAB experiments they may have submitted (see Reservation).
+# Runs are pipelined: as soon as run k collects data (monitor stage), run k+1 is reserved and its nodes booted and
+# provisioned (PREPARE_STAGES), and the IoT-LAB experiment of run k is stopped once its monitoring ends, which frees
+# the nodes that run k+1 may be waiting for. Run k+1 then only starts otbox.py, flashes and starts OpenVisualizer
+# before collecting in turn. If its preparation failed (e.g. still waiting for nodes), it runs all the stages.
+# When the two runs use different nodes, the IoT-LAB experiment of run k+1 is Running while run k still collects:
+# it is submitted for its duration plus that of run k and RESERVE_MARGIN, and stopped once its monitoring ends.
+# The opentestbed tree in the A8 directory of the frontend, which otbox.py of run k runs from, is only updated by the
+# preparation of a run while no other run is active (see OTBoxProvisioner), i.e. before the first one.
+
+CAMPAIGNS_DIR = os.path.join(os.path.dirname(__file__), 'campaigns')
+
+
+class Campaign:
+
+	QUEUED      = 'queued'
+	PREPARING   = 'preparing'
+	RUNNING     = 'running'
+	DONE        = 'done'
+	FAILED      = 'failed'
+
+	OPTIONS     = ['firmware', 'nodes', 'duration', 'site', 'channel', 'testbed', 'flash_mode', 'log_policy', 'idle_timeout']
+	RESULT_FILE = 'result.json'
+
+	def __init__(self, definition, runs):
+		self.definition = definition
+		self.name       = definition['name']
+		self.runs       = runs # [{'exp_id', 'options', 'state', ...}] in the order they run
+		self.lock       = threading.Lock()
+
+	# Options of every run of the definition
+	@classmethod
+	def expand(cls, definition):
+		sweep  = definition.get('sweep', {})
+		common = definition.get('options', {})
+		unknown = sorted(key for key in list(sweep) + list(common) if key not in cls.OPTIONS)
+		if unknown:
+			raise ValueError("Unknown run options: " + ', '.join(unknown))
+
+		single = sorted(key for key, values in sweep.items() if not isinstance(values, list))
+		if single:
+			raise ValueError("Swept options need a list of values: " + ', '.join(single))
+
+		keys = [key for key in cls.OPTIONS if key in sweep]
+		combinations = [dict(zip(keys, values)) for values in itertools.product(*[sweep[key] for key in keys])]
+		runs = [dict(common, **combination) for _ in range(definition.get('repeat', 1)) for combination in combinations]
+
+		invalid = sorted(set(key + '=' + json.dumps(value) for options in runs for key, value in options.items() if not cls.valid(key, value)))
+		if invalid:
+			raise ValueError("Invalid run options: " + ', '.join(invalid))
+		return runs
+
+	# Whether value is one the command line accepts for the option (see main.py)
+	@classmethod
+	def valid(cls, key, value):
+		from log_batcher import LogBatcher
+		from otbox_flash import OTBoxFlash
+		if key == 'log_policy':
+			return value in LogBatcher.POLICIES
+		if key == 'flash_mode':
+			return value in [OTBoxFlash.MODE_BLOB, OTBoxFlash.MODE_CHUNKED]
+		if key == 'duration':
+			return isinstance(value, (int, long)) and not isinstance(value, bool) and value > 0 # min
+		if key == 'idle_timeout':
+			return value is None or (isinstance(value, (int, long, float)) and not isinstance(value, bool) and value > 0)
+		return True
+
+	# The campaign of the definition, resumed if it was started before
+	@classmethod
+	def create(cls, definition):
+		campaign = cls.load(definition['name'])
+		if campaign is not None:
+			if campaign.definition != definition:
+				raise ValueError("Campaign " + campaign.name + " was started with another definition")
+			return campaign.resume()
+
+		runs = [{'exp_id': '{0}-{1:03d}'.format(definition['name'], n + 1), 'options': options, 'state': cls.QUEUED}
+			for n, options in enumerate(cls.expand(definition))]
+		campaign = cls(definition, runs)
+		campaign.save()
+		return campaign
+
+	@classmethod
+	def load(cls, name):
+		path = os.path.join(CAMPAIGNS_DIR, name + '.json')
+		if not os.path.exists(path):
+			return None
+		with open(path) as f:
+			saved = json.load(f)
+		return cls(saved['definition'], saved['runs'])
+
+	@property
+	def path(self):
+		return os.path.join(CAMPAIGNS_DIR, self.name + '.json')
+
+	# Runs interrupted while preparing or running are queued again, done and failed ones are kept
+	def resume(self):
+		for run in self.runs:
+			if run['state'] in (self.PREPARING, self.RUNNING):
+				run['state'] = self.QUEUED
+		self.save()
+		return self
+
+	def write(self):
+		if not os.path.exists(CAMPAIGNS_DIR):
+			os.makedirs(CAMPAIGNS_DIR)
+		with open(self.path + '.tmp', 'w') as f:
+			json.dump({'definition': self.definition, 'runs': self.runs}, f, indent=4)
+		os.rename(self.path + '.tmp', self.path)
+
+	def save(self):
+		with self.lock:
+			self.write()
+
+	# Runs are updated by the run being executed and the one being prepared
+	def update(self, run, **values):
+		with self.lock:
+			run.update(values)
+			self.write()
+
+	def next_run(self):
+		for run in self.runs:
+			if run['state'] == self.QUEUED:
+				return run
+		return None
+
+	def experiment(self, run):
+		options = run['options']
+		experiment = Experiment.load(run['exp_id'], site=options.get('site'), nodes=options.get('nodes'), duration=options.get('duration'), channel=options.get('channel'))
+		experiment.save()
+		return experiment
+
+	def record(self, run, experiment, result):
+		path = os.path.join(experiment.run_dir, self.RESULT_FILE)
+		with open(path + '.tmp', 'w') as f:
+			json.dump(dict(result, campaign=self.name, exp_id=run['exp_id'], options=run['options']), f, indent=4, sort_keys=True)
+		os.rename(path + '.tmp', path)
+
+
+# The next run of the campaign and its preparation, running on its own thread
+class Preparation:
+
+	def __init__(self, run, experiment, steps, publish):
+		self.run        = run
+		self.experiment = experiment
+		self.steps      = steps
+		self.publish    = publish
+		self.prepared   = False
+		self.timings    = []
+		self.thread     = None
+
+
+class CampaignScheduler:
+
+	PREPARE_STAGES = [Orchestrator.RESERVE, Orchestrator.BOOT]
+	RUN_STAGES     = [Orchestrator.OTBOX, Orchestrator.FLASH, Orchestrator.OV_START, Orchestrator.MONITOR]
+	RESERVE_MARGIN = 300 # s of waiting for, and holding, the nodes of the next run beyond the duration of the current one
+
+	def __init__(self, campaign, steps_for, publish_for, pipeline=True):
+		self.campaign    = campaign
+		self.steps_for   = steps_for   # steps_for(experiment, options) -> steps of the run (see ExperimentSteps)
+		self.publish_for = publish_for # publish_for(experiment) -> publish(topic, message) of the run
+		self.pipeline    = pipeline    # False: a run is prepared once the previous one is over
+
+	# Runs the queued runs, returns {'runs', 'done', 'failed', 'elapsed', 'gaps'}, gaps: s without data collection
+	# between consecutive runs
+	def run(self):
+		started = time.time()
+		executed = []
+		preparation = self.prepare(self.campaign.next_run())
+		while preparation is not None:
+			following = []
+			self.execute(preparation, following)
+			executed.append(preparation.run)
+			preparation = following[0] if following else self.prepare(self.campaign.next_run())
+
+		gaps = [run['collecting'] - previous['ended'] for previous, run in zip(executed, executed[1:]) if run.get('collecting')]
+		summary = {
+			'runs'    : len(executed),
+			'done'    : len([run for run in executed if run['state'] == Campaign.DONE]),
+			'failed'  : len([run for run in executed if run['state'] == Campaign.FAILED]),
+			'elapsed' : time.time() - started,
+			'gaps'    : gaps
+		}
+		print("Campaign {0}: {1} runs done, {2} failed in {3:.1f} s".format(self.campaign.name, summary['done'], summary['failed'], summary['elapsed']))
+		return summary
+
+	# Starts preparing run on a thread. overlap: s the current run may still collect, for which the nodes of this one
+	# are waited for and held on top of its duration, None when no other run is active
+	def prepare(self, run, overlap=None):
+		if run is None:
+			return None
+		self.campaign.update(run, state=Campaign.PREPARING)
+		experiment = self.campaign.experiment(run)
+		preparation = Preparation(run, experiment, self.steps_for(experiment, run['options']), self.publish_for(experiment))
+		if overlap is not None:
+			preparation.steps.reserve_wait = overlap
+			preparation.steps.reserve_more = int(math.ceil(overlap / 60.0))
+			preparation.steps.update_tree  = False
+
+		def prepare_run():
+			# A failed preparation keeps what it reserved, the run tries again with all the stages
+			orchestrator = Orchestrator(preparation.steps, preparation.publish, self.PREPARE_STAGES, terminate=False)
+			with span('campaign.prepare', exp_id=run['exp_id']):
+				preparation.prepared = orchestrator.run()
+			preparation.timings = orchestrator.timings
+			self.campaign.update(run, iotlab_id=experiment.iotlab_id)
+
+		preparation.thread = threading.Thread(target=prepare_run)
+		preparation.thread.daemon = True
+		preparation.thread.start()
+		return preparation
+
+	# Runs the rest of the stages of a prepared run, and starts preparing the next one into following once it collects
+	def execute(self, preparation, following):
+		run = preparation.run
+		preparation.thread.join()
+		self.campaign.update(run, state=Campaign.RUNNING, started=time.time(), collecting=None)
+		failure = {}
+
+		def publish(topic, message):
+			preparation.publish(topic, message)
+			if topic == 'ORCHESTRATION_FAIL':
+				failure.update(message)
+			if topic == 'STAGE_COMPLETE' and message['stage'] == Orchestrator.RESERVE:
+				self.campaign.update(run, iotlab_id=preparation.experiment.iotlab_id)
+			if topic == 'STAGE_STARTED' and message == Orchestrator.MONITOR:
+				self.campaign.update(run, collecting=time.time())
+				if self.pipeline:
+					following.append(self.prepare(self.campaign.next_run(), preparation.experiment.duration * 60 + self.RESERVE_MARGIN))
+
+		stages = self.RUN_STAGES if preparation.prepared else Orchestrator.STAGES
+		orchestrator = Orchestrator(preparation.steps, publish, stages)
+		with span('campaign.run', exp_id=run['exp_id']):
+			success = orchestrator.run()
+
+		try:
+			preparation.steps.release()
+		except Exception, e:
+			print("Could not stop the IoT-LAB experiment of {0}: {1}".format(run['exp_id'], e))
+
+		timings = (preparation.timings if preparation.prepared else []) + orchestrator.timings
+		self.campaign.update(run, state=Campaign.DONE if success else Campaign.FAILED, ended=time.time(), error=failure.get('error'))
+		self.campaign.record(run, preparation.experiment, {
+			'success'   : success,
+			'failure'   : failure or None,
+			'iotlab_id' : run.get('iotlab_id'), # that of the run, terminated or released by now
+			'stages'    : [{'stage': stage, 'elapsed': elapsed} for stage, elapsed in timings],
+			'started'   : run['started'],
+			'ended'     : run['ended'],
+			'metrics'   : self.metrics(preparation.experiment)
+		})
+		print("Run {0} {1}".format(run['exp_id'], run['state']))
+
+	def metrics(self, experiment):
+		from metrics_stream import MetricsStream
+		try:
+			return MetricsStream.load(experiment.metrics_dir).summary()
+		except (IOError, OSError, ValueError, KeyError):
+			return None # no metrics, e.g. the run failed before collecting
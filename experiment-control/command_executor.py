@@ -0,0 +1,131 @@
+import select
+import time
+
+from tracer import span
+
+# Runs commands over an SshPool, reading stdout and stderr together as the command produces them,
+# so that neither stream can fill its window and block the other. Every command is bounded by its own
+# timeout and by the global deadline of the executor.
+
+class CommandResult:
+
+	def __init__(self, command, node_name=None):
+		self.command     = command
+		self.node_name   = node_name
+		self.output      = []
+		self.error       = []
+		self.exit_status = None
+		self.timed_out   = False
+		self.started     = time.time()
+		self.elapsed     = 0.0
+
+	def success(self):
+		return self.exit_status == 0 and not self.timed_out
+
+	def __repr__(self):
+		return "<CommandResult {0!r} exit={1} timed_out={2} elapsed={3:.2f}s>".format(self.command, self.exit_status, self.timed_out, self.elapsed)
+
+
+class CommandExecution:
+
+	POLL_INTERVAL = 0.1
+	RECV_SIZE     = 32768
+
+	def __init__(self, executor, command, node_name, timeout):
+		self.executor  = executor
+		self.node_name = node_name
+		self.result    = CommandResult(command, node_name)
+
+		ends_at = [self.result.started + timeout] if timeout is not None else []
+		if executor.deadline_at is not None:
+			ends_at.append(executor.deadline_at)
+		self.ends_at   = min(ends_at) if ends_at else None
+
+	# Yields (stream, line) tuples, stream being 'stdout' or 'stderr', as soon as each line is complete
+	def __iter__(self):
+		result = self.result
+		try:
+			if self.node_name is None:
+				stdin, stdout, stderr = self.executor.ssh_pool.exec_command(result.command)
+			else:
+				stdin, stdout, stderr = self.executor.ssh_pool.node_exec_command(self.node_name, result.command)
+			stdin.close()
+			channel = stdout.channel
+		except Exception, e:
+			result.error.append(str(e))
+			result.elapsed = time.time() - result.started
+			yield ('stderr', str(e))
+			return
+
+		buffers = {'stdout': '', 'stderr': ''}
+		try:
+			while True:
+				if self.ends_at is not None and time.time() >= self.ends_at:
+					result.timed_out = True
+					break
+
+				select.select([channel], [], [], self.POLL_INTERVAL)
+
+				received = False
+				if channel.recv_ready():
+					buffers['stdout'] += channel.recv(self.RECV_SIZE)
+					received = True
+				if channel.recv_stderr_ready():
+					buffers['stderr'] += channel.recv_stderr(self.RECV_SIZE)
+					received = True
+
+				for name in ('stdout', 'stderr'):
+					lines = buffers[name].split('\n')
+					buffers[name] = lines.pop()
+					for line in lines:
+						for item in self.emit(name, line):
+							yield item
+
+				if not received and channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+					result.exit_status = channel.recv_exit_status()
+					break
+		finally:
+			channel.close()
+
+		for name in ('stdout', 'stderr'):
+			if buffers[name] != '':
+				for item in self.emit(name, buffers[name]):
+					yield item
+
+		result.elapsed = time.time() - result.started
+
+	def emit(self, name, line):
+		line = line.rstrip('\r')
+		if name == 'stdout':
+			self.result.output.append(line)
+		else:
+			self.result.error.append(line)
+
+		self.executor.forward(self.node_name, name, line)
+		yield (name, line)
+
+
+class CommandExecutor:
+
+	COMMAND_TIMEOUT = 300
+	TRACED_LENGTH   = 80 # characters of the command kept in its span
+
+	def __init__(self, ssh_pool, publish=None, global_timeout=None):
+		self.ssh_pool    = ssh_pool
+		self.publish     = publish # optional publish(topic, message) used to stream the output to the UI
+		self.deadline_at = time.time() + global_timeout if global_timeout is not None else None
+
+	def stream(self, command, node_name=None, timeout=COMMAND_TIMEOUT):
+		return CommandExecution(self, command, node_name, timeout)
+
+	def run(self, command, node_name=None, timeout=COMMAND_TIMEOUT):
+		with span('ssh.exec', node=node_name, command=command[:self.TRACED_LENGTH]) as traced:
+			execution = self.stream(command, node_name, timeout)
+			for item in execution:
+				pass
+			traced.set(exit_status=execution.result.exit_status, timed_out=execution.result.timed_out)
+		return execution.result
+
+	def forward(self, node_name, name, line):
+		if self.publish is not None:
+			self.publish('CMD_OUTPUT', (node_name or self.ssh_pool.domain) + " [" + name + "]: " + line)
@@ -1,14 +1,54 @@
-from socket_io_handler import SocketIoHandler
+from experiment import Experiment
+import glob
+import os
 import subprocess
 import time
 
+# Ends one experiment run: stops the processes it spawned (see Experiment.terminate) and rotates its OpenVisualizer
+# logs. The logs are moved aside at once, so that the next run starts with empty ones, and compressed in the
+# background into experiments/<exp_id>/logs/<exp_id>-<date>.tar.gz. They are removed only once the archive is written.
+# The other runs of the host are left untouched.
+
 class ExpTerminate:
 
-	def __init__(self):
-		self.PYTHON_PROC_KILL = "sudo kill $(ps aux | grep '[p]ython' | awk '{print $2}')"
-		self.DELETE_LOGS = "rm ~/soda/openvisualizer/openvisualizer/build/runui/*.log; rm ~/soda/openvisualizer/openvisualizer/build/runui/*.log.*;"
+	LOG_PATTERNS = ['*.log', '*.log.*']
+
+	def __init__(self, experiment=None):
+		self.experiment = experiment if experiment is not None else Experiment.load()
 
+	# Returns the path of the log archive being written, None if there were no logs
 	def exp_terminate(self):
-		subprocess.Popen(self.PYTHON_PROC_KILL, shell=True)
-		time.sleep(3)
-		subprocess.Popen(self.DELETE_LOGS, shell=True)
\ No newline at end of file
+		running = self.experiment.terminate()
+		if running:
+			print("Could not stop processes " + ', '.join(str(process['pid']) for process in running))
+		return self.archive_logs()
+
+	def archive_logs(self):
+		log_dir = self.experiment.log_dir
+		logs = [path for pattern in self.LOG_PATTERNS for path in glob.glob(os.path.join(log_dir, pattern))]
+		if not logs:
+			return None
+
+		name = self.experiment.exp_id + '-' + time.strftime('%Y%m%d-%H%M%S')
+
+		# Renaming within the log directory is immediate, whatever the file system of the run directory
+		staging = os.path.join(log_dir, name)
+		os.makedirs(staging)
+		for path in logs:
+			try:
+				os.rename(path, os.path.join(staging, os.path.basename(path)))
+			except OSError, e:
+				print("Could not archive " + path + ": " + str(e))
+
+		archive_dir = os.path.join(self.experiment.run_dir, 'logs')
+		if not os.path.exists(archive_dir):
+			os.makedirs(archive_dir)
+		archive = os.path.join(archive_dir, name + '.tar.gz')
+
+		# In its own session, so that it completes even if the calling process exits right away (e.g. the monitor)
+		with open(os.devnull, 'w') as devnull:
+			subprocess.Popen(
+				['sh', '-c', 'tar czf "$1.tmp" -C "$2" . && mv "$1.tmp" "$1" && rm -r "$2"', 'archive', archive, staging],
+				stdout=devnull, stderr=devnull, close_fds=True, preexec_fn=os.setsid
+			)
+		return archive
@@ -0,0 +1,227 @@
+import contextlib
+import errno
+import fcntl
+import json
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from node_inventory import box_id
+
+# One experiment run on this host, with everything it must not share with the other runs:
+#   - its IoT-LAB experiment (iotlab_id), so that iotlab-experiment commands never act on another one
+#   - the processes it spawned, each in its own process group, which are the only ones terminated with it. Each is
+#     recorded with its start time, so that a pid reused by another process once it exited is never signalled
+#   - its OpenVisualizer tree and port, the OV logs being written to <ov_dir>/build/runui
+#   - its run directory experiments/<exp_id>/ (state, metrics, archived OV logs)
+#   - the Socket.IO channel its events are routed to by the relay, and the MQTT client id it connects with
+# The state is saved in the run directory, so that every main.py action of a run works on the same experiment.
+# Changes go through update(), which re-reads the state under a file lock, as several processes of a run share it.
+
+EXPERIMENTS_DIR = os.path.join(os.path.dirname(__file__), 'experiments')
+OV_DIR          = os.path.join(os.path.dirname(__file__), '..', 'openvisualizer')
+
+# Start time of pid in clock ticks after boot, None if there is no such process
+def process_start(pid):
+	try:
+		with open('/proc/{0}/stat'.format(pid)) as f:
+			stat = f.read()
+	except IOError:
+		return None
+	return int(stat[stat.rindex(')') + 2:].split()[19]) # field 22, after the command name that may hold spaces
+
+class Experiment:
+
+	DEFAULT_ID      = 'default'
+	DEFAULT_CHANNEL = '1'
+	SITE            = 'saclay'
+	NODES           = 'saclay,a8,106+107'
+	DURATION        = 30 # minutes
+	OV_PORT         = 8080
+	MQTT_CLIENT     = 'exp-auto'
+	STATE_FILE      = 'experiment.json'
+
+	TERM_TIMEOUT    = 5    # s for the processes to exit on SIGTERM before they are killed
+	KILL_TIMEOUT    = 2    # s for them to disappear after SIGKILL
+	EXIT_POLL       = 0.05 # s
+
+	FIELDS          = ['exp_id', 'site', 'nodes', 'duration', 'channel', 'ov_dir', 'ov_port', 'iotlab_id', 'reserved', 'processes']
+
+	def __init__(self, exp_id=DEFAULT_ID, site=SITE, nodes=NODES, duration=DURATION, channel=DEFAULT_CHANNEL, ov_dir=OV_DIR, ov_port=OV_PORT, iotlab_id=None, reserved=None, processes=None):
+		self.exp_id    = exp_id
+		self.site      = site
+		self.nodes     = nodes
+		self.duration  = duration
+		self.channel   = channel
+		self.ov_dir    = ov_dir
+		self.ov_port   = ov_port
+		self.iotlab_id = iotlab_id
+		self.reserved  = reserved or []  # hostnames of the reserved nodes
+		self.processes = processes or [] # [{'pid', 'group', 'started'}], group: the pid leads a process group of its own
+
+		self.lock         = threading.Lock()
+		self.on_terminate = [] # called before the processes of the run are signalled, e.g. to stop restarting them
+
+	# Saved state of exp_id if there is one, overridden by the given values that are not None
+	@classmethod
+	def load(cls, exp_id=DEFAULT_ID, **values):
+		state = {'exp_id': exp_id}
+		path = os.path.join(EXPERIMENTS_DIR, exp_id, cls.STATE_FILE)
+		if os.path.exists(path):
+			with open(path) as f:
+				state.update(json.load(f))
+
+		state.update((key, value) for key, value in values.items() if value is not None)
+		return cls(**dict((key, value) for key, value in state.items() if key in cls.FIELDS))
+
+	@contextlib.contextmanager
+	def locked(self):
+		if not os.path.exists(self.run_dir):
+			os.makedirs(self.run_dir)
+		with self.lock:
+			with open(os.path.join(self.run_dir, '.lock'), 'w') as lock_file:
+				fcntl.flock(lock_file, fcntl.LOCK_EX)
+				yield
+
+	def reload(self):
+		path = os.path.join(self.run_dir, self.STATE_FILE)
+		if os.path.exists(path):
+			with open(path) as f:
+				for key, value in json.load(f).items():
+					if key in self.FIELDS and key != 'exp_id':
+						setattr(self, key, value)
+
+	def write(self):
+		path = os.path.join(self.run_dir, self.STATE_FILE)
+		with open(path + '.tmp', 'w') as f:
+			json.dump(dict((field, getattr(self, field)) for field in self.FIELDS), f, indent=4)
+		os.rename(path + '.tmp', path)
+
+	# Saves this run with its current values (e.g. those given on the command line)
+	def save(self):
+		with self.locked():
+			self.write()
+
+	def update(self, **values):
+		with self.locked():
+			self.reload()
+			for key, value in values.items():
+				setattr(self, key, value)
+			self.write()
+
+	@property
+	def run_dir(self):
+		return os.path.join(EXPERIMENTS_DIR, self.exp_id)
+
+	@property
+	def log_dir(self):
+		return os.path.join(self.ov_dir, 'build', 'runui')
+
+	@property
+	def metrics_dir(self):
+		return os.path.join(self.run_dir, 'metrics')
+
+	@property
+	def domain(self):
+		return self.site + '.iot-lab.info'
+
+	@property
+	def mqtt_client_id(self):
+		return self.MQTT_CLIENT + '-' + self.exp_id
+
+	def box_ids(self):
+		return [box_id(host) for host in self.reserved]
+
+	def spawn(self, args, **kwargs):
+		process = subprocess.Popen(args, preexec_fn=os.setsid, **kwargs)
+		self.add_process(process.pid, True)
+		return process
+
+	# What identifies the process while it runs: its pid and its start time (started: None if it is gone)
+	@classmethod
+	def process_entry(cls, pid, group=False):
+		return {'pid': pid, 'group': group, 'started': process_start(pid)}
+
+	def add_process(self, pid, group=False):
+		with self.locked():
+			self.reload()
+			self.processes.append(self.process_entry(pid, group))
+			self.write()
+
+	# Whether the pid of process is still that of the process recorded. Once the leader of a group is gone, its pid
+	# is not reused while the group has members: the group is still the one recorded.
+	def owned(self, process):
+		started = process_start(process['pid'])
+		if started is None:
+			return process['group'] and process.get('started') is not None
+		return started == process.get('started')
+
+	def signal(self, sig, processes):
+		for process in processes:
+			if not self.owned(process):
+				continue # gone, its pid may be another process's by now
+			try:
+				if process['group']:
+					os.killpg(process['pid'], sig)
+				else:
+					os.kill(process['pid'], sig)
+			except OSError, e:
+				if e.errno == errno.EPERM and process_start(process['pid']) == process.get('started'):
+					# Started through sudo, e.g. OpenVisualizer, and the very process recorded
+					subprocess.call(['sudo', 'kill', '-' + str(sig), '--', ('-' if process['group'] else '') + str(process['pid'])])
+				elif e.errno == errno.EPERM:
+					print("Not signalling process " + str(process['pid']) + ": not ours, or it cannot be told apart from another one")
+				elif e.errno != errno.ESRCH:
+					raise
+
+	def alive(self, process):
+		try:
+			os.waitpid(process['pid'], os.WNOHANG) # reaps it if it is a child of this process
+		except OSError:
+			pass
+		if not self.owned(process):
+			return False
+		try:
+			if process['group']:
+				os.killpg(process['pid'], 0)
+			else:
+				os.kill(process['pid'], 0)
+		except OSError, e:
+			return e.errno == errno.EPERM # EPERM: it exists, owned by root
+		return True
+
+	# Waits until none of processes is left, returns those still running after timeout
+	def wait_exit(self, processes, timeout):
+		deadline = time.time() + timeout
+		running = [process for process in processes if self.alive(process)]
+		while running and time.time() < deadline:
+			time.sleep(self.EXIT_POLL)
+			running = [process for process in running if self.alive(process)]
+		return running
+
+	# SIGTERM to the processes of the run, SIGKILL to those still running after term_timeout.
+	# Returns as soon as they exited, with the processes that could not be stopped.
+	# The caller, which stops with the run, and the processes already gone are no longer recorded.
+	def terminate(self, term_timeout=TERM_TIMEOUT, kill_timeout=KILL_TIMEOUT):
+		with self.locked():
+			self.reload()
+			recorded = list(self.processes)
+			targets = [process for process in recorded if process['pid'] != os.getpid() and self.alive(process)]
+
+		for callback in self.on_terminate:
+			callback()
+		self.signal(signal.SIGTERM, targets)
+		running = self.wait_exit(targets, term_timeout)
+		if running:
+			print(str(len(running)) + " processes still running after SIGTERM, killing them")
+			self.signal(signal.SIGKILL, running)
+			running = self.wait_exit(running, kill_timeout)
+
+		with self.locked():
+			self.reload()
+			# Processes registered in the meantime are kept
+			self.processes = [process for process in self.processes if process['pid'] != os.getpid() and (process not in recorded or process in running)]
+			self.write()
+		return running
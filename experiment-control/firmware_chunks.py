@@ -0,0 +1,104 @@
+import binascii
+import hashlib
+import struct
+import zlib
+
+# Chunked firmware transfer format.
+#
+# An image is zlib-compressed and split into CHUNK_SIZE pieces. The manifest (JSON) announces the image:
+#   {'id': sha256 of the raw image, 'size', 'compression', 'compressed_size', 'chunk_size', 'chunks'}
+# Each chunk is a binary MQTT payload: a fixed header followed by the compressed bytes of that piece.
+#   header = 8 first bytes of the image id | sequence number | number of chunks | crc32 of the piece
+# A receiver that misses or rejects chunks asks for them again by sequence number, see FirmwareAssembler.missing().
+
+CHUNK_SIZE        = 16384
+COMPRESSION       = 'zlib'
+COMPRESSION_LEVEL = 9
+
+HEADER            = struct.Struct('!8sIII')
+
+
+class ChunkError(Exception):
+	pass
+
+
+def image_id(data):
+	return hashlib.sha256(data).hexdigest()
+
+def encode_firmware(data, chunk_size=CHUNK_SIZE):
+	compressed = zlib.compress(data, COMPRESSION_LEVEL)
+	fw_id      = image_id(data)
+	total      = (len(compressed) + chunk_size - 1) // chunk_size
+
+	manifest = {
+		'id'              : fw_id,
+		'size'            : len(data),
+		'compression'     : COMPRESSION,
+		'compressed_size' : len(compressed),
+		'chunk_size'      : chunk_size,
+		'chunks'          : total
+	}
+
+	chunks = []
+	for seq in range(total):
+		piece = compressed[seq * chunk_size:(seq + 1) * chunk_size]
+		chunks.append(encode_chunk(fw_id, seq, total, piece))
+
+	return manifest, chunks
+
+def encode_chunk(fw_id, seq, total, piece):
+	return HEADER.pack(fw_id_prefix(fw_id), seq, total, zlib.crc32(piece) & 0xffffffff) + piece
+
+def decode_chunk(payload):
+	if len(payload) < HEADER.size:
+		raise ChunkError("Chunk shorter than its header")
+
+	prefix, seq, total, crc = HEADER.unpack(payload[:HEADER.size])
+	piece = payload[HEADER.size:]
+
+	if zlib.crc32(piece) & 0xffffffff != crc:
+		raise ChunkError("Checksum mismatch in chunk {0}".format(seq))
+
+	return prefix, seq, total, piece
+
+def fw_id_prefix(fw_id):
+	return binascii.unhexlify(fw_id[:16])
+
+
+class FirmwareAssembler:
+
+	def __init__(self, manifest):
+		self.manifest = manifest
+		self.prefix   = fw_id_prefix(manifest['id'])
+		self.pieces   = {}
+		self.rejected = 0
+
+	# Returns True if the chunk was accepted, False if it is corrupted, foreign or a duplicate
+	def add(self, payload):
+		try:
+			prefix, seq, total, piece = decode_chunk(payload)
+		except ChunkError:
+			self.rejected += 1
+			return False
+
+		if prefix != self.prefix or total != self.manifest['chunks'] or seq >= total or seq in self.pieces:
+			return False
+
+		self.pieces[seq] = piece
+		return True
+
+	def missing(self):
+		return [seq for seq in range(self.manifest['chunks']) if seq not in self.pieces]
+
+	def complete(self):
+		return len(self.pieces) == self.manifest['chunks']
+
+	def image(self):
+		if not self.complete():
+			raise ChunkError("Missing chunks: {0}".format(self.missing()))
+
+		data = zlib.decompress(''.join(self.pieces[seq] for seq in range(self.manifest['chunks'])))
+		if len(data) != self.manifest['size'] or image_id(data) != self.manifest['id']:
+			raise ChunkError("Reassembled image does not match the manifest")
+
+		return data
@@ -0,0 +1,142 @@
+import base64
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import firmware_chunks
+
+# Firmware images stored by content: STORE_DIR/<image id>/ holds what programming a mote with the image sends,
+# encoded once for all the runs using it:
+#   image    - the raw image
+#   hex      - its base64 encoding, the 'hex' of the program command
+#   manifest - the manifest of the chunked transfer, whose id is the image id (sha256 of the image)
+#   chunks   - the chunks of the chunked transfer, back to back
+# An entry is written into a temporary directory renamed into place once complete, so that runs sharing the store
+# never read a partial one.
+#
+# FlashLedger remembers the image last flashed on each mote and within which IoT-LAB experiment. It stands in for
+# the image reported by the box of a mote when the box does not report it: nobody else can program the motes of an
+# experiment while it is ours, the ledger is not trusted outside of the experiment it was written in.
+# Runs of a campaign flash from separate processes into the same ledger: a record is read, updated and replaced
+# under an flock, as Experiment.locked() does for the state of a run.
+
+STORE_DIR = os.path.join(os.path.dirname(__file__), 'firmware-store')
+
+
+class FirmwareArtifact:
+
+	def __init__(self, directory, image_id):
+		self.directory = directory
+		self.id        = image_id
+		self.encoded   = None # base64 of the image, read on first use
+		self.chunked   = None # (manifest, chunks)
+
+	def path(self, name):
+		return os.path.join(self.directory, name)
+
+	def hex(self):
+		if self.encoded is None:
+			with open(self.path('hex')) as f:
+				self.encoded = f.read()
+		return self.encoded
+
+	# JSON program command, concatenated rather than encoded: the base64 needs no escaping
+	def program_payload(self, token):
+		return '{"token": ' + json.dumps(token) + ', "id": "' + self.id + '", "hex": "' + self.hex() + '", "description": ""}'
+
+	def manifest_and_chunks(self):
+		if self.chunked is None:
+			with open(self.path('manifest')) as f:
+				manifest = json.load(f)
+			with open(self.path('chunks'), 'rb') as f:
+				data = f.read()
+
+			chunks = []
+			offset = 0
+			for seq in range(manifest['chunks']):
+				size = firmware_chunks.HEADER.size + min(manifest['chunk_size'], manifest['compressed_size'] - seq * manifest['chunk_size'])
+				chunks.append(data[offset:offset + size])
+				offset += size
+			self.chunked = (manifest, chunks)
+		return self.chunked
+
+
+class FirmwareStore:
+
+	def __init__(self, directory=STORE_DIR):
+		self.directory = directory
+		self.ledger    = FlashLedger(os.path.join(directory, FlashLedger.LEDGER_FILE))
+
+	def add(self, firmware_path):
+		with open(firmware_path, 'rb') as f:
+			data = f.read()
+
+		image_id = firmware_chunks.image_id(data)
+		entry = os.path.join(self.directory, image_id)
+		if not os.path.exists(entry):
+			self.write(entry, data)
+		return FirmwareArtifact(entry, image_id)
+
+	def write(self, entry, data):
+		if not os.path.exists(self.directory):
+			os.makedirs(self.directory)
+
+		manifest, chunks = firmware_chunks.encode_firmware(data)
+		temporary = tempfile.mkdtemp(prefix='.' + manifest['id'][:8] + '-', dir=self.directory)
+		try:
+			for name, content in [('image', data), ('hex', base64.b64encode(data)), ('manifest', json.dumps(manifest)), ('chunks', ''.join(chunks))]:
+				with open(os.path.join(temporary, name), 'wb') as f:
+					f.write(content)
+			os.rename(temporary, entry)
+		except OSError:
+			if not os.path.exists(entry):
+				raise
+			shutil.rmtree(temporary) # stored by another run meanwhile
+
+
+class FlashLedger:
+
+	LEDGER_FILE = 'ledger.json'
+
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+
+	def load(self):
+		if not os.path.exists(self.path):
+			return {}
+		try:
+			with open(self.path) as f:
+				return json.load(f)
+		except ValueError:
+			return {} # cut short, e.g. by a crash: only costs flashing again
+
+	# {EUI64: image id} flashed within the IoT-LAB experiment reservation
+	def images(self, reservation):
+		if reservation is None:
+			return {}
+		return dict((device, entry['id']) for device, entry in self.load().items() if entry.get('reservation') == reservation)
+
+	def record(self, devices, image_id, reservation):
+		if reservation is None or not devices:
+			return
+
+		directory = os.path.dirname(self.path)
+		if not os.path.exists(directory):
+			os.makedirs(directory)
+
+		with self.lock:
+			with open(self.path + '.lock', 'w') as lock_file:
+				fcntl.flock(lock_file, fcntl.LOCK_EX)
+				entries = self.load()
+				for device in devices:
+					entries[device] = {'id': image_id, 'reservation': reservation, 'at': time.time()}
+
+				temporary = self.path + '.' + str(os.getpid())
+				with open(temporary, 'w') as f:
+					json.dump(entries, f)
+				os.rename(temporary, self.path)
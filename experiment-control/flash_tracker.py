@@ -0,0 +1,75 @@
+import time
+
+# Programming state of every mote of the fleet during a flash.
+# A device is PENDING until the program command is sent, FLASHING until it answers or ATTEMPT_TIMEOUT expires,
+# then FLASHED, or RETRY until it is sent the command again, or FAILED once MAX_ATTEMPTS are used up.
+
+class FlashTracker:
+
+	PENDING         = 'pending'
+	FLASHING        = 'flashing'
+	RETRY           = 'retry'
+	FLASHED         = 'flashed'
+	FAILED          = 'failed'
+
+	MAX_ATTEMPTS    =   3
+	ATTEMPT_TIMEOUT = 120
+
+	def __init__(self, devices, max_attempts=MAX_ATTEMPTS, attempt_timeout=ATTEMPT_TIMEOUT):
+		self.max_attempts    = max_attempts
+		self.attempt_timeout = attempt_timeout
+		self.devices         = {}
+
+		for device in devices:
+			self.expect(device)
+
+	def expect(self, device, sent_at=None):
+		if device not in self.devices:
+			self.devices[device] = {'state': self.PENDING, 'attempts': 0, 'sent_at': None, 'flashed_at': None}
+			if sent_at is not None:
+				self.sent([device], sent_at)
+
+	def sent(self, devices, now=None):
+		now = now if now is not None else time.time()
+		for device in devices:
+			entry = self.devices[device]
+			entry['state']    = self.FLASHING
+			entry['attempts'] += 1
+			entry['sent_at']  = now
+
+	# Returns the new state of the device, or None if the response was not expected
+	def response(self, device, success, now=None):
+		entry = self.devices.get(device)
+		if entry is None or entry['state'] != self.FLASHING:
+			return None
+
+		if success:
+			entry['state']      = self.FLASHED
+			entry['flashed_at'] = now if now is not None else time.time()
+		else:
+			self.failed(entry)
+		return entry['state']
+
+	def failed(self, entry):
+		entry['state'] = self.RETRY if entry['attempts'] < self.max_attempts else self.FAILED
+
+	# Devices that need the program command again, after an error response or a timeout
+	def due_retries(self, now=None):
+		now = now if now is not None else time.time()
+		for entry in self.devices.values():
+			if entry['state'] == self.FLASHING and now - entry['sent_at'] >= self.attempt_timeout:
+				self.failed(entry)
+		return sorted(device for device, entry in self.devices.items() if entry['state'] == self.RETRY)
+
+	def in_state(self, state):
+		return sorted(device for device, entry in self.devices.items() if entry['state'] == state)
+
+	def finished(self):
+		return all(entry['state'] in (self.FLASHED, self.FAILED) for entry in self.devices.values())
+
+	def summary(self):
+		return {
+			'devices' : len(self.devices),
+			'flashed' : self.in_state(self.FLASHED),
+			'failed'  : self.in_state(self.FAILED)
+		}
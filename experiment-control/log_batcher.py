@@ -0,0 +1,142 @@
+import collections
+import threading
+import time
+
+from tracer import span
+
+# Publishes log records in batches from a background thread, so that the thread watching the files never waits on Socket.IO.
+# Records are queued as they are (e.g. decoded log records) and published as one list once MAX_BATCH records are
+# waiting or the oldest has waited MAX_DELAY, never more often than once every MIN_INTERVAL.
+# The queue holds at most MAX_QUEUE records. When it is full a new record is handled by the policy:
+#   drop-oldest - the oldest waiting record is discarded
+#   drop-newest - the new record is discarded
+#   coalesce    - the new record replaces the waiting record with the same key (e.g. the same metric of the same mote),
+#                 the oldest one is discarded if there is none
+
+class LogBatcher:
+
+	DROP_OLDEST  = 'drop-oldest'
+	DROP_NEWEST  = 'drop-newest'
+	COALESCE     = 'coalesce'
+	POLICIES     = [DROP_OLDEST, DROP_NEWEST, COALESCE]
+
+	TOPIC        = 'LOG_MODIFICATION_BATCH'
+	MAX_QUEUE    = 5000
+	MAX_BATCH    = 200
+	MAX_DELAY    = 0.5  # s
+	MIN_INTERVAL = 0.25 # s
+
+	def __init__(self, publish, policy=COALESCE, topic=TOPIC, max_queue=MAX_QUEUE, max_batch=MAX_BATCH, max_delay=MAX_DELAY, min_interval=MIN_INTERVAL):
+		if policy not in self.POLICIES:
+			raise ValueError("Unknown queue policy: " + str(policy))
+
+		self.publish      = publish
+		self.policy       = policy
+		self.topic        = topic
+		self.max_queue    = max_queue
+		self.max_batch    = max_batch
+		self.max_delay    = max_delay
+		self.min_interval = min_interval
+
+		self.pending      = collections.OrderedDict() # seq -> (key, record, arrival time)
+		self.latest       = {}                        # key -> seq of its most recent waiting record
+		self.seq          = 0
+		self.sent_at      = 0.0
+		self.closed       = False
+		self.condition    = threading.Condition()
+
+		self.stats        = {'received': 0, 'published': 0, 'batches': 0, 'dropped': 0, 'coalesced': 0, 'errors': 0}
+
+		self.thread = threading.Thread(target=self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	# Never blocks on the network. Returns False if the record was dropped.
+	def put(self, record, key=None):
+		with self.condition:
+			self.stats['received'] += 1
+
+			if len(self.pending) >= self.max_queue:
+				if self.policy == self.DROP_NEWEST:
+					self.stats['dropped'] += 1
+					return False
+
+				if self.policy == self.COALESCE and key is not None and key in self.latest:
+					seq = self.latest[key]
+					self.pending[seq] = (key, record, self.pending[seq][2]) # waits as long as the replaced record
+					self.stats['coalesced'] += 1
+					return True
+
+				self.drop_oldest()
+
+			first = not self.pending
+			self.pending[self.seq] = (key, record, time.time())
+			if key is not None:
+				self.latest[key] = self.seq
+			self.seq += 1
+
+			# The sender sleeps without a timeout while the queue is empty
+			if first or len(self.pending) >= self.max_batch:
+				self.condition.notify()
+			return True
+
+	def drop_oldest(self):
+		seq, (key, record, arrived) = self.pending.popitem(last=False)
+		if key is not None and self.latest.get(key) == seq:
+			del self.latest[key]
+		self.stats['dropped'] += 1
+
+	# Arrival time of the oldest waiting record: those left over by a full batch keep theirs
+	def first_at(self):
+		return next(self.pending.itervalues())[2]
+
+	def take(self):
+		records = []
+		while self.pending and len(records) < self.max_batch:
+			seq, (key, record, arrived) = self.pending.popitem(last=False)
+			if key is not None and self.latest.get(key) == seq:
+				del self.latest[key]
+			records.append(record)
+		return records
+
+	def run(self):
+		while True:
+			with self.condition:
+				while not self.closed:
+					now = time.time()
+					if self.pending and (len(self.pending) >= self.max_batch or now - self.first_at() >= self.max_delay):
+						wait = self.sent_at + self.min_interval - now
+						if wait <= 0:
+							break
+					elif self.pending:
+						wait = self.first_at() + self.max_delay - now
+					else:
+						wait = None
+					self.condition.wait(wait)
+
+				if self.closed and not self.pending:
+					return
+
+				records = self.take()
+				self.sent_at = time.time()
+
+			self.send(records)
+
+	def send(self, records):
+		try:
+			with span('batch.publish', topic=self.topic, records=len(records)):
+				self.publish(self.topic, records)
+		except Exception, e:
+			self.stats['errors'] += 1
+			print("Error while publishing " + str(len(records)) + " log records: " + str(e))
+			return
+
+		self.stats['batches']   += 1
+		self.stats['published'] += len(records)
+
+	# Publishes whatever is still waiting and stops the sender thread
+	def close(self):
+		with self.condition:
+			self.closed = True
+			self.condition.notify()
+		self.thread.join()
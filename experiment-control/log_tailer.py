@@ -0,0 +1,88 @@
+import os
+
+# Reads only what was appended to log files since the previous call, keeping one handle and byte offset per file.
+# Files are followed by inode rather than by name, so that a log renamed by rotation (networkEvent.log -> .log.1)
+# is drained from where it was left, and the new file that takes its name is read from its beginning.
+# A file that shrinks in place is considered truncated and read again from the start.
+
+class LogTailer:
+
+	READ_SIZE = 65536
+
+	def __init__(self):
+		self.files = {} # (st_dev, st_ino) -> {'handle', 'offset', 'partial'}
+		self.paths = {} # path -> (st_dev, st_ino) it was last seen with
+
+	def skip_existing(self, directory):
+		# Content written before the monitoring started is not reported
+		for name in os.listdir(directory):
+			path = os.path.join(directory, name)
+			if os.path.isfile(path):
+				key = self.key(path)
+				self.files[key] = {'handle': None, 'offset': os.path.getsize(path), 'partial': ''}
+				self.paths[path] = key
+
+	def key(self, path):
+		stat = os.stat(path)
+		return (stat.st_dev, stat.st_ino)
+
+	# Returns the complete lines appended to path (and to the file it was before a rotation) since the last call
+	def read(self, path):
+		try:
+			key = self.key(path)
+		except OSError:
+			return []
+
+		lines = []
+
+		previous = self.paths.get(path)
+		if previous is not None and previous != key and previous in self.files:
+			lines.extend(self.read_key(previous, None))
+			self.close_key(previous)
+		self.paths[path] = key
+
+		lines.extend(self.read_key(key, path))
+		return lines
+
+	def read_key(self, key, path):
+		state = self.files.get(key)
+		if state is None:
+			state = self.files[key] = {'handle': None, 'offset': 0, 'partial': ''}
+
+		if state['handle'] is None:
+			if path is None:
+				return []
+			try:
+				state['handle'] = open(path, 'rb')
+			except IOError:
+				return []
+
+		handle = state['handle']
+		if os.fstat(handle.fileno()).st_size < state['offset']:
+			state['offset']  = 0
+			state['partial'] = ''
+
+		handle.seek(state['offset'])
+		chunks = []
+		while True:
+			chunk = handle.read(self.READ_SIZE)
+			if not chunk:
+				break
+			chunks.append(chunk)
+		state['offset'] = handle.tell()
+
+		data = state['partial'] + ''.join(chunks)
+		lines = data.split('\n')
+		state['partial'] = lines.pop()
+
+		return [line for line in lines if line != '']
+
+	def close_key(self, key):
+		state = self.files.get(key)
+		if state is not None and state['handle'] is not None:
+			state['handle'].close()
+			state['handle'] = None
+
+	def close(self):
+		for key in self.files.keys():
+			self.close_key(key)
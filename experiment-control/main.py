@@ -2,33 +2,37 @@ import argparse
 import ConfigParser
 import os
 import base64
+import json
+import sys
 
-from otbox_startup import OTBoxStartup
-from otbox_flash import OTBoxFlash
-from ov_startup import OVStartup
-from reservation import Reservation
-from ov_log_monitor import OVLogMonitor
+from socket_io_handler import SocketIoEmitter, SocketIoHandler
+from experiment import Experiment
+from tracer import Tracer, span, format_summary
 
+# Every action imports the subsystem it runs when it runs, e.g. `--action check` loads the reservation code but not
+# the MQTT flasher or the watchdog-based log monitor, and importing a module has no side effect: the configuration is
+# read by main(). The connection to the Socket.IO relay is made while the action loads, so that its first event is
+# not delayed by it.
 
-configParser = ConfigParser.RawConfigParser()   
-configFilePath = os.path.join(os.path.dirname(__file__), 'conf.txt')
-configParser.read(configFilePath)
+CONFIG_FILE   = os.path.join(os.path.dirname(__file__), 'conf.txt')
+FIRMWARE      = os.path.join(os.path.dirname(__file__), 'firmware')
+QUIET_ACTIONS = ['ov-metrics'] # publish no event while they run
 
-USERNAME = os.environ["user"] if "user" in os.environ else configParser.get('exp-config', 'user')
-PRIVATE_SSH = os.environ["private_ssh"] if "private_ssh" in os.environ else ""
-HOSTNAME = 'saclay.iot-lab.info'
+def get_config():
+	configParser = ConfigParser.RawConfigParser()
+	configParser.read(CONFIG_FILE)
 
-EXP_DURATION = 30 #Duration in minutes
-NODES = "saclay,a8,106+107"
-
-FIRMWARE = os.path.join(os.path.dirname(__file__), 'firmware')
-BROKER = configParser.get('exp-config', 'broker')
+	return {
+		'user'        : os.environ["user"] if "user" in os.environ else configParser.get('exp-config', 'user'),
+		'private_ssh' : os.environ["private_ssh"] if "private_ssh" in os.environ else "",
+		'broker'      : configParser.get('exp-config', 'broker')
+	}
 
-def add_private_key():
-	if PRIVATE_SSH != "":
+def add_private_key(private_ssh):
+	if private_ssh != "":
 		private_ssh_file = os.path.join(os.path.expanduser("~"), ".ssh", "id_rsa")
 
-		private_ssh_decoded = base64.b64decode(PRIVATE_SSH)
+		private_ssh_decoded = base64.b64decode(private_ssh)
 
 		with open(private_ssh_file, "w") as f:
 			f.write(private_ssh_decoded)
@@ -37,7 +41,7 @@ def add_private_key():
 def add_parser_args(parser):
 	parser.add_argument('--action', 
         dest       = 'action',
-        choices    = ['check', 'reserve', 'terminate', 'otbox', 'otbox-flash', 'ov-start', 'ov-monitor'],
+        choices    = ['check', 'reserve', 'terminate', 'otbox', 'otbox-flash', 'ov-start', 'ov-monitor', 'ov-metrics', 'orchestrate', 'campaign'],
         required   = True,
         action     = 'store'
     )
@@ -52,6 +56,87 @@ def add_parser_args(parser):
         default    = '03oos_openwsn_prog',
         action     = 'store'
 	)
+	parser.add_argument('--flash-mode', 
+        dest       = 'flash_mode',
+        choices    = ['blob', 'chunked'],
+        default    = 'blob',
+        action     = 'store'
+	)
+	parser.add_argument('--flash-track', 
+        dest       = 'flash_track',
+        default    = False,
+        action     = 'store_true',
+        help       = 'wait for every mote to acknowledge the firmware, retrying the failed ones'
+	)
+	parser.add_argument('--flash-force', 
+        dest       = 'flash_force',
+        default    = False,
+        action     = 'store_true',
+        help       = 'tracked flashing: also program the motes already running the firmware'
+	)
+	parser.add_argument('--log-policy', 
+        dest       = 'log_policy',
+        choices    = ['coalesce', 'drop-oldest', 'drop-newest'],
+        default    = 'coalesce',
+        action     = 'store',
+        help       = 'what to do with new log records when the publishing queue is full'
+	)
+	parser.add_argument('--trace', 
+        dest       = 'trace',
+        choices    = Tracer.FORMATS,
+        action     = 'store',
+        help       = 'time the steps of the action into the traces directory of the run, summarized at the end'
+	)
+	parser.add_argument('--idle-timeout', 
+        dest       = 'idle_timeout',
+        type       = float,
+        action     = 'store',
+        help       = 'seconds without OV log records after which the experiment is over, default: that of the log monitor'
+	)
+	parser.add_argument('--campaign', 
+        dest       = 'campaign',
+        action     = 'store',
+        help       = 'sweep definition (JSON) of the campaign action, see campaign.py'
+	)
+	# The experiment run the action applies to, several runs can share this host. The other values are saved with
+	# the run: they only need to be given to the first action of a run.
+	parser.add_argument('--exp-id', 
+        dest       = 'exp_id',
+        default    = Experiment.DEFAULT_ID,
+        action     = 'store'
+	)
+	parser.add_argument('--site', 
+        dest       = 'site',
+        action     = 'store',
+        help       = 'IoT-LAB site, default: ' + Experiment.SITE
+	)
+	parser.add_argument('--nodes', 
+        dest       = 'nodes',
+        action     = 'store',
+        help       = 'iotlab-experiment node list, default: ' + Experiment.NODES
+	)
+	parser.add_argument('--duration', 
+        dest       = 'duration',
+        type       = int,
+        action     = 'store',
+        help       = 'experiment duration in minutes, default: ' + str(Experiment.DURATION)
+	)
+	parser.add_argument('--channel', 
+        dest       = 'channel',
+        action     = 'store',
+        help       = 'Socket.IO channel of the UI following the run, default: ' + Experiment.DEFAULT_CHANNEL
+	)
+	parser.add_argument('--ov-dir', 
+        dest       = 'ov_dir',
+        action     = 'store',
+        help       = 'OpenVisualizer tree of the run'
+	)
+	parser.add_argument('--ov-port', 
+        dest       = 'ov_port',
+        type       = int,
+        action     = 'store',
+        help       = 'OpenVisualizer web port of the run, default: ' + str(Experiment.OV_PORT)
+	)
 
 def get_args():
 	parser = argparse.ArgumentParser()
@@ -59,44 +144,153 @@ def get_args():
 	args = parser.parse_args()
 
 	return {
-		'action'  : args.action,
-		'testbed' : args.testbed,
-		'firmware': args.firmware
+		'action'      : args.action,
+		'testbed'     : args.testbed,
+		'firmware'    : args.firmware,
+		'flash_mode'  : args.flash_mode,
+		'flash_track' : args.flash_track,
+		'flash_force' : args.flash_force,
+		'log_policy'  : args.log_policy,
+		'idle_timeout': args.idle_timeout,
+		'trace'       : args.trace,
+		'campaign'    : args.campaign,
+		'exp_id'      : args.exp_id,
+		'site'        : args.site,
+		'nodes'       : args.nodes,
+		'duration'    : args.duration,
+		'channel'     : args.channel,
+		'ov_dir'      : args.ov_dir,
+		'ov_port'     : args.ov_port
 	}
 
+def get_experiment(args):
+	experiment = Experiment.load(args['exp_id'], site=args['site'], nodes=args['nodes'], duration=args['duration'], channel=args['channel'], ov_dir=args['ov_dir'], ov_port=args['ov_port'])
+	experiment.update(**dict((key, getattr(experiment, key)) for key in ['site', 'nodes', 'duration', 'channel', 'ov_dir', 'ov_port']))
+	return experiment
+
+def start_trace(action, format, experiment):
+	path = os.path.join(experiment.run_dir, 'traces', '{0}-{1}.{2}'.format(action, os.getpid(), Tracer.EXTENSIONS[format]))
+	Tracer.start(path, format, exp_id=experiment.exp_id, action=action)
+	return path
+
+def stop_trace(path, experiment):
+	summary = Tracer.stop()
+	print format_summary(summary)
+	print 'Trace written to ' + path
+	socketIoHandler = SocketIoHandler.for_experiment(experiment)
+	socketIoHandler.publish(Tracer.SUMMARY_TOPIC, summary)
+	socketIoHandler.emitter.flush()
+
 def main():
 	args = get_args()
+	config = get_config()
 
 	action = args['action']
-	testbed = args['testbed']
-	firmware = '{0}/{1}'.format(FIRMWARE, args['firmware'])
 
-	add_private_key()
+	add_private_key(config['private_ssh'])
+	experiment = get_experiment(args)
 
 	print 'Script started'
-	
-	if action == 'check':
-		print 'Checking experiment'
-		Reservation(USERNAME, HOSTNAME).check_experiment()
-	if action == 'reserve':
-		print 'Reserving nodes'
-		Reservation(USERNAME, HOSTNAME).reserve_experiment(EXP_DURATION, NODES)
-	if action == 'terminate':
-		print 'Terminating experiment'
-		Reservation(USERNAME, HOSTNAME).terminate_experiment()
-	elif action == 'otbox':
-		print 'Starting OTBox'
-		OTBoxStartup(USERNAME, HOSTNAME, testbed).start()
-	elif action == 'otbox-flash':
-		print 'Flashing OTBox'
-		OTBoxFlash(firmware, BROKER, testbed).flash()
-	elif action == 'ov-start':
-		print 'Starting OV'
-		OVStartup().start()
-	elif action == 'ov-monitor':
-		print 'Starting OV log monitoring'
-		OVLogMonitor().start()
+
+	if action not in QUIET_ACTIONS:
+		SocketIoEmitter.get().warm_up()
+
+	trace_path = start_trace(action, args['trace'], experiment) if args['trace'] else None
+	try:
+		with span('action.' + action):
+			run_action(action, args, experiment, config)
+	finally:
+		if trace_path is not None:
+			stop_trace(trace_path, experiment)
+
+def run_action(action, args, experiment, config):
+	ACTIONS[action](args, experiment, config)
+
+def firmware_path(args):
+	return '{0}/{1}'.format(FIRMWARE, args['firmware'])
+
+def check(args, experiment, config):
+	from reservation import Reservation
+	print 'Checking experiment'
+	Reservation(config['user'], experiment.domain, experiment=experiment).check_experiment()
+
+def reserve(args, experiment, config):
+	from reservation import Reservation
+	print 'Reserving nodes'
+	Reservation(config['user'], experiment.domain, experiment=experiment).reserve_experiment(experiment.duration, experiment.nodes)
+
+def terminate(args, experiment, config):
+	from reservation import Reservation
+	print 'Terminating experiment'
+	Reservation(config['user'], experiment.domain, experiment=experiment).terminate_experiment()
+
+def otbox(args, experiment, config):
+	from otbox_startup import OTBoxStartup
+	print 'Starting OTBox'
+	OTBoxStartup(config['user'], experiment.domain, args['testbed'], experiment=experiment).start()
+
+def otbox_flash(args, experiment, config):
+	from otbox_flash import OTBoxFlash
+	print 'Flashing OTBox'
+	summary = OTBoxFlash(firmware_path(args), config['broker'], args['testbed'], args['flash_mode'], track=args['flash_track'], experiment=experiment, force=args['flash_force']).flash()
+	# Only a tracked flash knows which motes were programmed
+	if args['flash_track'] and not OTBoxFlash.succeeded(summary):
+		sys.exit(1)
+
+def ov_start(args, experiment, config):
+	from ov_startup import OVStartup
+	print 'Starting OV'
+	OVStartup(experiment).run()
+
+def ov_monitor(args, experiment, config):
+	from ov_log_monitor import OVLogMonitor
+	print 'Starting OV log monitoring'
+	OVLogMonitor(args['log_policy'], experiment, args['idle_timeout']).start()
+
+def ov_metrics(args, experiment, config):
+	from metrics_stream import MetricsStream
+	print 'Summarizing experiment metrics'
+	print json.dumps(MetricsStream.load(experiment.metrics_dir).summary(), indent=4, sort_keys=True)
+
+def orchestrate(args, experiment, config):
+	from orchestrator import Orchestrator, ExperimentSteps
+	print 'Running the whole experiment'
+	steps = ExperimentSteps(experiment, config['user'], args['testbed'], config['broker'], firmware_path(args), args['flash_mode'], args['log_policy'], args['idle_timeout'], args['flash_force'])
+	if not Orchestrator(steps, SocketIoHandler.for_experiment(experiment).publish).run():
+		sys.exit(1)
+
+def campaign(args, experiment, config):
+	from campaign import Campaign, CampaignScheduler
+	from orchestrator import ExperimentSteps
+	if args['campaign'] is None:
+		sys.exit('The campaign action needs a sweep definition (--campaign)')
+	print 'Running campaign ' + args['campaign']
+	with open(args['campaign']) as f:
+		definition = json.load(f)
+
+	# The options of a run override the testbed, firmware, flash mode, log policy and idle timeout of the command line
+	def steps_for(run, options):
+		run_args = dict(args, **options)
+		return ExperimentSteps(run, config['user'], run_args['testbed'], config['broker'], firmware_path(run_args), run_args['flash_mode'], run_args['log_policy'], run_args['idle_timeout'], args['flash_force'])
+
+	def publish_for(run):
+		return SocketIoHandler.for_experiment(run).publish
+
+	if CampaignScheduler(Campaign.create(definition), steps_for, publish_for).run()['failed']:
+		sys.exit(1)
+
+ACTIONS = {
+	'check'       : check,
+	'reserve'     : reserve,
+	'terminate'   : terminate,
+	'otbox'       : otbox,
+	'otbox-flash' : otbox_flash,
+	'ov-start'    : ov_start,
+	'ov-monitor'  : ov_monitor,
+	'ov-metrics'  : ov_metrics,
+	'orchestrate' : orchestrate,
+	'campaign'    : campaign
+}
 
 if __name__ == '__main__':
 	main()
-
@@ -0,0 +1,242 @@
+import array
+import bisect
+import json
+import os
+import threading
+
+# KPIs extracted from the OpenBenchmark performance events while they are logged (see "Experiment Performance Events"
+# in the documentation): latency and hop count per packet, PDR, join times, radio duty cycle and clock drift.
+# Measurements are kept column-wise in typed arrays, one table per kind of measurement, nodes being stored as indexes
+# into self.nodes. Latency percentiles per node and per window are kept sorted as the packets arrive.
+# persist() appends the rows added since its previous call to one binary file per column, load() reads them back.
+
+JOIN_EVENTS = ['synchronizationCompleted', 'secureJoinCompleted', 'bandwidthAssigned', 'networkFormationCompleted']
+
+TABLES = {
+	'sent'       : [('node', 'H'), ('asn', 'l')],
+	'latency'    : [('node', 'H'), ('asn', 'l'), ('slots', 'l'), ('hops', 'h')],
+	'join'       : [('node', 'H'), ('event', 'B'), ('asn', 'l')],
+	'duty_cycle' : [('node', 'H'), ('asn', 'l'), ('value', 'f')],
+	'clock_drift': [('node', 'H'), ('asn', 'l'), ('value', 'f')]
+}
+
+META_FILE    = 'meta.json'
+WINDOW       = 6000 # ASN, one minute with 10 ms slots
+PERCENTILES  = [50, 90, 99]
+
+
+class RollingPercentiles:
+
+	def __init__(self):
+		self.values = {} # key -> sorted array of values
+
+	def add(self, key, value):
+		values = self.values.get(key)
+		if values is None:
+			values = self.values[key] = array.array('l')
+		bisect.insort(values, value)
+
+	def bulk_load(self, keys, values):
+		grouped = {}
+		for key, value in zip(keys, values):
+			grouped.setdefault(key, []).append(value)
+		for key, group in grouped.items():
+			self.values[key] = array.array('l', sorted(group))
+
+	def percentiles(self, key, ranks=PERCENTILES):
+		values = self.values.get(key)
+		if not values:
+			return None
+		return dict((rank, values[min(len(values) - 1, len(values) * rank // 100)]) for rank in ranks)
+
+	def keys(self):
+		return self.values.keys()
+
+
+class MetricsStream:
+
+	def __init__(self, window=WINDOW):
+		self.window     = window
+		self.nodes      = []
+		self.node_index = {}
+		self.tables     = dict((name, dict((column, array.array(typecode)) for column, typecode in columns)) for name, columns in TABLES.items())
+		self.persisted  = dict((name, 0) for name in TABLES)
+		self.persist_to = None
+		self.in_flight  = {} # packetToken -> (node, asn, hopLimit) of packets sent and not received yet
+		self.received   = {} # node -> packets received out of those it sent
+
+		self.by_node    = RollingPercentiles()
+		self.by_window  = RollingPercentiles()
+
+		self.lock       = threading.Lock()
+
+	def node(self, record):
+		mote_info = record.get('_mote_info')
+		if isinstance(mote_info, dict) and 'serial' in mote_info:
+			name = mote_info['serial']
+		else:
+			name = record.get('source', '')
+
+		index = self.node_index.get(name)
+		if index is None:
+			index = self.node_index[name] = len(self.nodes)
+			self.nodes.append(name)
+		return index
+
+	def append(self, table, *row):
+		columns = self.tables[table]
+		for (column, typecode), value in zip(TABLES[table], row):
+			columns[column].append(value)
+
+	# Returns False for records that are not performance events
+	def add(self, record):
+		event = record.get('event')
+		if event is None and '_type' in record:
+			event = record['_type'].split('.')[-1]
+		try:
+			asn = int(record['timestamp'])
+		except (KeyError, TypeError, ValueError):
+			return False
+
+		try:
+			with self.lock:
+				return self.add_event(event, asn, record)
+		except (KeyError, TypeError, ValueError):
+			return False # malformed event
+
+	def add_event(self, event, asn, record):
+		if event == 'packetSent':
+			token = tuple(record['packetToken'])
+			node = self.node(record)
+			self.append('sent', node, asn)
+			self.in_flight[token] = (node, asn, record.get('hopLimit'))
+
+		elif event == 'packetReceived':
+			sent = self.in_flight.pop(tuple(record['packetToken']), None)
+			if sent is None:
+				return True # sent before the monitoring started, or a duplicate
+			node, sent_asn, hop_limit = sent
+			hops = hop_limit - record['hopLimit'] if hop_limit is not None and 'hopLimit' in record else -1
+			self.append('latency', node, asn, asn - sent_asn, hops)
+			self.received[node] = self.received.get(node, 0) + 1
+			self.by_node.add(node, asn - sent_asn)
+			self.by_window.add((node, asn // self.window), asn - sent_asn)
+
+		elif event in JOIN_EVENTS:
+			self.append('join', self.node(record), JOIN_EVENTS.index(event), asn)
+
+		elif event == 'radioDutyCycleMeasurement':
+			self.append('duty_cycle', self.node(record), asn, float(record['dutyCycle']))
+
+		elif event == 'clockDriftMeasurement':
+			self.append('clock_drift', self.node(record), asn, float(record['clockDrift']))
+
+		else:
+			return False
+		return True
+
+	def percentiles(self, node, window=None):
+		index = self.node_index.get(node)
+		if window is None:
+			return self.by_node.percentiles(index)
+		return self.by_window.percentiles((index, window))
+
+	def summary(self):
+		with self.lock:
+			sent = {}
+			for node in self.tables['sent']['node']:
+				sent[node] = sent.get(node, 0) + 1
+
+			hops = {}
+			for node, value in zip(self.tables['latency']['node'], self.tables['latency']['hops']):
+				if value >= 0:
+					hops.setdefault(node, []).append(value)
+
+			joins = {}
+			for node, event, asn in zip(self.tables['join']['node'], self.tables['join']['event'], self.tables['join']['asn']):
+				joins.setdefault(node, {}).setdefault(JOIN_EVENTS[event], asn)
+
+			duty_cycle  = self.means('duty_cycle')
+			clock_drift = self.means('clock_drift')
+
+			nodes = {}
+			for index, name in enumerate(self.nodes):
+				received = self.received.get(index, 0)
+				node_hops = hops.get(index, [])
+				nodes[name] = {
+					'sent'        : sent.get(index, 0),
+					'received'    : received,
+					'pdr'         : float(received) / sent[index] if sent.get(index) else None,
+					'latency'     : self.by_node.percentiles(index),
+					'hops'        : float(sum(node_hops)) / len(node_hops) if node_hops else None,
+					'join'        : joins.get(index, {}),
+					'duty_cycle'  : duty_cycle.get(index),
+					'clock_drift' : clock_drift.get(index)
+				}
+
+			total_sent = len(self.tables['sent']['node'])
+			return {
+				'packets_sent'     : total_sent,
+				'packets_received' : len(self.tables['latency']['node']),
+				'pdr'              : float(len(self.tables['latency']['node'])) / total_sent if total_sent else None,
+				'nodes'            : nodes
+			}
+
+	def means(self, table):
+		sums = {}
+		for node, value in zip(self.tables[table]['node'], self.tables[table]['value']):
+			total, count = sums.get(node, (0.0, 0))
+			sums[node] = (total + value, count + 1)
+		return dict((node, total / count) for node, (total, count) in sums.items())
+
+	def persist(self, directory):
+		if not os.path.exists(directory):
+			os.makedirs(directory)
+
+		with self.lock:
+			# The files of a previous experiment in the same directory are overwritten
+			appending = self.persist_to == directory
+			self.persist_to = directory
+
+			for name, columns in TABLES.items():
+				start = self.persisted[name] if appending else 0
+				for column, typecode in columns:
+					with open(os.path.join(directory, name + '.' + column), 'ab' if appending else 'wb') as f:
+						self.tables[name][column][start:].tofile(f)
+				self.persisted[name] = len(self.tables[name][columns[0][0]])
+
+			meta = {
+				'nodes'   : self.nodes,
+				'window'  : self.window,
+				'rows'    : self.persisted,
+				'columns' : TABLES
+			}
+			with open(os.path.join(directory, META_FILE), 'w') as f:
+				json.dump(meta, f)
+
+	@classmethod
+	def load(cls, directory):
+		with open(os.path.join(directory, META_FILE)) as f:
+			meta = json.load(f)
+
+		stream = cls(meta['window'])
+		stream.nodes      = [str(node) for node in meta['nodes']]
+		stream.node_index = dict((node, index) for index, node in enumerate(stream.nodes))
+
+		for name, columns in TABLES.items():
+			rows = meta['rows'].get(name, 0)
+			for column, typecode in columns:
+				values = array.array(typecode)
+				with open(os.path.join(directory, name + '.' + column), 'rb') as f:
+					values.fromfile(f, rows)
+				stream.tables[name][column] = values
+			stream.persisted[name] = rows
+		stream.persist_to = directory
+
+		latency = stream.tables['latency']
+		for node in latency['node']:
+			stream.received[node] = stream.received.get(node, 0) + 1
+		stream.by_node.bulk_load(latency['node'], latency['slots'])
+		stream.by_window.bulk_load([(node, asn // stream.window) for node, asn in zip(latency['node'], latency['asn'])], latency['slots'])
+
+		return stream
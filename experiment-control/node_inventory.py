@@ -0,0 +1,118 @@
+import json
+import os
+import time
+
+# What a run knows about its IoT-LAB experiment, kept in its run directory so that the stages and the main.py actions
+# of the run share it rather than asking the SSH frontend again:
+#   - the reservation (iotlab-experiment get -p: state, nodes...), trusted for TTL seconds after it was fetched, as
+#     the experiment may change state meanwhile (e.g. stop at the end of its duration)
+#   - the motes of each box, as reported by the boxes on MQTT
+# The inventory is kept for one IoT-LAB experiment, the iotlab_id of the run: it is ignored once the run has another
+# one, and dropped by invalidate() when the run submits or stops one.
+# The nodes are indexed for the lookups of the stages: hostname <-> box id, box id -> EUI64s of its motes,
+# EUI64 -> box id.
+
+def box_id(hostname):
+	# otbox.py names its box after the hostname of the node it runs on
+	return 'node-' + hostname.split('.')[0]
+
+
+class NodeInventory:
+
+	TTL            = 60 # s
+	INVENTORY_FILE = 'inventory.json'
+
+	def __init__(self, experiment, ttl=TTL):
+		self.experiment = experiment
+		self.ttl        = ttl
+
+		self.entry      = {} # {'iotlab_id', 'fetched_at', 'reservation', 'motes'}
+		self.hosts      = {} # hostname -> box id
+		self.boxes      = {} # box id -> hostname
+		self.motes      = {} # box id -> [EUI64]
+		self.devices    = {} # EUI64 -> box id
+
+		self.load()
+
+	@property
+	def path(self):
+		return os.path.join(self.experiment.run_dir, self.INVENTORY_FILE)
+
+	# Saved entry of the current IoT-LAB experiment of the run, {} if there is none
+	def read(self):
+		if self.experiment.iotlab_id is None or not os.path.exists(self.path):
+			return {}
+		try:
+			with open(self.path) as f:
+				entry = json.load(f)
+		except ValueError:
+			return {} # cut short, e.g. by a crash: only costs a round trip
+		return entry if entry.get('iotlab_id') == self.experiment.iotlab_id else {}
+
+	def write(self):
+		if self.experiment.iotlab_id is None:
+			return # not shared with the other processes of the run, but still indexed
+		self.entry['iotlab_id'] = self.experiment.iotlab_id
+		with open(self.path + '.tmp', 'w') as f:
+			json.dump(self.entry, f)
+		os.rename(self.path + '.tmp', self.path)
+
+	def load(self):
+		self.entry = self.read()
+		self.index()
+
+	def index(self):
+		reservation  = self.entry.get('reservation') or {}
+		self.hosts   = dict((host, box_id(host)) for host in reservation.get('nodes', []))
+		self.boxes   = dict((box, host) for host, box in self.hosts.items())
+		self.motes   = dict(self.entry.get('motes', {}))
+		self.devices = dict((device, box) for box, devices in self.motes.items() for device in devices)
+
+	# Reservation of the run while it is fresh, None when it has to be fetched from the frontend
+	def reservation(self):
+		if self.experiment.iotlab_id is None:
+			return None
+		self.load()
+		fetched_at = self.entry.get('fetched_at')
+		if fetched_at is None or time.time() - fetched_at > self.ttl:
+			return None
+		return self.entry['reservation']
+
+	def store(self, reservation):
+		with self.experiment.locked():
+			self.entry = self.read()
+			self.entry.update(fetched_at=time.time(), reservation=reservation)
+			self.write()
+		self.index()
+
+	def add_motes(self, box, devices):
+		self.motes[box] = list(devices)
+		for device in devices:
+			self.devices[device] = box
+
+	# Saves the motes added since the inventory was loaded, along with those saved by the other processes
+	def save_motes(self):
+		with self.experiment.locked():
+			self.entry = self.read()
+			self.entry['motes'] = dict(self.entry.get('motes', {}), **self.motes)
+			self.write()
+		self.index()
+
+	def invalidate(self):
+		with self.experiment.locked():
+			if os.path.exists(self.path):
+				os.remove(self.path)
+		self.entry = {}
+		self.index()
+
+	def box(self, hostname):
+		return self.hosts.get(hostname) or box_id(hostname)
+
+	def hostname(self, box):
+		return self.boxes.get(box)
+
+	def eui64s(self, box):
+		return self.motes.get(box, [])
+
+	def box_of(self, device):
+		return self.devices.get(device)
@@ -3,7 +3,24 @@ var server = require('http').Server(app);
 var io = require('socket.io')(server);
 
 server.listen(3000);
-var channelId = 1;
+var channelId = 1; // default channel, for the events that do not name the channel of their experiment
+
+// What is logged of each relayed event: 'none', 'topics' (topic, experiment and sequence number) or 'payloads'
+var logEvents = process.env.RELAY_LOG || 'none';
+
+// The compiled UI bundle (web/public/js/app.js) still subscribes to one Socket.IO event per topic. Until it is
+// rebuilt from Home.vue, the payloads of these topics are also emitted under their own name, as strings.
+var legacyTopics = [
+	'NODE_RESERVATION', 'RESERVATION_SUCCESS', 'RESERVATION_STATUS_RETRY', 'RESERVATION_FAIL',
+	'NODE_BOOTED', 'BOOT_RETRY', 'BOOT_FAIL', 'NODE_ACTIVE', 'NODE_ACTIVE_FAIL', 'LOG_MODIFICATION', 'EXP_TERMINATE'
+];
+
+// Batched topics are unpacked into the per-record events the bundle subscribes to
+var legacyBatches = {'LOG_MODIFICATION_BATCH': 'LOG_MODIFICATION'};
+
+function emitLegacy(room, topic, payload) {
+	io.to(room).emit(topic, typeof payload === 'string' ? payload : JSON.stringify(payload));
+}
 
 io.on('connection', function(socket) {
 	console.log('A connection was made!');
@@ -13,52 +30,19 @@ io.on('connection', function(socket) {
 		console.log('A channel has been registered: channel' + id);
 	});
 
-	socket.on('NODE_RESERVATION', message => {
-		console.log('Topic: NODE_RESERVATION - ' + message);
-		io.to('channel' + channelId).emit('NODE_RESERVATION', message)
-	});
-    socket.on('RESERVATION_SUCCESS', message => {
-        console.log('Topic: RESERVATION_SUCCESS - ' + message);
-        io.to('channel' + channelId).emit('RESERVATION_SUCCESS', message)
-    });
-    socket.on('RESERVATION_STATUS_RETRY', message => {
-        console.log('Topic: RESERVATION_STATUS_RETRY - ' + message);
-        io.to('channel' + channelId).emit('RESERVATION_STATUS_RETRY', message)
-    });
-    socket.on('RESERVATION_FAIL', message => {
-        console.log('Topic: RESERVATION_FAIL - ' + message);
-        io.to('channel' + channelId).emit('RESERVATION_FAIL', message)
-    });
-
-	socket.on('NODE_BOOTED', message => {
-		console.log('Topic: NODE_BOOTED - ' + message);
-		io.to('channel' + channelId).emit('NODE_BOOTED', message)
-	});
-    socket.on('BOOT_RETRY', message => {
-        console.log('Topic: BOOT_RETRY - ' + message);
-        io.to('channel' + channelId).emit('BOOT_RETRY', message)
-    });
-    socket.on('BOOT_FAIL', message => {
-        console.log('Topic: BOOT_FAIL - ' + message);
-        io.to('channel' + channelId).emit('BOOT_FAIL', message)
-    });
-
-    socket.on('NODE_ACTIVE', message => {
-		console.log('Topic: NODE_ACTIVE - ' + message);
-		io.to('channel' + channelId).emit('NODE_ACTIVE', message)
+	// Envelopes from the experiment control: {topic, payload, exp, channel, seq, ts}.
+	// They are routed on their channel only, so a new topic needs no change here.
+	socket.on('event', envelope => {
+		if (logEvents === 'topics')
+			console.log('Topic: ' + envelope.topic + ' - experiment ' + envelope.exp + ' #' + envelope.seq);
+		else if (logEvents === 'payloads')
+			console.log('Topic: ' + envelope.topic + ' - experiment ' + envelope.exp + ' #' + envelope.seq + ' - ' + JSON.stringify(envelope.payload));
+
+		var room = 'channel' + (envelope.channel || channelId);
+		io.to(room).emit('event', envelope);
+		if (legacyTopics.indexOf(envelope.topic) !== -1)
+			emitLegacy(room, envelope.topic, envelope.payload);
+		else if (envelope.topic in legacyBatches)
+			envelope.payload.forEach(payload => emitLegacy(room, legacyBatches[envelope.topic], payload));
 	});
-    socket.on('NODE_ACTIVE_FAIL', message => {
-        console.log('Topic: NODE_ACTIVE_FAIL - ' + message);
-        io.to('channel' + channelId).emit('NODE_ACTIVE_FAIL', message)
-    });
-
-    socket.on('LOG_MODIFICATION', message => {
-        console.log('Topic: LOG_MODIFICATION - ' + message);
-        io.to('channel' + channelId).emit('LOG_MODIFICATION', message)
-    });
-
-    socket.on('EXP_TERMINATE', message => {
-        console.log('Topic: EXP_TERMINATE - ' + message);
-        io.to('channel' + channelId).emit('EXP_TERMINATE', message)
-    });
-});
\ No newline at end of file
+});
@@ -0,0 +1,225 @@
+import Queue
+import os
+import threading
+
+from scheduler import Scheduler, monotonic
+from tracer import span
+
+# Runs a whole experiment in one process, as a state machine over the stages below.
+# Each stage runs on its own thread and ends with an event on the orchestrator queue: its readiness event,
+# posted as soon as what the next stage needs is available (nodes answering SSH, boxes answering on MQTT,
+# OpenVisualizer accepting connections...), or STAGE_FAILED. The next stage starts upon that event, not after a pause.
+# All the stages share the SSH transport of the process (SshPool), the Socket.IO emitter and the MQTT session.
+# While it runs, ORCHESTRATION_HEARTBEAT reports the current stage every HEARTBEAT_INTERVAL (process Scheduler).
+# ExperimentSteps imports the code of a stage when the stage starts, so that the run starts reserving without
+# loading the MQTT flasher or the log monitor first.
+# When a stage fails, steps.terminate() ends the run (IoT-LAB experiment, otbox.py on its nodes, OpenVisualizer)
+# unless the orchestrator is created with terminate=False, e.g. to keep a reservation for another attempt.
+
+class Orchestrator:
+
+	RESERVE      = 'reserve'
+	BOOT         = 'boot'
+	OTBOX        = 'otbox'
+	FLASH        = 'flash'
+	OV_START     = 'ov-start'
+	MONITOR      = 'monitor'
+
+	STAGES       = [RESERVE, BOOT, OTBOX, FLASH, OV_START, MONITOR]
+
+	READY_EVENTS = {
+		RESERVE  : 'NODES_RESERVED',
+		BOOT     : 'NODES_BOOTED',
+		OTBOX    : 'OTBOX_READY',
+		FLASH    : 'FIRMWARE_FLASHED',
+		OV_START : 'OV_READY',
+		MONITOR  : 'MONITOR_DONE'
+	}
+	FAILED       = 'STAGE_FAILED'
+
+	EVENT_POLL         = 1  # s, lets KeyboardInterrupt through while waiting for events
+	HEARTBEAT_INTERVAL = 10 # s
+
+	def __init__(self, steps, publish, stages=STAGES, scheduler=None, terminate=True):
+		self.steps     = steps   # object with one method per stage ('ov-start' -> ov_start()), returning the stage result
+		self.publish   = publish # publish(topic, message)
+		self.stages    = stages
+		self.scheduler = scheduler if scheduler is not None else Scheduler.get()
+		self.terminate = terminate
+		self.events   = Queue.Queue()
+		self.state    = None
+		self.timings  = []
+
+	def post(self, event, payload=None):
+		self.events.put((event, payload))
+
+	def start_stage(self, stage):
+		self.state = stage
+		self.stage_started = monotonic()
+		print("Stage: " + stage)
+		self.publish('STAGE_STARTED', stage)
+
+		worker = threading.Thread(target=self.run_stage, args=(stage,))
+		worker.daemon = True
+		worker.start()
+
+	def run_stage(self, stage):
+		try:
+			with span('stage.' + stage):
+				result = getattr(self.steps, stage.replace('-', '_'))()
+		except Exception, e:
+			self.post(self.FAILED, (stage, str(e)))
+			return
+		self.post(self.READY_EVENTS[stage], result)
+
+	def heartbeat(self):
+		self.publish('ORCHESTRATION_HEARTBEAT', {'stage': self.state, 'elapsed': monotonic() - self.stage_started})
+
+	def terminate_run(self):
+		try:
+			with span('orchestrator.terminate'):
+				self.steps.terminate()
+		except Exception, e:
+			print("Could not terminate the run: " + str(e))
+
+	# Returns True if all the stages completed
+	def run(self):
+		heartbeat = self.scheduler.every(self.HEARTBEAT_INTERVAL, self.heartbeat)
+		try:
+			return self.run_stages()
+		finally:
+			heartbeat.cancel()
+
+	def run_stages(self):
+		started = monotonic()
+		self.start_stage(self.stages[0])
+
+		while True:
+			try:
+				event, payload = self.events.get(timeout=self.EVENT_POLL)
+			except Queue.Empty:
+				continue
+
+			if event == self.FAILED:
+				stage, error = payload
+				print("Stage {0} failed: {1}".format(stage, error))
+				self.publish('ORCHESTRATION_FAIL', {'stage': stage, 'error': error})
+				self.state = self.FAILED
+				if self.terminate:
+					self.terminate_run()
+				return False
+
+			if event != self.READY_EVENTS[self.state]:
+				continue # stale event of an earlier stage
+
+			elapsed = monotonic() - self.stage_started
+			self.timings.append((self.state, elapsed))
+			print("Stage {0} completed in {1:.1f} s".format(self.state, elapsed))
+			self.publish('STAGE_COMPLETE', {'stage': self.state, 'elapsed': elapsed})
+
+			index = self.stages.index(self.state)
+			if index + 1 == len(self.stages):
+				print("Experiment completed in {0:.1f} s".format(monotonic() - started))
+				return True
+			self.start_stage(self.stages[index + 1])
+
+
+class ExperimentSteps:
+
+	OTBOX_READY_TIMEOUT = 120 # s for the boxes to answer on MQTT once otbox.py is launched
+	OV_READY_TIMEOUT    = 300 # s for OpenVisualizer to build and listen
+
+	def __init__(self, experiment, user, testbed, broker, firmware, flash_mode, log_policy, idle_timeout=None, flash_force=False):
+		self.experiment   = experiment
+		self.user         = user
+		self.domain       = experiment.domain
+		self.testbed      = testbed
+		self.broker       = broker
+		self.firmware     = firmware
+		self.flash_mode   = flash_mode
+		self.log_policy   = log_policy
+		self.idle_timeout = idle_timeout
+		self.flash_force  = flash_force
+		self.reserve_wait = None # s for the reservation to run, default: that of Reservation
+		self.reserve_more = 0    # min added to the duration of the IoT-LAB experiment, e.g. held before the run starts
+		self.update_tree  = True # False: the opentestbed tree is used as it is, e.g. another run has otbox.py running from it
+
+		self.startup      = None
+		self.flasher      = None
+		self.ov           = None
+
+	def reserve(self):
+		from reservation import Reservation
+		reservation = Reservation(self.user, self.domain, experiment=self.experiment)
+		if self.reserve_wait is not None:
+			reservation.SSH_RETRY_TIME = self.reserve_wait
+		reservation.reserve_experiment(self.experiment.duration + self.reserve_more, self.experiment.nodes)
+		self.reserved = reservation.get_reserved_nodes(True)
+		if not self.reserved:
+			raise Exception("No node reserved")
+		return self.reserved
+
+	def boot(self):
+		from otbox_startup import OTBoxStartup
+		self.startup = OTBoxStartup(self.user, self.domain, self.testbed, self.reserved, self.experiment, self.update_tree)
+		self.startup.boot_wait()
+		if not self.startup.booted_nodes:
+			raise Exception("No node booted")
+		return self.startup.booted_nodes
+
+	def otbox(self):
+		from otbox_flash import OTBoxFlash
+		active = self.startup.launch()
+		if not active:
+			raise Exception("otbox.py could not be started on any node")
+
+		# Ready once the boxes answer on MQTT, the session is then kept for flashing
+		self.flasher = OTBoxFlash(self.firmware, self.broker, self.testbed, self.flash_mode, track=True, experiment=self.experiment, force=self.flash_force)
+		if not self.flasher.open():
+			raise Exception("Could not connect to broker " + self.broker)
+		motes = self.flasher.wait_for_boxes(len(active), self.OTBOX_READY_TIMEOUT)
+		if not motes:
+			self.flasher.close()
+			raise Exception("No box reported its motes")
+		self.flasher.devices = motes
+		return motes
+
+	def flash(self):
+		try:
+			summary = self.flasher.flash()
+		finally:
+			self.flasher.close()
+		if not summary or not (summary['flashed'] or summary['skipped']):
+			raise Exception("No mote flashed")
+		return summary
+
+	def ov_start(self):
+		from ov_startup import OVStartup
+		# OpenVisualizer keeps running under its supervisor while the run is monitored
+		self.ov = OVStartup(self.experiment).start()
+		if not self.ov.wait_ready(self.OV_READY_TIMEOUT):
+			self.ov.stop()
+			raise Exception("OpenVisualizer not ready after {0} s ({1})".format(self.OV_READY_TIMEOUT, self.ov.state))
+		if not os.path.exists(self.experiment.log_dir):
+			raise Exception("OpenVisualizer log directory missing: " + self.experiment.log_dir)
+		return True
+
+	def monitor(self):
+		from ov_log_monitor import OVLogMonitor
+		OVLogMonitor(self.log_policy, self.experiment, self.idle_timeout).start()
+
+	# Ends a failed run. Stopping its IoT-LAB experiment also stops otbox.py on the nodes, the processes of the run
+	# (OpenVisualizer) are stopped in any case, but another IoT-LAB experiment of the user is never stopped.
+	def terminate(self):
+		from exp_terminate import ExpTerminate
+		from reservation import Reservation
+		if self.experiment.iotlab_id is not None:
+			Reservation(self.user, self.domain, experiment=self.experiment).terminate_experiment()
+		else:
+			ExpTerminate(self.experiment).exp_terminate()
+
+	# Stops the IoT-LAB experiment of the run once it is over, without waiting for the end of its duration
+	def release(self):
+		from reservation import Reservation
+		if self.experiment.iotlab_id is not None:
+			Reservation(self.user, self.domain, experiment=self.experiment).stop_experiment()
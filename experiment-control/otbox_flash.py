@@ -1,41 +1,346 @@
 import paho.mqtt.client as mqtt
-import base64
+import binascii
 import json
+import os
+import threading
+import time
+
+from firmware_store import FirmwareStore
+from flash_tracker import FlashTracker
+from node_inventory import NodeInventory
+from tracer import span
 
 CLIENT = 'exp-auto'
 
 class OTBoxFlash:
 
-	def __init__(self, firmware_path, broker, testbed):
+	MODE_BLOB         = 'blob'
+	MODE_CHUNKED      = 'chunked'
+
+	QOS               =  1
+	CONNECT_TIMEOUT   = 30
+	RESEND_WINDOW     = 10 # chunked mode: time without resend requests after which the transfer is considered over
+	DISCOVERY_TIMEOUT =  5 # tracked mode: time given to the boxes to report their motes
+	TRACK_POLL        =  1
+	MAX_ATTEMPTS      = FlashTracker.MAX_ATTEMPTS
+	ATTEMPT_TIMEOUT   = FlashTracker.ATTEMPT_TIMEOUT
+
+	def __init__(self, firmware_path, broker, testbed, mode=MODE_BLOB, client=None, track=False, devices=None, socketIoHandler=None, experiment=None, store=None, force=False):
 		self.firmware_path     = firmware_path
+		self.store             = store if store is not None else FirmwareStore()
+		self.force             = force # tracked mode: also program the motes already running the image
 		self.broker            = broker
 		self.testbed           = testbed
+		self.mode              = mode
+		self.track             = track
+		self.devices           = devices # EUI64s of the fleet, discovered through the boxes if not given
 
-		self.client            = mqtt.Client(CLIENT)
+		self.client            = client if client is not None else mqtt.Client(experiment.mqtt_client_id if experiment is not None else CLIENT)
 		self.client.on_connect = self.on_connect
+		self.client.on_message = self.on_message
+
+		if track and socketIoHandler is None:
+			from socket_io_handler import SocketIoHandler
+			socketIoHandler = SocketIoHandler.for_experiment(experiment)
+		self.socketIoHandler   = socketIoHandler
+
+		# Within a run sharing the broker with others, only the boxes of its nodes are asked for their motes,
+		# and its motes are programmed one by one rather than through deviceId/all
+		self.box_ids           = experiment.box_ids() if experiment is not None else []
+		self.reservation       = experiment.iotlab_id if experiment is not None else None
+		self.inventory         = NodeInventory(experiment) if experiment is not None else None # motes of the boxes
+
+		self.connected         = threading.Event()
+		self.lock              = threading.Lock()
+		self.token             = binascii.hexlify(os.urandom(4))
+		self.tracker           = None
+		self.sent_at           = None
+		self.discovered        = set()
+		self.boxes             = set()
+		self.images            = {}   # EUI64 -> id of the image it runs, as reported by its box
+		self.artifact          = None
+		self.manifest          = None
+		self.chunks            = []
+		self.last_activity     = 0
+		self.stats             = {'mode': mode, 'messages': 0, 'bytes': 0, 'resent': 0, 'skipped': 0}
+
+	def topic(self, device_id, suffix, device_type='mote'):
+		return '{0}/deviceType/{1}/deviceId/{2}/{3}'.format(self.testbed, device_type, device_id, suffix)
 
 	def on_connect(self, client, userdata, flags, rc):
 		print "Connected to broker: {0}".format(self.broker)
-		self.flash_firmware()
-		self.client.disconnect()
+		if self.mode == self.MODE_CHUNKED:
+			self.client.subscribe(self.topic('+', 'resp/program/missing'), self.QOS)
+		if self.track:
+			self.client.subscribe(self.topic('+', 'resp/program'), self.QOS)
+			self.client.subscribe(self.topic('+', 'resp/status', 'box'), self.QOS)
+
+		if self.mode == self.MODE_CHUNKED or self.track:
+			self.connected.set()
+		else:
+			self.flash_firmware()
+			self.client.disconnect()
+
+	def on_message(self, client, userdata, message):
+		try:
+			device_id = message.topic.split('/')[4]
+			payload   = json.loads(message.payload)
+
+			if message.topic.endswith('/resp/program/missing'):
+				self.on_missing(device_id, payload)
+			elif message.topic.endswith('/resp/program'):
+				self.on_program_response(device_id, payload)
+			elif message.topic.endswith('/resp/status'):
+				self.on_box_status(device_id, payload)
+
+		except Exception, e:
+			print("Invalid message on {0}: {1}".format(message.topic, str(e)))
+
+	def on_missing(self, device_id, request):
+		# A mote asking for the chunks it missed: {'id': <image id>, 'missing': [<seq>, ...]}
+		if self.manifest is None or request['id'] != self.manifest['id']:
+			return
 
-	def flash_firmware(self):
+		for seq in request['missing']:
+			self.send(self.topic(device_id, 'cmd/program/chunk'), self.chunks[seq])
+			self.stats['resent'] += 1
+
+		self.last_activity = time.time()
+
+	def on_program_response(self, device_id, response):
+		if response.get('token', self.token) != self.token:
+			return
+
+		with self.lock:
+			if self.tracker is None:
+				return
+			if not self.devices:
+				self.tracker.expect(device_id, self.sent_at) # no fleet known in advance: every responding mote is tracked
+			state = self.tracker.response(device_id, response.get('success', False))
+
+		if state == FlashTracker.FLASHED:
+			self.socketIoHandler.publish('MOTE_FLASHED', device_id)
+
+	def on_box_status(self, box_id, response):
+		if response.get('token') != self.token:
+			return
+
+		if self.box_ids and box_id not in self.box_ids:
+			return
+
+		self.boxes.add(box_id)
+		devices = []
+		for mote in response.get('returnVal', {}).get('motes', []):
+			if 'EUI64' in mote:
+				devices.append(mote['EUI64'])
+				self.discovered.add(mote['EUI64'])
+				if mote.get('image_id'):
+					self.images[mote['EUI64']] = mote['image_id']
+		if self.inventory is not None:
+			self.inventory.add_motes(box_id, devices)
+
+	def send(self, topic, payload, qos=QOS):
+		self.stats['messages'] += 1
+		self.stats['bytes']    += len(payload)
+		with span('mqtt.publish', topic=topic.split('/', 3)[-1], bytes=len(payload)):
+			return self.client.publish(topic, payload, qos)
+
+	def firmware(self):
+		if self.artifact is None:
+			self.artifact = self.store.add(self.firmware_path)
+		return self.artifact
+
+	def flash_firmware(self, device_id='all', qos=0):
 		# {0}/deviceType/mote/deviceId/all/cmd/program
 
 		try:
-			with open(self.firmware_path) as f:
-				data = f.read()
-				payload = {
-					'hex': base64.b64encode(data),
-					'description': ''
-				}
+			payload = self.firmware().program_payload(self.token)
 
-				print("Sending firmware to motes")
-				self.client.publish('{0}/deviceType/mote/deviceId/all/cmd/program'.format(self.testbed), json.dumps(payload))
+			print("Sending firmware to motes")
+			return [self.send(self.topic(device_id, 'cmd/program'), payload, qos)]
 
 		except Exception, e:
 			print("An exception occured: {0}".format(str(e)))
+			return []
 
-	def flash(self):
+	def flash_chunked(self, device_id='all'):
+		# {0}/deviceType/mote/deviceId/all/cmd/program/manifest, followed by the chunks on .../cmd/program/chunk
+
+		if self.manifest is None:
+			manifest, self.chunks = self.firmware().manifest_and_chunks()
+			self.manifest = dict(manifest, token=self.token)
+
+		print("Sending firmware to {0} in {1} chunks ({2} of {3} bytes after compression)".format(device_id, self.manifest['chunks'], self.manifest['compressed_size'], self.manifest['size']))
+
+		pending = [self.send(self.topic(device_id, 'cmd/program/manifest'), json.dumps(self.manifest))]
+		for chunk in self.chunks:
+			pending.append(self.send(self.topic(device_id, 'cmd/program/chunk'), chunk))
+		return pending
+
+	def program(self, device_id='all'):
+		if self.mode == self.MODE_CHUNKED:
+			return self.flash_chunked(device_id)
+		return self.flash_firmware(device_id, self.QOS)
+
+	def serve_resends(self):
+		# Serve resend requests until the motes stop asking
+		self.last_activity = time.time()
+		while time.time() - self.last_activity < self.RESEND_WINDOW:
+			time.sleep(min(1, self.RESEND_WINDOW))
+
+	def request_status(self):
+		for box_id in self.box_ids or ['all']:
+			self.send(self.topic(box_id, 'cmd/status', 'box'), json.dumps({'token': self.token}))
+
+	def discover(self):
+		with span('flash.discover'):
+			self.request_status()
+			time.sleep(self.DISCOVERY_TIMEOUT)
+		self.save_motes()
+		return sorted(self.discovered)
+
+	# Makes the motes reported by the boxes available to the other stages of the run
+	def save_motes(self):
+		if self.inventory is not None and self.inventory.motes:
+			self.inventory.save_motes()
+
+	# {EUI64: image id} of the motes whose image is known, from their box or else from the ledger
+	def running_images(self):
+		images = self.store.ledger.images(self.reservation)
+		images.update(self.images)
+		return images
+
+	# A tracked flash succeeded when no mote failed and some motes run the firmware, flashed now or already running it
+	@classmethod
+	def succeeded(cls, summary):
+		return summary is not None and not summary['failed'] and bool(summary['flashed'] or summary['skipped'])
+
+	def flash_tracked(self):
+		if not self.devices:
+			self.devices = self.discover()
+
+		skipped = []
+		if self.devices and not self.force:
+			running = self.running_images()
+			skipped = [device_id for device_id in self.devices if running.get(device_id) == self.firmware().id]
+			if skipped:
+				print("{0} motes already run image {1}, not flashed again".format(len(skipped), self.firmware().id[:12]))
+				self.socketIoHandler.publish('FLASH_SKIPPED', skipped)
+		devices = [device_id for device_id in self.devices or [] if device_id not in skipped]
+		self.stats['skipped'] = len(skipped)
+
+		if self.devices and not devices:
+			summary = {'devices': len(skipped), 'flashed': [], 'failed': [], 'skipped': skipped}
+			print("Flashed 0/{0} motes, {0} skipped".format(len(skipped)))
+			self.socketIoHandler.publish('FLASH_COMPLETE', summary)
+			return summary
+
+		print("Flashing {0} motes".format(len(devices) if devices else 'all responding'))
+
+		with self.lock:
+			self.tracker = FlashTracker(devices, self.MAX_ATTEMPTS, self.ATTEMPT_TIMEOUT)
+			self.tracker.sent(self.tracker.devices.keys())
+			self.sent_at = time.time()
+		if (self.box_ids or skipped) and devices:
+			for device_id in devices:
+				self.program(device_id)
+		else:
+			self.program('all')
+
+		reported = set()
+		while True:
+			with self.lock:
+				# Without a known fleet, answers are collected for a whole attempt before the fleet can be complete
+				collecting = not self.devices and time.time() - self.sent_at < self.tracker.attempt_timeout
+				retries = self.tracker.due_retries()
+				self.tracker.sent(retries)
+				failed = [device_id for device_id in self.tracker.in_state(FlashTracker.FAILED) if device_id not in reported]
+				done = not collecting and self.tracker.finished()
+
+			for device_id in failed:
+				self.socketIoHandler.publish('MOTE_FLASH_FAIL', device_id)
+				reported.add(device_id)
+
+			if done:
+				break
+
+			# Failed motes are re-programmed individually, all at once
+			for device_id in retries:
+				self.socketIoHandler.publish('MOTE_FLASH_RETRY', device_id)
+				self.program(device_id)
+
+			time.sleep(self.TRACK_POLL)
+
+		summary = self.tracker.summary()
+		summary['devices'] += len(skipped)
+		summary['skipped'] = skipped
+		self.store.ledger.record(summary['flashed'], self.firmware().id, self.reservation)
+		print("Flashed {0}/{1} motes, {2} skipped".format(len(summary['flashed']), summary['devices'], len(skipped)))
+		self.socketIoHandler.publish('FLASH_COMPLETE', summary)
+		if not self.succeeded(summary):
+			# e.g. no mote discovered nor answering: nothing runs the firmware
+			self.socketIoHandler.publish('FLASH_FAIL', summary)
+		return summary
+
+	# Keeps a tracked session connected, e.g. to wait for the boxes before flashing (see wait_for_boxes())
+	def open(self):
 		self.client.connect(self.broker)
-		self.client.loop_forever()
\ No newline at end of file
+		self.client.loop_start()
+		if not self.connected.wait(self.CONNECT_TIMEOUT):
+			print("Could not connect to broker: {0}".format(self.broker))
+			self.close()
+			return False
+		return True
+
+	def close(self):
+		self.client.disconnect()
+		self.client.loop_stop()
+		self.connected.clear()
+
+	# Asks the boxes for their status until `expected` of them answered or timeout expires, returns the motes found
+	def wait_for_boxes(self, expected, timeout):
+		deadline = time.time() + timeout
+		with span('flash.wait_boxes', expected=expected) as traced:
+			while True:
+				self.request_status()
+				answer_by = time.time() + min(self.DISCOVERY_TIMEOUT, max(0, deadline - time.time()))
+				while len(self.boxes) < expected and time.time() < answer_by:
+					time.sleep(self.TRACK_POLL / 10.0)
+				if len(self.boxes) >= expected or time.time() >= deadline:
+					traced.set(boxes=len(self.boxes), motes=len(self.discovered))
+					self.save_motes()
+					return sorted(self.discovered)
+
+	def flash_chunked_session(self):
+		for info in self.program('all'):
+			info.wait_for_publish()
+		self.serve_resends()
+
+	def flash(self):
+		with span('flash', mode=self.mode, track=self.track):
+			return self.flash_session()
+
+	def flash_session(self):
+		started = time.time()
+		result = None
+
+		if self.connected.is_set():
+			# Session opened by the caller, which also closes it
+			result = self.flash_tracked() if self.track else self.flash_chunked_session()
+		elif self.mode == self.MODE_CHUNKED or self.track:
+			if not self.open():
+				return None
+			try:
+				if self.track:
+					result = self.flash_tracked()
+				else:
+					self.flash_chunked_session()
+			finally:
+				self.close()
+		else:
+			self.client.connect(self.broker)
+			self.client.loop_forever()
+
+		self.stats['elapsed'] = time.time() - started
+		print("Firmware sent in {messages} messages, {bytes} bytes, {elapsed:.2f} s".format(**self.stats))
+		return result
\ No newline at end of file
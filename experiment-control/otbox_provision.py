@@ -0,0 +1,157 @@
+import hashlib
+import json
+import posixpath
+import time
+
+from command_executor import CommandExecutor
+from tracer import span
+
+# The opentestbed tree and the Python dependencies of otbox.py, provisioned in the A8 directory of the SSH frontend,
+# which the nodes mount over NFS, instead of being cloned and pip-installed again by every OTBox startup:
+#   A8/opentestbed          - checkout of BRANCH of REPOSITORY
+#   A8/otbox-deps/<deps id> - REQUIREMENTS installed with pip --target, put on the PYTHONPATH of otbox.py
+#   A8/.otbox-env.json      - stamp of the tree: manifest id, revision checked out, last check of upstream
+# inspect() reads all of it in a single command. The tree is current while its stamp matches the manifest and its
+# revision, and upstream was checked less than REFRESH_INTERVAL ago. Otherwise the head of BRANCH is looked up
+# (git ls-remote): the tree is only fetched and checked out if the head moved, and only cloned if it is missing.
+# While otbox.py of another run may be running from the tree, provision(update=False) uses it as it is.
+# The bundle is identified by the requirements, it is built once, by pip on one of the nodes (which otbox.py runs on,
+# with their Python), into a temporary directory renamed into place once complete. Startups racing to build it
+# each rename their own directory: the first one wins, the others remove theirs and use the bundle in place.
+
+REPOSITORY       = 'https://github.com/bozidars27/opentestbed.git'
+BRANCH           = 'opentestbed-extension'
+REQUIREMENTS     = ['requests']
+
+TREE             = 'A8/opentestbed'
+BUNDLES          = 'A8/otbox-deps'
+STAMP            = 'A8/.otbox-env.json'
+
+
+def digest(value):
+	return hashlib.sha256(json.dumps(value, sort_keys=True)).hexdigest()[:16]
+
+
+class OTBoxProvisioner:
+
+	REFRESH_INTERVAL = 3600 # s during which a provisioned tree is not checked against upstream
+	GIT_TIMEOUT      = CommandExecutor.COMMAND_TIMEOUT
+	PIP_TIMEOUT      = CommandExecutor.COMMAND_TIMEOUT
+
+	CURRENT          = 'current' # stamp matching, upstream not asked
+	CHECKED          = 'checked' # upstream asked, the tree was at its head
+	UPDATED          = 'updated' # fetched and checked out
+	CLONED           = 'cloned'
+	KEPT             = 'kept'    # not updated, in use by another run
+	FAILED           = 'failed'
+
+	def __init__(self, executor, repository=REPOSITORY, branch=BRANCH, requirements=REQUIREMENTS, refresh_interval=REFRESH_INTERVAL):
+		self.executor         = executor
+		self.repository       = repository
+		self.branch           = branch
+		self.requirements     = sorted(requirements)
+		self.refresh_interval = refresh_interval
+
+		self.manifest_id      = digest({'repository': repository, 'branch': branch})
+		self.bundle           = BUNDLES + '/' + digest(self.requirements)
+		self.bundle_ready     = False
+		self.revision         = None
+
+	# Output lines of the command, None if it failed
+	def run(self, command, node_name=None, timeout=CommandExecutor.COMMAND_TIMEOUT):
+		result = self.executor.run(command, node_name, timeout)
+		return result.output if result.success() else None
+
+	# {'stamp', 'revision', 'bundle'} of the frontend, None if it could not tell
+	def inspect(self):
+		output = self.run(
+			'echo "stamp $(cat ' + STAMP + ' 2>/dev/null)"; '
+			'echo "revision $(cd ' + TREE + ' 2>/dev/null && git rev-parse HEAD 2>/dev/null)"; '
+			'echo "bundle $(test -d ' + self.bundle + ' && echo ok)"'
+		)
+		if output is None:
+			return None
+
+		values = dict((line.split(' ', 1) + [''])[:2] for line in output if line)
+		try:
+			stamp = json.loads(values.get('stamp') or '{}')
+		except ValueError:
+			stamp = {}
+		return {'stamp': stamp, 'revision': values.get('revision', '').strip(), 'bundle': values.get('bundle', '').strip() == 'ok'}
+
+	def current(self, state):
+		stamp = state['stamp']
+		return (state['revision'] != ''
+			and stamp.get('manifest') == self.manifest_id
+			and stamp.get('revision') == state['revision']
+			and time.time() - stamp.get('checked_at', 0) < self.refresh_interval)
+
+	def upstream_revision(self):
+		output = self.run('git ls-remote ' + self.repository + ' refs/heads/' + self.branch, timeout=self.GIT_TIMEOUT)
+		if not output or not output[0].strip():
+			return None
+		return output[0].split()[0]
+
+	# Last line of the output: the revision checked out
+	def checkout(self, command):
+		output = self.run(command + ' && git rev-parse HEAD', timeout=self.GIT_TIMEOUT)
+		return output[-1].strip() if output else None
+
+	def write_stamp(self):
+		stamp = json.dumps({'manifest': self.manifest_id, 'revision': self.revision, 'checked_at': time.time()})
+		return self.run("echo '" + stamp + "' > " + STAMP) is not None
+
+	# Brings the opentestbed tree up to date, returns what was done (CURRENT, CHECKED, UPDATED, CLONED or FAILED),
+	# or KEPT if update is False and the tree is there
+	def provision(self, update=True):
+		with span('otbox.provision') as traced:
+			outcome = self.provision_tree(update)
+			traced.set(tree=outcome, bundle=self.bundle_ready)
+		print("opentestbed tree " + outcome + (" at " + self.revision[:12] if self.revision else ""))
+		return outcome
+
+	def provision_tree(self, update):
+		state = self.inspect()
+		if state is None:
+			return self.FAILED
+		self.bundle_ready = state['bundle']
+		if self.current(state):
+			self.revision = state['revision']
+			return self.CURRENT
+		if not update:
+			self.revision = state['revision'] or None
+			return self.KEPT if self.revision else self.FAILED
+
+		upstream = self.upstream_revision()
+		if upstream is None and state['revision']:
+			# Kept as it is while upstream cannot be reached, and checked again by the next startup
+			self.revision = state['revision']
+			return self.CHECKED
+
+		if upstream == state['revision']:
+			self.revision = upstream
+			outcome = self.CHECKED
+		elif state['revision']:
+			self.revision = self.checkout('cd ' + TREE + ' && git fetch -q origin ' + self.branch + ' && git checkout -q -f ' + upstream)
+			outcome = self.UPDATED
+		else:
+			self.revision = self.checkout('cd A8 && rm -rf opentestbed && git clone -q -b ' + self.branch + ' ' + self.repository + ' opentestbed && cd opentestbed' + (' && git checkout -q ' + upstream if upstream else ''))
+			outcome = self.CLONED
+
+		if self.revision is None:
+			return self.FAILED
+		self.write_stamp()
+		return outcome
+
+	# Builds the dependency bundle on node_name unless it is there, returns its path relative to the tree (where otbox.py
+	# runs), None if it could not be built
+	def ensure_bundle(self, node_name):
+		if not self.bundle_ready:
+			building = self.bundle + '.' + node_name
+			with span('otbox.bundle', node=node_name) as traced:
+				# mv -T never moves into an existing bundle, it fails on it
+				rename = 'mv -T ' + building + ' ' + self.bundle + ' 2>/dev/null || { test -d ' + self.bundle + ' && rm -rf ' + building + '; }'
+				output = self.run('mkdir -p ' + BUNDLES + '; rm -rf ' + building + '; pip install -q --target ' + building + ' ' + ' '.join(self.requirements) + ' && { ' + rename + '; }', node_name, self.PIP_TIMEOUT)
+				self.bundle_ready = output is not None
+				traced.set(built=self.bundle_ready)
+		return posixpath.relpath(self.bundle, TREE) if self.bundle_ready else None
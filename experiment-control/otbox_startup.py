@@ -1,4 +1,3 @@
-import paramiko
 import json
 import subprocess
 import time
@@ -6,13 +5,23 @@ import threading
 import os
 
 from socket_io_handler import SocketIoHandler
+from ssh_pool import SshPool
+from command_executor import CommandExecutor
 from reservation import Reservation
+from node_inventory import box_id
+from otbox_provision import OTBoxProvisioner
+from boot_prober import BootProber
+from worker_pool import run_parallel
+from tracer import span
 
 class OTBoxStartup:
 
 	CMD_ERROR                = "cmd_error"
 	SSH_RETRY_TIME           = 600
 	RETRY_PAUSE              =   6
+	PROBE_TIMEOUT            =  30
+	BOOT_CONCURRENCY         =  32
+	LAUNCH_CONCURRENCY       =  32
 	MQTT_PAUSE               =  20
 	EUI64_RETREIVAL_TIMEOUT  =   5
 
@@ -23,96 +32,108 @@ class OTBoxStartup:
 	timer                    =   0 #used for measuring the amount of time between status messages
 
 
-	def __init__(self, user, domain, testbed):
+	def __init__(self, user, domain, testbed, nodes=None, experiment=None, update_tree=True):
 		self.user            = user
 		self.domain          = domain
 		self.testbed         = testbed
 
-		self.socketIoHandler = SocketIoHandler()
+		self.socketIoHandler = SocketIoHandler.for_experiment(experiment)
 
-		self.client          = paramiko.SSHClient()
-		self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-		self.client.load_system_host_keys()
+		self.ssh_pool        = SshPool.get(user, domain)
+		self.executor        = CommandExecutor(self.ssh_pool, self.socketIoHandler.publish)
 
 		self.ssh_connect()
 
 		self.booted_nodes    = []
 		self.active_nodes    = []
+		self.launch_results  = []
 
-		self.reservation     = Reservation(user, domain)
-		self.nodes           = self.reservation.get_reserved_nodes(True)
-		
-        # Fetch the latest version of opentestbed software in the shared A8 director of the SSH frontend
-		self.ssh_command_exec('cd A8; rm -rf opentestbed; git clone https://github.com/bozidars27/opentestbed.git; cd opentestbed; git checkout origin/opentestbed-extension;')
+		if nodes is None:
+			self.reservation = Reservation(user, domain, experiment=experiment)
+			nodes            = self.reservation.get_reserved_nodes(True)
+		self.nodes           = nodes
+
+		# The opentestbed software in the shared A8 directory of the SSH frontend, only updated when upstream changed
+		# and update_tree is set
+		self.provisioner     = OTBoxProvisioner(self.executor)
+		self.provisioner.provision(update_tree)
+		self.bundle          = None
 
 
 	def ssh_connect(self):
-		self.client.connect(self.domain, username=self.user)
+		self.ssh_pool.connect()
 
 	def ssh_disconnect(self):
-		self.client.close()
-
-	def ssh_command_exec(self, command):
-		try:
-			stdin, stdout, stderr = self.client.exec_command(command)
-			stdin.close()
-
-			output = []
-			for line in stdout.read().splitlines():
-				output.append(line)
+		self.ssh_pool.close()
 
-			error = []
-			for line in stderr.read().splitlines():
-				error.append(line)
+	def ssh_command_exec(self, command, node_name=None, timeout=CommandExecutor.COMMAND_TIMEOUT):
+		result = self.executor.run(command, node_name, timeout)
 
-			if len(error) > 0:
-				raise Exception(self.CMD_ERROR)
-
-			return ''.join(output)
-
-		except:
+		if not result.success():
 			return self.CMD_ERROR
 
+		return ''.join(result.output)
+
 
 	def boot_wait(self):
-		for ind, node in enumerate(self.nodes):
-
-			node_name = 'node-' + node.split('.')[0]
-			print("Probing node: " + node_name)
-
-			retries = 0
-			num_of_retries = self.SSH_RETRY_TIME / self.RETRY_PAUSE
-
-			while True:
-				try:
-					boot_op = self.ssh_command_exec('ssh -o "StrictHostKeyChecking no" root@' + node_name + ' "cd A8;"')
-				except:
-					print 'Error executing command: ssh -o "StrictHostKeyChecking no" root@' + node_name
-
-				if boot_op == self.CMD_ERROR and retries <= num_of_retries:
-					print("Node " + node_name + ": retrying")
-					self.socketIoHandler.publish('BOOT_RETRY', node_name + ": " + str(retries) + "/" + str(num_of_retries))
-					retries += 1
-					time.sleep(self.RETRY_PAUSE)
-				elif retries > num_of_retries:
-					self.socketIoHandler.publish('BOOT_FAIL', node_name)
-					break
-				else:
-					self.socketIoHandler.publish('NODE_BOOTED', node_name)
-					self.booted_nodes.append(node)
-					break
+		# All reserved nodes are probed concurrently, within a single global SSH_RETRY_TIME budget
+		prober = BootProber(self.probe_node, self.socketIoHandler.publish, self.BOOT_CONCURRENCY, self.SSH_RETRY_TIME, self.RETRY_PAUSE)
+		with span('otbox.boot_wait', nodes=len(self.nodes)) as traced:
+			self.booted_nodes = prober.run(self.nodes)
+			traced.set(booted=len(self.booted_nodes))
+
+	def probe_node(self, node_name):
+		boot_op = self.ssh_command_exec('cd A8;', node_name, self.PROBE_TIMEOUT)
+		return boot_op != self.CMD_ERROR
 
 	def start(self):
 		print("OTBox startup commencing...")
 		self.boot_wait()
+		self.launch()
+
+	def launch(self):
+		# The dependencies of otbox.py are installed once for all the nodes, by the first one if they are missing
+		if self.booted_nodes:
+			self.bundle = self.provisioner.ensure_bundle(box_id(self.booted_nodes[0]))
+
+		# otbox.py is launched on all booted nodes at once, each node reporting its own outcome
+		with span('otbox.launch', nodes=len(self.booted_nodes)) as traced:
+			self.launch_results = run_parallel(self.launch_otbox, self.booted_nodes, self.LAUNCH_CONCURRENCY)
+			self.active_nodes   = [result['node'] for result in self.launch_results if result['success']]
+			traced.set(active=len(self.active_nodes))
 
+		print("OTBox active on {0}/{1} nodes".format(len(self.active_nodes), len(self.booted_nodes)))
+		return self.active_nodes
+
+	def launch_otbox(self, node):
+		node_name = box_id(node)
+		print("Starting otbox.py on " + node_name + "...")
+
+		started = time.time()
 		try:
-			for ind, node in enumerate(self.booted_nodes):
-				node_name = 'node-' + node.split('.')[0]
-				print("Starting otbox.py on " + node_name + "...")
-                                self.ssh_command_exec('ssh -o "StrictHostKeyChecking no" root@' + node_name + ' "source /etc/profile; cd A8; cd opentestbed; pip install requests; killall python; python otbox.py --testbed=iotlab --broker=broker.mqttdashboard.com >& otbox-' + node_name + '.log &"')
-				self.active_nodes.append(node)
-				self.socketIoHandler.publish('NODE_ACTIVE', node_name)
-		except:
+			python = 'python'
+			if self.bundle is not None:
+				python = 'PYTHONPATH=' + self.bundle + ' python'
+			else:
+				# Without the bundle every node installs the dependencies, its failure does not stop the launch
+				with span('otbox.pip_install', node=node_name):
+					self.ssh_command_exec('source /etc/profile; pip install ' + ' '.join(self.provisioner.requirements), node_name)
+			with span('otbox.start', node=node_name):
+				output = self.ssh_command_exec('source /etc/profile; cd A8; cd opentestbed; killall python 2>/dev/null; ' + python + ' otbox.py --testbed=iotlab --broker=broker.mqttdashboard.com >& otbox-' + node_name + '.log &', node_name)
+			success = output != self.CMD_ERROR
+		except Exception, e:
+			print("Exception happened on " + node_name + ": " + str(e))
+			success = False
+
+		result = {
+			'node'    : node,
+			'success' : success,
+			'elapsed' : time.time() - started
+		}
+
+		if success:
+			self.socketIoHandler.publish('NODE_ACTIVE', node_name)
+		else:
 			self.socketIoHandler.publish('NODE_ACTIVE_FAIL', node_name)
-			print("Exception happened!")
\ No newline at end of file
+
+		return result
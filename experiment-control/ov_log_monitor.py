@@ -1,77 +1,142 @@
 from socket_io_handler import SocketIoHandler
 from exp_terminate import ExpTerminate
+from experiment import Experiment
+from log_tailer import LogTailer
+from log_batcher import LogBatcher
+from metrics_stream import MetricsStream
+from ov_supervisor import wait_for_port
+from scheduler import Scheduler, monotonic
+from tracer import span
 
 import time
-import subprocess
 import json
 import os
 import threading
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
-socketIoHandler = SocketIoHandler()
-
-logDir = os.path.join(os.path.dirname(__file__), "..", "openvisualizer", "build", "runui")
-
 class MyHandler(FileSystemEventHandler):
 
-	def __init__(self):
+	def __init__(self, experiment, policy=LogBatcher.COALESCE):
+		self.experiment = experiment
+		self.socketIoHandler = SocketIoHandler.for_experiment(experiment)
 		self.last_timestamp = 0.0
-		self.unix_timestamp = time.time()
-		self.SHUT_DOWN_TIME = 20 #Max time since the last data, indicating that the experiment is over
-		self.check_timestamp()
+		self.last_activity = monotonic()
+		self.tailer = LogTailer()
+		self.batcher = LogBatcher(self.socketIoHandler.publish, policy)
+		self.metrics = MetricsStream()
 
 	def on_modified(self, event):
-		try:
-			last_line = self.get_last_line(event.src_path)
-			last_line_timestamp = float(json.loads(last_line)['_timestamp'])
+		if event.is_directory:
+			return
 
-			if last_line_timestamp > self.last_timestamp:
-				#print("event type: " + str(event.event_type) + " path : " + str(event.src_path))
-				socketIoHandler.publish('LOG_MODIFICATION', last_line)
-				self.last_timestamp = last_line_timestamp
-				self.unix_timestamp = time.time()
+		for line in self.tailer.read(event.src_path):
+			self.on_record(line)
 
-		except Exception, e:
-			socketIoHandler.publish('LOG_MODIFICATION', str(e))
+	def on_created(self, event):
+		self.on_modified(event)
 
+	def on_moved(self, event):
+		# A rotated log keeps being followed under its new name
+		if not event.is_directory:
+			for line in self.tailer.read(event.dest_path):
+				self.on_record(line)
 
-	def check_timestamp(self):
-	    threading.Timer(5, self.check_timestamp).start() # called every minute
-	    if time.time() - self.unix_timestamp > self.SHUT_DOWN_TIME:
-	    	socketIoHandler.publish('EXP_TERMINATE', '')
-	    	ExpTerminate().exp_terminate()
+	def on_record(self, line):
+		try:
+			record = json.loads(line)
+			timestamp = float(record['_timestamp'])
+		except (ValueError, KeyError, TypeError):
+			return # not an event record, e.g. the plain-text OpenVisualizer log in the same directory
 
-	def get_last_line(self, file_path):
-		if os.path.isfile(file_path):
-			return subprocess.check_output(['tail', '-1', file_path])
-		else:
-			return ""
+		self.batcher.put(record, self.coalesce_key(record))
+		self.metrics.add(record)
+		self.last_timestamp = max(self.last_timestamp, timestamp)
+		self.last_activity = monotonic()
+
+	def coalesce_key(self, record):
+		# Under backpressure only the latest value of a metric is kept for each mote
+		mote_info = record.get('_mote_info')
+		serial = mote_info.get('serial') if isinstance(mote_info, dict) else None
+		return (record.get('_type'), serial)
 
 
 class OVLogMonitor:
 
-	def __init__(self):
-		self.event_handler = MyHandler()
+	OV_READY_TIMEOUT   = 300 # s
+	IDLE_TIMEOUT       = 20  # s without any record, after which the experiment is considered over
+	CHECK_INTERVAL     = 5   # s
+	PERSIST_INTERVAL   = 5   # s
+	HEARTBEAT_INTERVAL = 10  # s
+
+	def __init__(self, policy=LogBatcher.COALESCE, experiment=None, idle_timeout=None, scheduler=None):
+		self.experiment = experiment if experiment is not None else Experiment.load()
+		self.event_handler = MyHandler(self.experiment, policy)
 		self.observer = Observer()
+		self.idle_timeout = idle_timeout if idle_timeout is not None else self.IDLE_TIMEOUT
+		self.scheduler = scheduler if scheduler is not None else Scheduler.get()
+		self.idle = threading.Event()
+
+	def idle_time(self):
+		return monotonic() - self.event_handler.last_activity
+
+	def check_activity(self):
+		if self.idle_time() > self.idle_timeout:
+			self.idle.set()
 
+	def persist(self):
+		with span('monitor.persist'):
+			self.event_handler.metrics.persist(self.experiment.metrics_dir)
+
+	def heartbeat(self):
+		self.event_handler.socketIoHandler.publish('MONITOR_HEARTBEAT', {
+			'idle'    : round(self.idle_time(), 1),
+			'records' : self.event_handler.batcher.stats
+		})
+
+	# Returns once the experiment is over (no record for idle_timeout) and terminated, or on Ctrl-C
 	def start(self):
+		# Monitoring starts once OpenVisualizer is up, the time without data is counted from then
+		with span('monitor.wait_ov', port=self.experiment.ov_port):
+			ov_ready = wait_for_port(self.experiment.ov_port, self.OV_READY_TIMEOUT)
+		if not ov_ready:
+			print("OpenVisualizer is not listening on port " + str(self.experiment.ov_port))
+			ExpTerminate(self.experiment).exp_terminate()
+			return
+
+		logDir = self.experiment.log_dir
 		if os.path.exists(logDir):
+			self.experiment.add_process(os.getpid()) # stopped with the run
+			self.event_handler.tailer.skip_existing(logDir)
+			self.event_handler.last_activity = monotonic()
 			self.observer.schedule(self.event_handler, path=logDir, recursive=False)
 			self.observer.start()
 
-			try:
-				while True:
-					time.sleep(1)
-			except KeyboardInterrupt:
-				self.observer.stop()
-
+			tasks = [
+				self.scheduler.every(self.CHECK_INTERVAL, self.check_activity),
+				self.scheduler.every(self.PERSIST_INTERVAL, self.persist),
+				self.scheduler.every(self.HEARTBEAT_INTERVAL, self.heartbeat)
+			]
+			with span('monitor.follow') as traced:
+				try:
+					while not self.idle.is_set():
+						time.sleep(1)
+				except KeyboardInterrupt:
+					pass
+				traced.set(records=self.event_handler.batcher.stats['received'])
+
+			for task in tasks:
+				task.cancel()
+			self.observer.stop()
 			self.observer.join()
+			self.event_handler.batcher.close() # the last records reach the UI before the termination
+			self.persist()
+
+			if self.idle.is_set():
+				self.event_handler.socketIoHandler.publish('EXP_TERMINATE', '')
+				self.event_handler.socketIoHandler.emitter.flush()
+				ExpTerminate(self.experiment).exp_terminate()
 
 		else:
 			print("The path designated for monitoring does not exist.")
-			ExpTerminate().exp_terminate()
-
-
-
-
+			ExpTerminate(self.experiment).exp_terminate()
@@ -1,16 +1,41 @@
-import subprocess
 import os
+import signal
 from distutils import spawn as s
 
+from experiment import Experiment
+from ov_supervisor import OVSupervisor
+from socket_io_handler import SocketIoHandler
+
 # OpenVisualizer (scons) needs to run with sudo privileges.
 # This creates a problem with dependencies if Python is executed within a virtualenv, as using sudo will bypass the environment variables
 # Therefore, we explicitly invoke scons using the Python path from the virtualenv before sudo is invoked
-pythonPath = s.find_executable("python")
-sconsPath = s.find_executable("scons")
-
-ovDir = os.path.join(os.path.dirname(__file__), "..", "openvisualizer")
+# (looked up when OV is started rather than when this module is imported)
 
 class OVStartup:
 
+	def __init__(self, experiment=None, publish=None):
+		self.experiment = experiment if experiment is not None else Experiment.load()
+		self.publish    = publish if publish is not None else SocketIoHandler.for_experiment(self.experiment).publish
+
+	def command(self):
+		# Each run has its own OpenVisualizer tree and port
+		pythonPath = s.find_executable("python")
+		sconsPath = s.find_executable("scons")
+		return ['sudo', pythonPath, sconsPath, 'runweb', '--port=' + str(self.experiment.ov_port), '--testbed=iotlab', '--broker=broker.mqttdashboard.com', '--root=random']
+
+	# Returns the supervisor of the OpenVisualizer process, use its wait_ready() before relying on OV
 	def start(self):
-		subprocess.Popen(['sudo', pythonPath, sconsPath, 'runweb', '--port=8080', '--testbed=iotlab', '--broker=broker.mqttdashboard.com', '--root=random'], cwd=ovDir, stdin=subprocess.PIPE, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+		return OVSupervisor(self.experiment, self.command(), self.publish, cwd=self.experiment.ov_dir).start()
+
+	# Supervises OpenVisualizer until it is stopped (Ctrl-C, termination of the run) or cannot be kept running
+	def run(self):
+		supervisor = self.start()
+		# Terminating the run stops this process too, and with it the supervision
+		self.experiment.add_process(os.getpid())
+		signal.signal(signal.SIGTERM, lambda signum, frame: supervisor.stop())
+		try:
+			while not supervisor.done.wait(1):
+				pass
+		except KeyboardInterrupt:
+			supervisor.stop()
+		return supervisor.state
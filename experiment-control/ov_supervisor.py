@@ -0,0 +1,190 @@
+import collections
+import os
+import random
+import signal
+import socket
+import subprocess
+import threading
+import time
+
+from log_batcher import LogBatcher
+from tracer import span
+
+# Runs OpenVisualizer for one experiment and keeps it running.
+# Its stdout and stderr are drained continuously by one reader thread each, so that OV never blocks on a full pipe,
+# and every line is forwarded to the UI as an event {'stream', 'line', 'pid', 'time'} (batched, see LogBatcher).
+# A crash is restarted after a pause growing from RESTART_MIN to RESTART_MAX, reset once OV ran for STABLE_TIME.
+# After MAX_RESTARTS crashes in a row without OV ever becoming stable the supervisor gives up.
+# OV is ready once its web port accepts connections. The state changes are published as OV_STATE:
+#   starting, ready, crashed (with the return code and the last lines of stderr), failed, stopped
+
+def port_open(port, timeout=1, host='localhost'):
+	try:
+		socket.create_connection((host, port), timeout).close()
+		return True
+	except socket.error:
+		return False
+
+# Returns False if nothing listens on port after timeout, or if stopped() turns True before
+def wait_for_port(port, timeout, poll=0.5, stopped=lambda: False):
+	deadline = time.time() + timeout
+	while not stopped():
+		if port_open(port, poll):
+			return True
+		if time.time() >= deadline:
+			return False
+		time.sleep(poll)
+	return False
+
+
+class OVSupervisor:
+
+	STARTING      = 'starting'
+	READY         = 'ready'
+	CRASHED       = 'crashed'
+	FAILED        = 'failed'
+	STOPPED       = 'stopped'
+
+	OUTPUT_TOPIC  = 'OV_OUTPUT_BATCH'
+	RESTART_MIN   = 1   # s
+	RESTART_MAX   = 30  # s
+	STABLE_TIME   = 60  # s of running after which OV is no longer considered crashing
+	MAX_RESTARTS  = 5
+	READY_POLL    = 0.5 # s
+	STOP_TIMEOUT  = 10  # s for OV to exit on SIGTERM
+	TAIL_LINES    = 20
+	DRAIN_TIMEOUT = 1   # s for the readers to reach the end of the pipes once OV exited
+
+	def __init__(self, experiment, args, publish, cwd=None, restart_min=RESTART_MIN, restart_max=RESTART_MAX, stable_time=STABLE_TIME, max_restarts=MAX_RESTARTS):
+		self.experiment   = experiment
+		self.args         = args
+		self.publish      = publish # publish(topic, message)
+		self.cwd          = cwd
+		self.port         = experiment.ov_port
+		self.restart_min  = restart_min
+		self.restart_max  = restart_max
+		self.stable_time  = stable_time
+		self.max_restarts = max_restarts
+
+		self.output       = LogBatcher(publish, LogBatcher.DROP_OLDEST, self.OUTPUT_TOPIC)
+		self.stderr_tail  = collections.deque(maxlen=self.TAIL_LINES)
+
+		self.process      = None
+		self.group        = None # recorded process group of OV, what stop() signals
+		self.state        = None
+		self.restarts     = 0
+		self.stopping     = False
+		self.ready        = threading.Event()
+		self.done         = threading.Event() # set once OV is stopped or the supervisor gave up
+		self.condition    = threading.Condition()
+		self.thread       = None
+		self.readers      = []
+
+	def set_state(self, state, **details):
+		self.state = state
+		details.update(state=state, pid=self.process.pid if self.process is not None else None, restarts=self.restarts)
+		print("OpenVisualizer " + state)
+		self.publish('OV_STATE', details)
+
+	def start(self):
+		self.experiment.on_terminate.append(self.release)
+		self.thread = threading.Thread(target=self.run)
+		self.thread.daemon = True
+		self.thread.start()
+		return self
+
+	def run(self):
+		pause = self.restart_min
+		while True:
+			started = time.time()
+			with self.condition:
+				if self.stopping:
+					break
+				self.launch()
+
+			self.process.wait()
+			self.ready.clear()
+			for reader in self.readers:
+				reader.join(self.DRAIN_TIMEOUT) # its last lines come before the crash report
+			if self.stopping:
+				break
+
+			if time.time() - started >= self.stable_time:
+				self.restarts, pause = 0, self.restart_min
+			self.set_state(self.CRASHED, returncode=self.process.returncode, stderr=list(self.stderr_tail))
+			if self.restarts >= self.max_restarts:
+				self.set_state(self.FAILED)
+				break
+
+			with self.condition:
+				self.condition.wait(pause * random.uniform(0.5, 1.0))
+			pause = min(pause * 2, self.restart_max)
+			self.restarts += 1
+
+		if self.stopping:
+			self.set_state(self.STOPPED)
+		self.output.close()
+		self.done.set()
+
+	def launch(self):
+		with open(os.devnull) as devnull:
+			process = self.experiment.spawn(self.args, cwd=self.cwd, stdin=devnull, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
+		self.group   = self.experiment.process_entry(process.pid, True) # taken before the process can be reaped
+		self.process = process
+		self.stderr_tail.clear()
+		self.set_state(self.STARTING)
+
+		self.readers = []
+		for stream, pipe in [('stdout', self.process.stdout), ('stderr', self.process.stderr)]:
+			reader = threading.Thread(target=self.drain, args=(self.process, stream, pipe))
+			reader.daemon = True
+			reader.start()
+			self.readers.append(reader)
+
+		probe = threading.Thread(target=self.probe, args=(self.process,))
+		probe.daemon = True
+		probe.start()
+
+	def drain(self, process, stream, pipe):
+		for line in iter(pipe.readline, ''):
+			line = line.rstrip('\n')
+			if stream == 'stderr':
+				self.stderr_tail.append(line)
+			self.output.put({'stream': stream, 'line': line, 'pid': process.pid, 'time': time.time()})
+		pipe.close()
+
+	def probe(self, process):
+		# process.returncode is set once run() waited for the process, polling it here would race with that wait
+		with span('ov.startup', port=self.port, attempt=self.restarts) as traced:
+			ready = wait_for_port(self.port, float('inf'), self.READY_POLL, lambda: process.returncode is not None or self.stopping)
+			traced.set(ready=ready)
+		if ready:
+			self.ready.set()
+			self.set_state(self.READY)
+
+	# Returns False if OV is not listening after timeout, or if the supervisor gave up or was stopped before
+	def wait_ready(self, timeout):
+		deadline = time.time() + timeout
+		while not self.ready.is_set() and not self.done.is_set() and time.time() < deadline:
+			self.ready.wait(min(self.READY_POLL, max(0, deadline - time.time())))
+		return self.ready.is_set()
+
+	# OV is about to be stopped by someone else, it must not be restarted
+	def release(self):
+		with self.condition:
+			self.stopping = True
+			self.condition.notify_all()
+
+	def stop(self, timeout=STOP_TIMEOUT):
+		self.release()
+		process = self.process
+
+		if process is None:
+			return
+		# The supervising thread waits on the process, and ends once it exited
+		group = [self.group]
+		self.experiment.signal(signal.SIGTERM, group)
+		self.thread.join(timeout)
+		if self.thread.is_alive():
+			self.experiment.signal(signal.SIGKILL, group)
+			self.thread.join(timeout)
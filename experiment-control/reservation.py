@@ -1,97 +1,144 @@
 from socket_io_handler import SocketIoHandler
 from exp_terminate import ExpTerminate
+from ssh_pool import SshPool
+from command_executor import CommandExecutor
+from reservation_watcher import ReservationWatcher
+from node_inventory import NodeInventory
+from tracer import span
 
-import paramiko
 import json
-import time
 
 class Reservation:
 
 	CMD_ERROR = "cmd_error"
 	SSH_RETRY_TIME = 120
-	RETRY_PAUSE = 10
 
-	def __init__(self, user, domain):
+	def __init__(self, user, domain, ssh_pool=None, experiment=None):
 		self.user = user
 		self.domain = domain
+		self.experiment = experiment # scopes the iotlab-experiment commands and the UI events to one run
+		self.inventory = NodeInventory(experiment) if experiment is not None else None
 
-		self.socketIoHandler = SocketIoHandler()
+		self.socketIoHandler = SocketIoHandler.for_experiment(experiment)
 
-		self.client = paramiko.SSHClient()
-		self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-		self.client.load_system_host_keys()
+		self.ssh_pool = ssh_pool if ssh_pool is not None else SshPool.get(user, domain)
+		self.executor = CommandExecutor(self.ssh_pool, self.socketIoHandler.publish)
 
 		self.ssh_connect()
 
 	def ssh_connect(self):
-		self.client.connect(self.domain, username=self.user)
+		self.ssh_pool.connect()
 
 	def ssh_disconnect(self):
-		self.client.close()
+		self.ssh_pool.close()
 
 	def ssh_command_exec(self, command):
-		try:
-			stdin, stdout, stderr = self.client.exec_command(command)
-			stdin.close()
-
-			output = []
-			for line in stdout.read().splitlines():
-				output.append(line)
-
-			error = []
-			for line in stderr.read().splitlines():
-				error.append(line)
+		result = self.executor.run(command)
 
-			if len(error) > 0:
-				print("Error: " + ''.join(error))
-				raise Exception(self.CMD_ERROR)
-
-			return ''.join(output)
-
-		except:
+		if not result.success():
+			print("Error: " + ''.join(result.error))
 			return self.CMD_ERROR
 
+		return ''.join(result.output)
+
+	def iotlab_command(self, command):
+		if self.experiment is not None and self.experiment.iotlab_id is not None:
+			command += ' -i ' + str(self.experiment.iotlab_id)
+		return 'iotlab-experiment ' + command
 
 	def reserve_experiment(self, duration, nodes):
-		if self.check_experiment():
+		if self.experiment_exists():
 			self.socketIoHandler.publish('NODE_RESERVATION', 'Experiment exists')
 		else:
-			output = self.ssh_command_exec('iotlab-experiment submit -n a8_exp -d ' + str(duration) + ' -l ' + nodes)
+			name = self.experiment.exp_id if self.experiment is not None else 'a8_exp'
+			with span('reservation.submit', nodes=nodes, duration=duration):
+				output = self.ssh_command_exec('iotlab-experiment submit -n ' + name + ' -d ' + str(duration) + ' -l ' + nodes)
 			if output != self.CMD_ERROR:
 				self.experiment_id = json.loads(output)['id']
+				if self.experiment is not None:
+					self.inventory.invalidate()
+					self.experiment.update(iotlab_id=self.experiment_id, reserved=[])
 				self.socketIoHandler.publish('NODE_RESERVATION', 'All nodes reserved')
 
+	def experiment_exists(self):
+		if self.experiment is None:
+			return self.check_experiment()
+		# Only the IoT-LAB experiment of this run counts, the other runs may have theirs
+		if self.running_reservation() is not None:
+			return True
+		return self.experiment.iotlab_id is not None and self.get_state() not in [None] + ReservationWatcher.FAILED
+
+
+	def get_state(self):
+		output = self.ssh_command_exec(self.iotlab_command('get -s'))
+		if output == self.CMD_ERROR:
+			return None
+		try:
+			return json.loads(output)['state']
+		except (ValueError, KeyError):
+			return None
+
+	# iotlab-experiment get -p, from the inventory of the run while it is fresh, None if the frontend could not tell
+	def get_reservation(self):
+		reservation = self.inventory.reservation() if self.inventory is not None else None
+		return reservation if reservation is not None else self.fetch_reservation()
+
+	def fetch_reservation(self):
+		output = self.ssh_command_exec(self.iotlab_command('get -p'))
+		if output == self.CMD_ERROR:
+			return None
+		try:
+			reservation = json.loads(output)
+		except ValueError:
+			return None
+		if self.inventory is not None:
+			self.inventory.store(reservation)
+		return reservation
+
+	# The reservation in the inventory if the experiment was running when it was fetched
+	def running_reservation(self):
+		reservation = self.inventory.reservation() if self.inventory is not None else None
+		if reservation is not None and reservation.get('state') == ReservationWatcher.RUNNING:
+			return reservation
+		return None
 
 	def get_reserved_nodes(self, logging):
-		retries = 0
-		num_of_retries = self.SSH_RETRY_TIME / self.RETRY_PAUSE
+		# Returns as soon as the experiment is Running, or an empty list if it cannot run
+		reservation = self.running_reservation()
+		if reservation is None:
+			with span('reservation.wait_running') as traced:
+				result = ReservationWatcher(self.get_state, self.socketIoHandler.publish, self.SSH_RETRY_TIME).watch()
+				traced.set(state=result['state'])
 
-		json_output = []
+			reservation = self.fetch_reservation() if result['success'] else None
+			if reservation is None:
+				print("Experiment not running: " + str(result['state']))
+				self.socketIoHandler.publish('RESERVATION_FAIL', str(result['state']))
+				return []
 
-		while True:
+			if logging:
+				print("Experiment running after {0:.1f} s ({1})".format(result['elapsed'], ", ".join("{0} {1:.1f} s".format(state, duration) for state, duration in result['durations'].items())))
 
-			output = self.ssh_command_exec('iotlab-experiment get -p')
+		nodes = reservation['nodes']
+		if self.experiment is not None and self.experiment.reserved != nodes:
+			self.experiment.update(reserved=nodes)
 
-			if output != self.CMD_ERROR:
-				json_output = json.loads(output)['nodes']
-				break
-			elif retries <= num_of_retries:
-				self.socketIoHandler.publish('RESERVATION_STATUS_RETRY', str(retries) + "/" + str(num_of_retries))
-				retries += 1
-				time.sleep(self.RETRY_PAUSE)
-			else:
-				self.socketIoHandler.publish('RESERVATION_FAIL', str(retries) + "/" + str(num_of_retries))
-				break
-
-		self.socketIoHandler.publish('RESERVATION_SUCCESS', output)
-		return json_output
+		self.socketIoHandler.publish('RESERVATION_SUCCESS', reservation)
+		return nodes
 
 	def check_experiment(self):
-		output = self.ssh_command_exec('iotlab-experiment get -p')
-		print("Experiment check: " + output)
-		return output != self.CMD_ERROR
+		reservation = self.get_reservation()
+		print("Experiment check: " + (json.dumps(reservation) if reservation is not None else self.CMD_ERROR))
+		return reservation is not None
+
+	# Stops the IoT-LAB experiment only, which frees its nodes for the next one
+	def stop_experiment(self):
+		self.ssh_command_exec(self.iotlab_command('stop'))
+		if self.experiment is not None:
+			self.inventory.invalidate()
+			self.experiment.update(iotlab_id=None, reserved=[])
 
 	def terminate_experiment(self):
-		self.ssh_command_exec('iotlab-experiment stop')
+		self.stop_experiment()
 		self.socketIoHandler.publish('EXP_TERMINATE', '')
-		ExpTerminate().exp_terminate()
+		ExpTerminate(self.experiment).exp_terminate()
@@ -0,0 +1,64 @@
+import random
+import time
+
+# Follows the state of an IoT-LAB experiment (iotlab-experiment get -s) until its nodes are Running.
+# Polls are spaced by an exponential backoff with jitter while the experiment waits to be scheduled, and kept at
+# POLL_MIN once it is launching, as Running is then expected any moment. The time spent in each state is reported.
+
+class ReservationWatcher:
+
+	RUNNING     = 'Running'
+	LAUNCHING   = ['toLaunch', 'Launching']
+	FAILED      = ['Terminated', 'Error', 'toError', 'Stopped']
+
+	DEADLINE    = 600 # s
+	POLL_MIN    = 1
+	POLL_MAX    = 15
+	BACKOFF     = 1.5
+	JITTER      = 0.2 # fraction of the pause
+
+	def __init__(self, query_state, publish, deadline=DEADLINE, poll_min=POLL_MIN, poll_max=POLL_MAX, backoff=BACKOFF, jitter=JITTER):
+		self.query_state = query_state # query_state() -> state name, or None if the frontend could not tell
+		self.publish     = publish     # publish(topic, message)
+		self.deadline    = deadline
+		self.poll_min    = poll_min
+		self.poll_max    = poll_max
+		self.backoff     = backoff
+		self.jitter      = jitter
+
+	def watch(self):
+		started    = time.time()
+		deadline   = started + self.deadline
+		pause      = self.poll_min
+		state      = None
+		entered_at = started
+		durations  = {}
+		polls      = 0
+
+		while True:
+			polls += 1
+			new_state = self.query_state()
+			now = time.time()
+
+			if new_state != state:
+				if state is not None:
+					durations[state] = durations.get(state, 0) + now - entered_at
+					print("Experiment {0} for {1:.1f} s".format(state, now - entered_at))
+				if new_state is not None:
+					self.publish('RESERVATION_STATE', new_state)
+				state, entered_at = new_state, now
+				pause = self.poll_min
+
+			if state == self.RUNNING or state in self.FAILED or now >= deadline:
+				return {
+					'state'     : state,
+					'success'   : state == self.RUNNING,
+					'durations' : durations,
+					'polls'     : polls,
+					'elapsed'   : now - started
+				}
+
+			self.publish('RESERVATION_STATUS_RETRY', "{0} ({1:.0f} s)".format(state, now - entered_at))
+			time.sleep(min(pause * random.uniform(1 - self.jitter, 1 + self.jitter), max(0, deadline - now)))
+			if state not in self.LAUNCHING:
+				pause = min(pause * self.backoff, self.poll_max)
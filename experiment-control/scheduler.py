@@ -0,0 +1,138 @@
+import atexit
+import ctypes
+import ctypes.util
+import heapq
+import itertools
+import os
+import select
+import threading
+import time
+
+# One thread per process runs all the timed work (inactivity checks, heartbeats, periodic stats) from a heap of
+# tasks ordered by due time, instead of one threading.Timer thread per tick.
+# Due times are taken from a monotonic clock, so that a change of the system time neither fires nor delays them.
+# The thread sleeps in select() on a pipe until the next due time, and is woken up through the pipe when an earlier
+# task is added: unlike Condition.wait(timeout) on Python 2, which polls every 50 ms, an idle scheduler costs no CPU.
+
+CLOCK_MONOTONIC = 1 # linux/time.h
+
+
+class timespec(ctypes.Structure):
+	_fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+try:
+	from time import monotonic
+except ImportError:
+	try:
+		clock_gettime = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True).clock_gettime
+		clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+		def monotonic():
+			t = timespec()
+			if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+				raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+			return t.tv_sec + t.tv_nsec * 1e-9
+	except (OSError, AttributeError):
+		monotonic = time.time # no clock_gettime on this platform
+
+
+class Task:
+
+	def __init__(self, callback, args, interval):
+		self.callback  = callback
+		self.args      = args
+		self.interval  = interval # None: runs once
+		self.cancelled = False
+
+	def cancel(self):
+		self.cancelled = True
+
+
+class Scheduler:
+
+	scheduler      = None
+	scheduler_lock = threading.Lock()
+
+	@classmethod
+	def get(cls):
+		with cls.scheduler_lock:
+			if cls.scheduler is None:
+				cls.scheduler = cls()
+				atexit.register(cls.scheduler.close)
+			return cls.scheduler
+
+	def __init__(self):
+		self.tasks   = [] # heap of (due, seq, task)
+		self.seq     = itertools.count()
+		self.lock    = threading.Lock()
+		self.closed  = False
+		self.thread  = None
+		self.wakeup_read, self.wakeup_write = os.pipe()
+
+	# Runs callback(*args) once after delay seconds
+	def schedule(self, delay, callback, *args):
+		return self.add(Task(callback, args, None), delay)
+
+	# Runs callback(*args) every interval seconds, first after delay (default: interval)
+	def every(self, interval, callback, *args, **kwargs):
+		delay = kwargs.get('delay', interval)
+		return self.add(Task(callback, args, interval), delay)
+
+	def add(self, task, delay):
+		with self.lock:
+			if self.thread is None:
+				self.thread = threading.Thread(target=self.run)
+				self.thread.daemon = True
+				self.thread.start()
+			due = monotonic() + delay
+			earliest = not self.tasks or due < self.tasks[0][0]
+			heapq.heappush(self.tasks, (due, next(self.seq), task))
+		if earliest:
+			self.wake()
+		return task
+
+	def wake(self):
+		try:
+			os.write(self.wakeup_write, 'x')
+		except OSError:
+			pass # closed
+
+	def run(self):
+		while True:
+			with self.lock:
+				if self.closed:
+					break
+				now = monotonic()
+				due_tasks = []
+				while self.tasks and (self.tasks[0][0] <= now or self.tasks[0][2].cancelled):
+					due, seq, task = heapq.heappop(self.tasks)
+					if not task.cancelled:
+						due_tasks.append((due, task))
+				timeout = self.tasks[0][0] - now if self.tasks else None
+
+			for due, task in due_tasks:
+				try:
+					task.callback(*task.args)
+				except Exception, e:
+					print("Scheduled task " + getattr(task.callback, '__name__', str(task.callback)) + " failed: " + str(e))
+
+				if task.interval is not None and not task.cancelled:
+					# Next run on the interval grid, ticks missed while the callback ran are skipped
+					now = monotonic()
+					next_due = due + task.interval
+					if next_due <= now:
+						next_due += ((now - next_due) // task.interval + 1) * task.interval
+					self.add(task, next_due - now)
+
+			if due_tasks:
+				continue
+			readable, _, _ = select.select([self.wakeup_read], [], [], timeout)
+			if readable:
+				os.read(self.wakeup_read, 4096)
+
+	def close(self):
+		with self.lock:
+			self.closed = True
+		self.wake()
+		if self.thread is not None and self.thread is not threading.current_thread():
+			self.thread.join(1)
@@ -1,12 +1,180 @@
-from socketIO_client_nexus import SocketIO
+import atexit
+import collections
+import random
+import threading
+import time
 
-class SocketIoHandler:
+# Events for the web UI go through one emitter per process. publish() only appends the event to an in-memory buffer,
+# a background thread connects to the Socket.IO relay and emits the buffered events in order. While the relay is
+# unavailable the events stay buffered (the oldest ones are dropped past MAX_BUFFER) and the connection is retried
+# with an exponential backoff. What is still buffered when the process exits is flushed for up to FLUSH_TIMEOUT.
+# No connection is made before the first event, unless warm_up() asks for it, e.g. while an action loads its modules.
+#
+# Every event is emitted to the relay as one Socket.IO 'event' carrying an envelope:
+#   {'topic', 'payload', 'exp': experiment id, 'channel': Socket.IO channel of the experiment, 'seq', 'ts'}
+# seq numbers the events of the emitter, so that a receiver can tell lost events from late ones, and ts is the time
+# of publish(). The relay routes envelopes on their channel whatever their topic, so a new kind of event needs no
+# relay change (it only re-emits the topics the compiled UI bundle subscribes to, see nodejs_websocket/index.js).
+# The payload may be any JSON-serializable value: it is encoded once, by the transport, so it should not be
+# JSON-encoded beforehand.
+
+class SocketIoEmitter:
 
-	SOCKET_IO_URL = 'http://localhost'
+	SOCKET_IO_URL  = 'http://localhost'
 	SOCKET_IO_PORT = 3000
+	EVENT          = 'event'
+
+	MAX_BUFFER     = 10000
+	RETRY_MIN      = 0.5 # s
+	RETRY_MAX      = 30  # s
+	FLUSH_TIMEOUT  = 5   # s
+
+	emitter        = None
+	emitter_lock   = threading.Lock()
+
+	@classmethod
+	def get(cls):
+		with cls.emitter_lock:
+			if cls.emitter is None:
+				cls.emitter = cls()
+				atexit.register(cls.emitter.close)
+			return cls.emitter
+
+	def __init__(self, connect=None, max_buffer=MAX_BUFFER, retry_min=RETRY_MIN, retry_max=RETRY_MAX):
+		self.connect_relay = connect or self.connect
+		self.max_buffer    = max_buffer
+		self.retry_min     = retry_min
+		self.retry_max     = retry_max
+
+		self.socketIO      = None
+		self.buffer        = collections.deque() # envelopes
+		self.seq           = 0
+		self.closed        = False
+		self.condition     = threading.Condition()
+		self.thread        = None
+
+		self.stats         = {'published': 0, 'emitted': 0, 'dropped': 0, 'failures': 0}
+
+	def connect(self):
+		from socketIO_client_nexus import SocketIO
+		return SocketIO(self.SOCKET_IO_URL, self.SOCKET_IO_PORT, wait_for_connection=False)
+
+	# Called with the condition held
+	def start(self, warm=False):
+		if self.thread is None:
+			self.thread = threading.Thread(target=self.run, args=(warm,))
+			self.thread.daemon = True
+			self.thread.start()
+
+	# Connects to the relay in the background, so that the first event does not wait for the connection
+	def warm_up(self):
+		with self.condition:
+			self.start(warm=True)
+
+	def publish(self, topic, message, channel=None, exp_id=None):
+		with self.condition:
+			self.start()
+
+			if len(self.buffer) >= self.max_buffer:
+				self.buffer.popleft()
+				self.stats['dropped'] += 1
+
+			self.buffer.append({
+				'topic'   : topic,
+				'payload' : message,
+				'exp'     : exp_id,
+				'channel' : channel,
+				'seq'     : self.seq,
+				'ts'      : time.time()
+			})
+			self.seq += 1
+			self.stats['published'] += 1
+			self.condition.notify()
+
+	def run(self, warm=False):
+		if warm:
+			try:
+				self.socketIO = self.connect_relay()
+			except Exception:
+				pass # retried with the first event
+
+		retry_pause = self.retry_min
+		while True:
+			with self.condition:
+				while not self.buffer and not self.closed:
+					self.condition.wait()
+				if not self.buffer:
+					break
+				event = self.buffer[0]
+
+			try:
+				if self.socketIO is None:
+					self.socketIO = self.connect_relay()
+				self.socketIO.emit(self.EVENT, event)
+			except Exception, e:
+				self.disconnect()
+				self.stats['failures'] += 1
+				if self.stats['failures'] == 1:
+					print("Socket.IO relay unavailable (" + str(e) + "), buffering UI events")
+
+				with self.condition:
+					if self.closed:
+						break
+					self.condition.wait(retry_pause * random.uniform(0.5, 1.0))
+				retry_pause = min(retry_pause * 2, self.retry_max)
+				continue
+
+			retry_pause = self.retry_min
+			with self.condition:
+				if self.buffer and self.buffer[0] is event:
+					self.buffer.popleft()
+				self.stats['emitted'] += 1
+				self.condition.notify_all()
+
+		self.disconnect()
+
+	def disconnect(self):
+		if self.socketIO is not None:
+			try:
+				self.socketIO.disconnect()
+			except Exception:
+				pass
+			self.socketIO = None
+
+	# Waits until the buffered events are emitted, returns False if some are left after timeout
+	def flush(self, timeout=FLUSH_TIMEOUT):
+		deadline = time.time() + timeout
+		with self.condition:
+			while self.buffer and self.thread is not None:
+				remaining = deadline - time.time()
+				if remaining <= 0:
+					return False
+				self.condition.wait(remaining)
+			return True
+
+	def close(self, timeout=FLUSH_TIMEOUT):
+		flushed = self.flush(timeout)
+		with self.condition:
+			self.closed = True
+			self.condition.notify_all()
+		if self.thread is not None:
+			self.thread.join(timeout)
+		if not flushed:
+			print(str(len(self.buffer)) + " UI events could not be delivered to the Socket.IO relay")
+
+
+class SocketIoHandler:
+
+	def __init__(self, channel=None, emitter=None, exp_id=None):
+		self.channel = channel
+		self.exp_id  = exp_id
+		self.emitter = emitter or SocketIoEmitter.get()
 
-	def __init__(self):
-		self.socketIO = SocketIO(self.SOCKET_IO_URL, self.SOCKET_IO_PORT)
+	@classmethod
+	def for_experiment(cls, experiment):
+		if experiment is None:
+			return cls()
+		return cls(experiment.channel, exp_id=experiment.exp_id)
 
 	def publish(self, topic, message):
-		self.socketIO.emit(topic, message)
\ No newline at end of file
+		self.emitter.publish(topic, message, self.channel, self.exp_id)
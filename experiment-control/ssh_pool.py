@@ -0,0 +1,131 @@
+import paramiko
+import socket
+import threading
+
+from tracer import span
+
+# One SSH transport to the testbed frontend per (user, domain, port), shared by every component of the process.
+# Commands are multiplexed as separate channels over that transport, and commands for a node go through a
+# long-lived jump-host connection (direct-tcpip channel through the frontend) that is kept open between commands.
+# Nodes are logged into with the credentials of the frontend (e.g. the user's key, which IoT-LAB installs on the
+# nodes). When the frontend refuses port forwarding, or the node does not accept our key, node commands fall back
+# to 'ssh root@node-X' executed on the frontend.
+
+class SshPool:
+
+	KEEPALIVE       = 30
+	CONNECT_TIMEOUT = 20
+	NODE_USER       = "root"
+	NODE_PORT       = 22
+
+	pools           = {}
+	pools_lock      = threading.Lock()
+
+	@classmethod
+	def get(cls, user, domain, port=22, **connect_kwargs):
+		key = (user, domain, port)
+		with cls.pools_lock:
+			if key not in cls.pools:
+				cls.pools[key] = cls(user, domain, port, **connect_kwargs)
+			return cls.pools[key]
+
+	def __init__(self, user, domain, port=22, **connect_kwargs):
+		self.user           = user
+		self.domain         = domain
+		self.port           = port
+		self.connect_kwargs = connect_kwargs
+
+		self.client         = None
+		self.node_clients   = {}
+		self.jump_hosts     = None # unknown until the first node command
+		self.lock           = threading.Lock()
+		self.jump_lock      = threading.Lock()
+
+	def connect(self):
+		with self.lock:
+			if self.client is not None and self.client.get_transport() is not None and self.client.get_transport().is_active():
+				return self.client
+
+			client = paramiko.SSHClient()
+			client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+			client.load_system_host_keys()
+			with span('ssh.connect', host=self.domain):
+				client.connect(self.domain, port=self.port, username=self.user, timeout=self.CONNECT_TIMEOUT, **self.connect_kwargs)
+			client.get_transport().set_keepalive(self.KEEPALIVE)
+
+			self.client = client
+			return client
+
+	def close(self):
+		with self.lock:
+			for client in self.node_clients.values():
+				client.close()
+			self.node_clients = {}
+
+			if self.client is not None:
+				self.client.close()
+				self.client = None
+
+	def exec_command(self, command):
+		return self.connect().exec_command(command)
+
+	def node_exec_command(self, node_name, command):
+		if self.jump_hosts is None:
+			# The first jump tells whether the frontend lets us through, the other threads wait for the verdict
+			with self.jump_lock:
+				if self.jump_hosts is None:
+					return self.jump_exec_command(node_name, command)
+
+		if self.jump_hosts:
+			return self.jump_exec_command(node_name, command)
+		return self.hop_exec_command(node_name, command)
+
+	def jump_exec_command(self, node_name, command):
+		try:
+			client = self.node_client(node_name)
+		except paramiko.ChannelException, e:
+			if e.code != paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED:
+				self.jump_hosts = True
+				raise # node not reachable (yet)
+			print("Port forwarding refused by " + self.domain + ", hopping through the frontend instead")
+			self.jump_hosts = False
+			return self.hop_exec_command(node_name, command)
+		except paramiko.AuthenticationException:
+			print("Key not accepted by " + node_name + ", hopping through the frontend instead")
+			self.jump_hosts = False
+			return self.hop_exec_command(node_name, command)
+
+		self.jump_hosts = True
+		try:
+			return client.exec_command(command)
+		except (paramiko.SSHException, socket.error):
+			self.drop_node(node_name)
+			raise
+
+	def hop_exec_command(self, node_name, command):
+		return self.exec_command('ssh -o "StrictHostKeyChecking no" ' + self.NODE_USER + '@' + node_name + ' "' + command + '"')
+
+	def node_client(self, node_name):
+		with self.lock:
+			client = self.node_clients.get(node_name)
+		if client is not None and client.get_transport() is not None and client.get_transport().is_active():
+			return client
+
+		with span('ssh.jump', node=node_name):
+			channel = self.connect().get_transport().open_channel('direct-tcpip', (node_name, self.NODE_PORT), ('127.0.0.1', 0), timeout=self.CONNECT_TIMEOUT)
+
+			client = paramiko.SSHClient()
+			client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+			client.connect(node_name, port=self.NODE_PORT, username=self.NODE_USER, sock=channel, timeout=self.CONNECT_TIMEOUT, **self.connect_kwargs)
+
+		with self.lock:
+			if node_name in self.node_clients:
+				self.node_clients[node_name].close()
+			self.node_clients[node_name] = client
+		return client
+
+	def drop_node(self, node_name):
+		with self.lock:
+			client = self.node_clients.pop(node_name, None)
+		if client is not None:
+			client.close()
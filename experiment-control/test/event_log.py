@@ -0,0 +1,11 @@
+# Stands in for a Socket.IO handler in the tests: records the events published, in order
+class EventLog:
+
+	def __init__(self):
+		self.events = []
+
+	def publish(self, topic, message):
+		self.events.append((topic, message))
+
+	def topics(self, topic):
+		return [message for name, message in self.events if name == topic]
@@ -1,12 +1,18 @@
 import subprocess
 import os
+import sys
 import time
 import json
 
 mainDir                   = os.path.join(os.path.dirname(__file__), "..")
 
-OV_START_PAUSE            = 20     # pause before starting OV
+sys.path.insert(0, mainDir)
+
+from experiment import Experiment
+from ov_supervisor import wait_for_port
+
 OV_MONITOR_START_PAUSE    = 20     # pause before starting OV log monitoring
+OV_READY_TIMEOUT          = 300    # s for OpenVisualizer to build and listen
 
 LOG_CHECK_PAUSE           = 5
 LOG_CHECK_RETRIES         = 15
@@ -18,8 +24,8 @@ def get_last_line(file_path):
 	else:
 		return ""
 
-def run_action(action):
-	pipe = subprocess.Popen(['python', 'main.py', '--action={0}'.format(action)], cwd=mainDir, stdin=subprocess.PIPE, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+def run_action(action, *args):
+	pipe = subprocess.Popen(['python', 'main.py', '--action={0}'.format(action)] + list(args), cwd=mainDir, stdin=subprocess.PIPE, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
 
 	res = pipe.communicate()
 	retcode = pipe.returncode
@@ -45,6 +51,10 @@ def check_ov_log():
 			time.sleep(LOG_CHECK_PAUSE)
 
 	return data_recieved
+
+def start_action(action, *args):
+	# Not waited for, its output goes to that of the tests rather than to pipes nobody reads
+	return subprocess.Popen(['python', 'main.py', '--action={0}'.format(action)] + list(args), cwd=mainDir)
 	
 
 
@@ -56,15 +66,30 @@ def test_otbox_startup():
 	assert run_action('otbox') == 0
 
 def test_firmware_flash():
-	assert run_action('otbox-flash') == 0
+	# Returns once every mote has acknowledged the firmware, OV can start right away
+	assert run_action('otbox-flash', '--flash-track') == 0
+
+# The ov-start action keeps supervising OpenVisualizer in the foreground until it is stopped
+ov_action = None
 
 def test_ov_start():
-	time.sleep(OV_START_PAUSE)
-	assert run_action('ov-start') == 0
+	global ov_action
+	ov_action = start_action('ov-start')
+	assert wait_for_port(Experiment.load().ov_port, OV_READY_TIMEOUT, stopped=lambda: ov_action.poll() is not None)
+	assert ov_action.poll() is None
 
 def test_ov_monitor():
-	time.sleep(OV_MONITOR_START_PAUSE)
-	assert check_ov_log() == True
+	try:
+		time.sleep(OV_MONITOR_START_PAUSE)
+		assert check_ov_log() == True
+	finally:
+		stop_ov()
+
+def stop_ov():
+	# SIGTERM stops OpenVisualizer, then the supervising action
+	if ov_action is not None and ov_action.poll() is None:
+		ov_action.terminate()
+		ov_action.wait()
 
 
 
@@ -0,0 +1,73 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from boot_prober import BootProber
+from event_log import EventLog
+
+
+def nodes(count):
+	return ['a8-{0}.saclay.iot-lab.info'.format(i) for i in range(count)]
+
+
+class FakeProbe:
+
+	def __init__(self, failures=None, delay=0.0):
+		self.failures = dict(failures or {}) # node name -> failed probes before it answers, None: never answers
+		self.delay    = delay
+		self.attempts = {}                   # node name -> [probe time]
+		self.active   = 0
+		self.peak     = 0
+		self.lock     = threading.Lock()
+
+	def __call__(self, node_name):
+		with self.lock:
+			self.attempts.setdefault(node_name, []).append(time.time())
+			self.active += 1
+			self.peak = max(self.peak, self.active)
+		time.sleep(self.delay)
+		with self.lock:
+			self.active -= 1
+			failures = self.failures.get(node_name, 0)
+			if failures is None:
+				return False
+			if failures == 'error':
+				raise Exception("connection reset")
+			self.failures[node_name] = failures - 1
+			return failures <= 0
+
+
+def test_probes_at_most_concurrency_nodes_at_once():
+	probe = FakeProbe(delay=0.05)
+	events = EventLog()
+
+	booted = BootProber(probe, events.publish, concurrency=4, deadline=10, retry_pause=0.1).run(nodes(12))
+	assert booted == nodes(12)
+	assert probe.peak == 4
+	assert len(events.topics('NODE_BOOTED')) == 12
+
+def test_retries_after_the_pause():
+	probe = FakeProbe({'node-a8-1': 2})
+	events = EventLog()
+
+	booted = BootProber(probe, events.publish, concurrency=2, deadline=10, retry_pause=0.2).run(nodes(2))
+	assert booted == nodes(2)
+	attempts = probe.attempts['node-a8-1']
+	assert len(attempts) == 3
+	assert all(later - earlier >= 0.2 for earlier, later in zip(attempts, attempts[1:]))
+	assert events.topics('BOOT_RETRY') == ['node-a8-1: 0/50', 'node-a8-1: 1/50']
+	assert events.topics('BOOT_FAIL') == []
+
+def test_gives_up_at_the_global_deadline():
+	probe = FakeProbe({'node-a8-0': None, 'node-a8-1': 'error'})
+	events = EventLog()
+
+	started = time.time()
+	booted = BootProber(probe, events.publish, concurrency=4, deadline=1, retry_pause=0.2).run(nodes(3))
+	assert time.time() - started < 2
+	assert booted == [nodes(3)[2]]
+	assert sorted(events.topics('BOOT_FAIL')) == ['node-a8-0', 'node-a8-1']
+	assert len(probe.attempts['node-a8-0']) >= 3
@@ -0,0 +1,141 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import campaign
+import experiment
+from campaign import Campaign, CampaignScheduler
+
+DEFINITION = {
+	'name'    : 'sweep',
+	'sweep'   : {'firmware': ['a', 'b'], 'duration': [1, 2]},
+	'options' : {'nodes': 'saclay,a8,106+107'},
+	'repeat'  : 1
+}
+
+
+class TimedSteps:
+
+	def __init__(self, log, exp_id, durations, fail=None):
+		self.log       = log
+		self.exp_id    = exp_id
+		self.durations = durations
+		self.fail      = fail
+
+	def __getattr__(self, name):
+		def step():
+			started = time.time()
+			time.sleep(self.durations.get(name, 0))
+			self.log.append((self.exp_id, name, started, time.time()))
+			if name == self.fail:
+				raise Exception("no node answered")
+		return step
+
+
+def use_temp_dirs(monkeypatch):
+	monkeypatch.setattr(experiment, 'EXPERIMENTS_DIR', tempfile.mkdtemp())
+	monkeypatch.setattr(campaign, 'CAMPAIGNS_DIR', tempfile.mkdtemp())
+
+def remove_temp_dirs():
+	shutil.rmtree(experiment.EXPERIMENTS_DIR)
+	shutil.rmtree(campaign.CAMPAIGNS_DIR)
+
+def scheduler(queue, log, pipeline=True, fail=None, steps=None):
+	durations = {'reserve': 0.2, 'boot': 0.1, 'monitor': 0.4}
+	def steps_for(run, options):
+		run_steps = TimedSteps(log, run.exp_id, durations, fail.get(run.exp_id) if fail else None)
+		if steps is not None:
+			steps[run.exp_id] = run_steps
+		return run_steps
+	def publish_for(run):
+		return lambda topic, message: None
+	return CampaignScheduler(queue, steps_for, publish_for, pipeline)
+
+def test_next_run_is_prepared_while_the_current_one_collects(monkeypatch):
+	use_temp_dirs(monkeypatch)
+	try:
+		log = []
+		steps = {}
+		summary = scheduler(Campaign.create(DEFINITION), log, steps=steps).run()
+		assert summary['done'] == 4 and summary['failed'] == 0
+
+		# The nodes of the next run may be Running while the current one collects: held for as long on top
+		assert 'reserve_more' not in vars(steps['sweep-001'])
+		assert [steps[exp_id].reserve_more for exp_id in ['sweep-002', 'sweep-003', 'sweep-004']] == [1 + 5, 2 + 5, 1 + 5]
+		assert steps['sweep-002'].reserve_wait == 60 + CampaignScheduler.RESERVE_MARGIN
+		# Only the first run, prepared while no other run is active, updates the opentestbed tree
+		assert 'update_tree' not in vars(steps['sweep-001'])
+		assert all(steps[exp_id].update_tree is False for exp_id in ['sweep-002', 'sweep-003', 'sweep-004'])
+
+		for current, following in [('sweep-001', 'sweep-002'), ('sweep-002', 'sweep-003')]:
+			ov_start = [entry for entry in log if entry[:2] == (current, 'ov_start')][0]
+			monitor  = [entry for entry in log if entry[:2] == (current, 'monitor')][0]
+			reserve  = [entry for entry in log if entry[:2] == (following, 'reserve')][0]
+			release  = [entry for entry in log if entry[:2] == (current, 'release')][0]
+			assert ov_start[3] <= reserve[2] < monitor[3] # reserved while the current run collects
+			assert release[2] >= monitor[3]
+		assert max(summary['gaps']) < 0.2 # reservation and boot are off the critical path
+
+		sequential = []
+		remove_temp_dirs()
+		use_temp_dirs(monkeypatch)
+		assert scheduler(Campaign.create(DEFINITION), sequential, pipeline=False).run()['elapsed'] > summary['elapsed'] + 0.5
+
+		with open(os.path.join(experiment.EXPERIMENTS_DIR, 'sweep-004', Campaign.RESULT_FILE)) as f:
+			result = json.load(f)
+		assert result['success'] and result['options'] == {'firmware': 'b', 'duration': 2, 'nodes': 'saclay,a8,106+107'}
+		assert [stage['stage'] for stage in result['stages']] == ['reserve', 'boot', 'otbox', 'flash', 'ov-start', 'monitor']
+	finally:
+		remove_temp_dirs()
+
+def test_queue_is_resumed(monkeypatch):
+	use_temp_dirs(monkeypatch)
+	try:
+		queue = Campaign.create(DEFINITION)
+		assert [(run['options']['firmware'], run['options']['duration']) for run in queue.runs] == [('a', 1), ('a', 2), ('b', 1), ('b', 2)]
+
+		summary = scheduler(queue, [], fail={'sweep-002': 'flash'}).run()
+		assert summary['done'] == 3 and summary['failed'] == 1
+		assert Campaign.load('sweep').runs[1]['error'] == 'no node answered'
+
+		# Interrupted while running: queued again, the others are kept
+		queue.update(queue.runs[2], state=Campaign.RUNNING)
+		resumed = Campaign.create(DEFINITION)
+		assert [run['state'] for run in resumed.runs] == ['done', 'failed', 'queued', 'done']
+
+		log = []
+		scheduler(resumed, log).run()
+		assert set(entry[0] for entry in log) == set(['sweep-003'])
+		assert experiment.Experiment.load('sweep-003').duration == 1
+
+		try:
+			Campaign.create(dict(DEFINITION, repeat=2))
+			assert False
+		except ValueError:
+			pass
+	finally:
+		remove_temp_dirs()
+
+def test_option_values_are_checked(monkeypatch):
+	use_temp_dirs(monkeypatch)
+	try:
+		assert len(Campaign.expand(dict(DEFINITION, options={'log_policy': 'coalesce', 'flash_mode': 'chunked', 'idle_timeout': 2.5}))) == 4
+		for definition, error in [
+			(dict(DEFINITION, options={'log_policy': 'metrics'}), 'Invalid run options: log_policy="metrics"'),
+			(dict(DEFINITION, sweep={'duration': [30, '60'], 'flash_mode': ['blob', 'fast']}), 'Invalid run options: duration="60", flash_mode="fast"'),
+			(dict(DEFINITION, options={'idle_timeout': 0}), 'Invalid run options: idle_timeout=0'),
+			(dict(DEFINITION, sweep={'duration': 30}), 'Swept options need a list of values: duration'),
+			(dict(DEFINITION, options={'log-policy': 'coalesce'}), 'Unknown run options: log-policy')]:
+			try:
+				Campaign.create(definition)
+				assert False
+			except ValueError, e:
+				assert str(e) == error
+		assert Campaign.load('sweep') is None # nothing queued
+	finally:
+		remove_temp_dirs()
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmark'))
+
+from command_executor import CommandExecutor
+from fake_frontend import FakeFrontend
+
+
+def handle(command):
+	if command == 'noisy':
+		# Both streams well beyond the 2 MB channel window: sequential reads would deadlock
+		return (0, 'out\n' * 800000, 'err\n' * 800000)
+	if command == 'hang':
+		time.sleep(5)
+		return (0, 'too late\n', '')
+	if command == 'warn':
+		return (0, '{"id": 1}\n', 'DEPRECATION: Python 2.7\n')
+	return (127, '', command + ': command not found\n')
+
+def run(command, timeout=CommandExecutor.COMMAND_TIMEOUT, global_timeout=None):
+	frontend = FakeFrontend(handle).start()
+	ssh_pool = frontend.pool()
+	try:
+		return CommandExecutor(ssh_pool, global_timeout=global_timeout).run(command, timeout=timeout)
+	finally:
+		ssh_pool.close()
+		frontend.stop()
+
+
+def test_reads_both_streams():
+	result = run('noisy', timeout=30)
+	assert result.success()
+	assert len(result.output) == 800000
+	assert len(result.error) == 800000
+
+def test_exit_status_decides_success():
+	result = run('warn')
+	assert result.success()
+	assert result.output == ['{"id": 1}']
+	assert result.error == ['DEPRECATION: Python 2.7']
+
+	result = run('missing')
+	assert not result.success()
+	assert result.exit_status == 127
+
+def test_command_timeout():
+	started = time.time()
+	result = run('hang', timeout=0.5)
+	assert result.timed_out
+	assert not result.success()
+	assert time.time() - started < 4
+
+def test_global_timeout():
+	result = run('hang', global_timeout=0.5)
+	assert result.timed_out
+
+def test_streams_lines_as_they_arrive():
+	frontend = FakeFrontend(handle).start()
+	ssh_pool = frontend.pool()
+	execution = CommandExecutor(ssh_pool).stream('warn')
+	lines = list(execution)
+	ssh_pool.close()
+	frontend.stop()
+
+	assert ('stdout', '{"id": 1}') in lines
+	assert ('stderr', 'DEPRECATION: Python 2.7') in lines
+	assert execution.result.exit_status == 0
@@ -0,0 +1,146 @@
+import contextlib
+import glob
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmark'))
+
+import experiment
+from experiment import Experiment
+from exp_terminate import ExpTerminate
+from reservation import Reservation
+from fake_frontend import FakeFrontend
+from fake_iotlab import FakeIotlabCli
+
+NODES = ['a8-106.saclay.iot-lab.info', 'a8-107.saclay.iot-lab.info']
+
+
+def experiments_dir(monkeypatch):
+	directory = tempfile.mkdtemp()
+	monkeypatch.setattr(experiment, 'EXPERIMENTS_DIR', directory)
+	return directory
+
+def test_state_is_shared_by_the_actions_of_a_run(monkeypatch):
+	directory = experiments_dir(monkeypatch)
+	try:
+		Experiment.load('run-a', nodes='saclay,a8,1+2', channel='7').save()
+		Experiment.load('run-b').save()
+
+		run = Experiment.load('run-a', nodes=None)
+		assert run.nodes == 'saclay,a8,1+2' and run.channel == '7'
+		Experiment.load('run-a').update(iotlab_id=42, reserved=NODES)
+
+		run.reload()
+		assert run.iotlab_id == 42
+		assert run.box_ids() == ['node-a8-106', 'node-a8-107']
+		assert run.mqtt_client_id != Experiment.load('run-b').mqtt_client_id
+		assert Experiment.load('run-b').iotlab_id is None
+	finally:
+		shutil.rmtree(directory)
+
+def test_terminates_only_its_own_processes(monkeypatch):
+	directory = experiments_dir(monkeypatch)
+	try:
+		run, other = Experiment.load('run-a'), Experiment.load('run-b')
+		# sh reaps its sleep on SIGTERM, which only ends at once if the sleep was signalled as well (whole group)
+		mine = run.spawn(['sh', '-c', 'trap wait TERM; sleep 30 & wait'])
+		theirs = other.spawn(['sleep', '30'])
+		stubborn = None
+		try:
+			time.sleep(0.2) # sh started its sleep
+			group = Experiment.load('run-a').processes[0]
+			started = time.time()
+			assert Experiment.load('run-a').terminate() == []
+			assert time.time() - started < Experiment.TERM_TIMEOUT # as soon as it exited, not killed after the grace period
+
+			assert mine.poll() is not None
+			assert not run.alive(group) # the sleep of the group too
+			assert theirs.poll() is None
+			assert Experiment.load('run-a').processes == []
+			assert len(Experiment.load('run-b').processes) == 1
+
+			stubborn = run.spawn(['sh', '-c', 'trap "" TERM; sleep 30 & wait; sleep 30'])
+			time.sleep(0.2)
+			started = time.time()
+			assert Experiment.load('run-a').terminate(term_timeout=0.5) == []
+			assert time.time() - started >= 0.5 # killed once the grace period is over
+			assert stubborn.poll() is not None
+		finally:
+			for process in [mine, theirs, stubborn]:
+				if process is not None and process.poll() is None:
+					os.killpg(process.pid, signal.SIGKILL)
+	finally:
+		shutil.rmtree(directory)
+
+def test_terminate_forgets_the_caller_and_never_signals_a_reused_pid(monkeypatch):
+	directory = experiments_dir(monkeypatch)
+	stranger = subprocess.Popen(['sleep', '30'], preexec_fn=os.setsid) # not started by the run
+	try:
+		run = Experiment.load('run-a')
+		run.add_process(os.getpid()) # e.g. the log monitor, which terminates the run itself
+		gone = run.spawn(['true'])
+		gone.wait()
+
+		# The pid of a recorded process that exited, now given to another process
+		entry = Experiment.process_entry(stranger.pid, True)
+		run.update(processes=run.processes + [dict(entry, started=entry['started'] - 1), {'pid': stranger.pid, 'group': True}])
+
+		assert Experiment.load('run-a').terminate(term_timeout=0.5) == []
+		assert stranger.poll() is None
+		assert Experiment.load('run-a').processes == [] # nothing left to signal by a later run of the same id
+	finally:
+		os.killpg(stranger.pid, signal.SIGKILL)
+		stranger.wait()
+		shutil.rmtree(directory)
+
+def test_terminate_archives_the_logs(monkeypatch):
+	directory = experiments_dir(monkeypatch)
+	try:
+		run = Experiment.load('run-a', ov_dir=os.path.join(directory, 'ov'))
+		os.makedirs(run.log_dir)
+		for name in ['openVisualizer.log', 'openVisualizer.log.1', 'other.txt']:
+			with open(os.path.join(run.log_dir, name), 'w') as f:
+				f.write(name)
+
+		archive = ExpTerminate(run).exp_terminate()
+		assert os.path.basename(archive).startswith('run-a-') and archive.endswith('.tar.gz')
+		assert glob.glob(os.path.join(run.log_dir, '*.log*')) == [] # the next run starts with no logs
+
+		deadline = time.time() + 5
+		while not os.path.exists(archive) and time.time() < deadline:
+			time.sleep(0.05)
+		with contextlib.closing(tarfile.open(archive)) as tar:
+			assert sorted(os.path.basename(name) for name in tar.getnames() if name != '.') == ['openVisualizer.log', 'openVisualizer.log.1']
+		while len(os.listdir(run.log_dir)) > 1 and time.time() < deadline:
+			time.sleep(0.05)
+		assert os.listdir(run.log_dir) == ['other.txt']
+	finally:
+		shutil.rmtree(directory)
+
+def test_iotlab_commands_are_scoped_to_the_run(monkeypatch):
+	directory = experiments_dir(monkeypatch)
+	cli = FakeIotlabCli(NODES, [('Running', 0)], submitted=False)
+	frontend = FakeFrontend(cli.handle).start()
+	try:
+		run = Experiment.load('run-a')
+		reservation = Reservation('user', frontend.host, frontend.pool(), run)
+		reservation.executor.publish = lambda topic, message: None
+		reservation.socketIoHandler.publish = lambda topic, message: None
+
+		reservation.reserve_experiment(run.duration, run.nodes)
+		assert Experiment.load('run-a').iotlab_id == FakeIotlabCli.EXPERIMENT_ID
+		assert reservation.get_reserved_nodes(True) == NODES
+		assert Experiment.load('run-a').reserved == NODES
+
+		scoped = [command for command in cli.calls if not command.startswith('iotlab-experiment submit')]
+		assert scoped and all(command.endswith(' -i ' + str(FakeIotlabCli.EXPERIMENT_ID)) for command in scoped)
+	finally:
+		frontend.stop()
+		shutil.rmtree(directory)
@@ -0,0 +1,102 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmark'))
+
+import firmware_chunks
+from firmware_store import FirmwareStore
+from otbox_flash import OTBoxFlash
+from inproc_broker import InProcessBroker
+from fake_otbox import FakeMote
+
+FIRMWARE = os.path.join(os.path.dirname(__file__), '..', 'firmware', '03oos_openwsn_prog')
+TESTBED  = 'iotlab'
+
+
+def firmware():
+	with open(FIRMWARE, 'rb') as f:
+		return f.read()
+
+def assembler_for(manifest, chunks):
+	assembler = firmware_chunks.FirmwareAssembler(manifest)
+	for chunk in chunks:
+		assembler.add(chunk)
+	return assembler
+
+def flash(broker, motes, directory):
+	flasher = OTBoxFlash(FIRMWARE, 'inproc', TESTBED, OTBoxFlash.MODE_CHUNKED, broker.client('exp-auto'), store=FirmwareStore(directory))
+	flasher.RESEND_WINDOW = 0.5
+	flasher.flash()
+	for mote in motes:
+		mote.stop()
+	return flasher
+
+
+def test_roundtrip():
+	data = firmware()
+	manifest, chunks = firmware_chunks.encode_firmware(data)
+
+	assert manifest['chunks'] == len(chunks)
+	assert manifest['compressed_size'] < manifest['size']
+	assert assembler_for(manifest, reversed(chunks)).image() == data
+
+def test_missing_and_corrupted_chunks():
+	manifest, chunks = firmware_chunks.encode_firmware(firmware())
+
+	corrupted = chunks[3][:-1] + chr((ord(chunks[3][-1]) + 1) % 256)
+	assembler = assembler_for(manifest, chunks[:3] + [corrupted] + chunks[5:])
+
+	assert not assembler.complete()
+	assert assembler.rejected == 1
+	assert assembler.missing() == [3, 4]
+
+	assembler.add(chunks[3])
+	assembler.add(chunks[4])
+	assert assembler.image() == firmware()
+
+def test_foreign_chunks_are_ignored():
+	manifest, chunks = firmware_chunks.encode_firmware(firmware())
+	other_manifest, other_chunks = firmware_chunks.encode_firmware('not the same image')
+
+	assembler = firmware_chunks.FirmwareAssembler(manifest)
+	assert not assembler.add(other_chunks[0])
+	assert assembler.missing() == range(manifest['chunks'])
+
+def test_chunked_flash_with_resends():
+	broker = InProcessBroker(max_payload=65536)
+	motes = [
+		FakeMote(broker.client('m0'), TESTBED, '00-12-4b-00-00-00-00-00').start(),
+		FakeMote(broker.client('m1'), TESTBED, '00-12-4b-00-00-00-00-01', drop=lambda seq: seq % 3 == 0).start(),
+		FakeMote(broker.client('m2'), TESTBED, '00-12-4b-00-00-00-00-02', drop=lambda seq: True).start()
+	]
+
+	directory = tempfile.mkdtemp()
+	try:
+		flasher = flash(broker, motes, directory)
+	finally:
+		shutil.rmtree(directory)
+
+	for mote in motes:
+		assert mote.image == firmware()
+	assert motes[0].requests == 0
+	assert motes[2].requests >= 1
+	assert flasher.stats['resent'] == len(motes[1].dropped) + len(motes[2].dropped)
+
+def test_blob_exceeds_broker_limit():
+	broker = InProcessBroker(max_payload=65536)
+	mote = FakeMote(broker.client('m0'), TESTBED, '00-12-4b-00-00-00-00-00').start()
+
+	directory = tempfile.mkdtemp()
+	try:
+		OTBoxFlash(FIRMWARE, 'inproc', TESTBED, OTBoxFlash.MODE_BLOB, broker.client('exp-auto'), store=FirmwareStore(directory)).flash()
+	finally:
+		shutil.rmtree(directory)
+	time.sleep(0.2)
+	mote.stop()
+
+	assert mote.image is None
+	assert broker.dropped == 1
@@ -0,0 +1,80 @@
+import base64
+import json
+import os
+import multiprocessing
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import firmware_chunks
+from firmware_store import FirmwareStore, FlashLedger
+
+FIRMWARE = os.path.join(os.path.dirname(__file__), '..', 'firmware', '03oos_openwsn_prog')
+
+
+def test_payloads_are_stored_by_content():
+	directory = tempfile.mkdtemp()
+	try:
+		with open(FIRMWARE, 'rb') as f:
+			data = f.read()
+		copy = os.path.join(directory, 'renamed_prog')
+		shutil.copy(FIRMWARE, copy)
+
+		store = FirmwareStore(os.path.join(directory, 'store'))
+		artifact = store.add(FIRMWARE)
+		assert artifact.id == firmware_chunks.image_id(data)
+		assert store.add(copy).directory == artifact.directory
+		assert sorted(name for name in os.listdir(store.directory) if not name.startswith('.')) == [artifact.id]
+
+		payload = json.loads(artifact.program_payload('abcd'))
+		assert payload['token'] == 'abcd' and payload['id'] == artifact.id
+		assert base64.b64decode(payload['hex']) == data
+
+		manifest, chunks = artifact.manifest_and_chunks()
+		assert (manifest, chunks) == firmware_chunks.encode_firmware(data)
+		assembler = firmware_chunks.FirmwareAssembler(manifest)
+		for chunk in chunks:
+			assembler.add(chunk)
+		assert assembler.image() == data
+	finally:
+		shutil.rmtree(directory)
+
+def test_ledger_is_scoped_to_the_reservation():
+	directory = tempfile.mkdtemp()
+	try:
+		ledger = FlashLedger(os.path.join(directory, 'store', FlashLedger.LEDGER_FILE))
+		assert ledger.images(42) == {}
+
+		ledger.record(['mote-0', 'mote-1'], 'image-a', 42)
+		ledger.record(['mote-1'], 'image-b', 42)
+		ledger.record(['mote-2'], 'image-a', None)
+		assert ledger.images(42) == {'mote-0': 'image-a', 'mote-1': 'image-b'}
+		assert ledger.images(43) == {} and ledger.images(None) == {}
+
+		with open(ledger.path, 'w') as f:
+			f.write('{"mote-0": ')
+		assert ledger.images(42) == {}
+	finally:
+		shutil.rmtree(directory)
+
+def record_motes(path, first):
+	ledger = FlashLedger(path)
+	for n in range(first, first + 20):
+		ledger.record(['mote-{0}'.format(n)], 'image-a', 42)
+
+def test_ledger_records_from_concurrent_processes():
+	directory = tempfile.mkdtemp()
+	try:
+		path = os.path.join(directory, FlashLedger.LEDGER_FILE)
+		writers = [multiprocessing.Process(target=record_motes, args=(path, first)) for first in range(0, 80, 20)]
+		for writer in writers:
+			writer.start()
+		for writer in writers:
+			writer.join()
+
+		# Without the flock, a record read before another process replaced the file drops its motes
+		assert sorted(FlashLedger(path).images(42)) == sorted('mote-{0}'.format(n) for n in range(80))
+	finally:
+		shutil.rmtree(directory)
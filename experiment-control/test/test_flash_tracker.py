@@ -0,0 +1,129 @@
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmark'))
+
+import experiment
+from experiment import Experiment
+from firmware_store import FirmwareStore
+from flash_tracker import FlashTracker
+from node_inventory import NodeInventory
+from otbox_flash import OTBoxFlash
+from inproc_broker import InProcessBroker
+from fake_otbox import FakeMote, FakeBox
+from event_log import EventLog
+
+FIRMWARE = os.path.join(os.path.dirname(__file__), '..', 'firmware', '03oos_openwsn_prog')
+TESTBED  = 'iotlab'
+
+
+def test_tracker_retries_then_fails():
+	tracker = FlashTracker(['a', 'b', 'c'], max_attempts=2, attempt_timeout=10)
+	tracker.sent(['a', 'b', 'c'], now=0)
+
+	assert tracker.response('a', True, now=1) == FlashTracker.FLASHED
+	assert tracker.response('b', False, now=1) == FlashTracker.RETRY
+	assert tracker.response('z', True, now=1) is None
+	assert tracker.due_retries(now=5) == ['b']
+	assert tracker.due_retries(now=10) == ['b', 'c']
+
+	tracker.sent(['b', 'c'], now=10)
+	assert tracker.response('b', True, now=11) == FlashTracker.FLASHED
+	assert not tracker.finished()
+	assert tracker.due_retries(now=20) == []
+	assert tracker.finished()
+	assert tracker.summary() == {'devices': 3, 'flashed': ['a', 'b'], 'failed': ['c']}
+
+def run_fleet(mode, fail_attempts, discover=True, store=None, fleet=None, report_images=True, experiment=None):
+	# fleet: (broker, motes) of a previous run, programmed again
+	broker, motes = fleet if fleet is not None else (InProcessBroker(), None)
+	if motes is None:
+		motes = [FakeMote(broker.client('m%d' % i), TESTBED, 'mote-%d' % i, fail_attempts=attempts) for i, attempts in enumerate(fail_attempts)]
+	for mote in motes:
+		mote.start()
+	box = FakeBox(broker.client('box'), TESTBED, 'box-0', motes, report_images).start()
+	events = EventLog()
+
+	directory = tempfile.mkdtemp() if store is None else None
+	flasher = OTBoxFlash(FIRMWARE, 'inproc', TESTBED, mode, broker.client('exp-auto'), True, None if discover else [mote.device_id for mote in motes], events, experiment, store or FirmwareStore(directory))
+	flasher.DISCOVERY_TIMEOUT = 0.2
+	flasher.TRACK_POLL = 0.05
+	flasher.RESEND_WINDOW = 0.1
+	flasher.MAX_ATTEMPTS = 2
+	flasher.ATTEMPT_TIMEOUT = 1
+	summary = flasher.flash()
+
+	for mote in motes:
+		mote.stop()
+	box.stop()
+	if directory is not None:
+		shutil.rmtree(directory)
+	return summary, (broker, motes), events
+
+def test_blob_fleet_with_retries():
+	summary, (broker, motes), events = run_fleet(OTBoxFlash.MODE_BLOB, [0, 1, 0, 2])
+
+	assert summary['flashed'] == ['mote-0', 'mote-1', 'mote-2']
+	assert summary['failed'] == ['mote-3']
+	assert sorted(events.topics('MOTE_FLASH_RETRY')) == ['mote-1', 'mote-3']
+	assert events.topics('MOTE_FLASH_FAIL') == ['mote-3']
+	assert len(events.topics('FLASH_COMPLETE')) == 1
+	assert events.topics('FLASH_FAIL') == [summary]
+	assert motes[0].attempts == 1 # the retries went to the failed motes only
+
+def test_fails_without_motes():
+	summary, fleet, events = run_fleet(OTBoxFlash.MODE_BLOB, [])
+
+	assert summary == {'devices': 0, 'flashed': [], 'failed': [], 'skipped': []}
+	assert not OTBoxFlash.succeeded(summary)
+	assert events.topics('FLASH_FAIL') == [summary]
+
+def test_chunked_fleet_with_known_devices():
+	summary, (broker, motes), events = run_fleet(OTBoxFlash.MODE_CHUNKED, [0, 1], discover=False)
+
+	assert summary['flashed'] == ['mote-0', 'mote-1']
+	assert summary['failed'] == []
+	assert events.topics('FLASH_FAIL') == []
+	assert motes[0].attempts == 1
+	assert motes[1].attempts == 2
+
+def test_back_to_back_runs_skip_the_motes_running_the_image():
+	directory = tempfile.mkdtemp()
+	try:
+		store = FirmwareStore(directory)
+		summary, fleet, events = run_fleet(OTBoxFlash.MODE_BLOB, [0, 0, 1], store=store)
+		assert summary['flashed'] == ['mote-0', 'mote-1', 'mote-2'] and summary['skipped'] == []
+
+		# The box reports the image of its motes: only the one that was reprogrammed meanwhile is flashed again
+		broker, motes = fleet
+		motes[1].image_id = 'another image'
+		summary, fleet, events = run_fleet(OTBoxFlash.MODE_CHUNKED, None, store=store, fleet=fleet)
+		assert summary['flashed'] == ['mote-1']
+		assert summary['skipped'] == ['mote-0', 'mote-2'] and summary['devices'] == 3
+		assert [mote.attempts for mote in motes] == [1, 2, 2]
+		assert events.topics('FLASH_SKIPPED') == [['mote-0', 'mote-2']]
+	finally:
+		shutil.rmtree(directory)
+
+def test_ledger_stands_in_for_boxes_not_reporting_images(monkeypatch):
+	directory = tempfile.mkdtemp()
+	monkeypatch.setattr(experiment, 'EXPERIMENTS_DIR', directory)
+	try:
+		store = FirmwareStore(directory)
+		run = Experiment('run-a', iotlab_id=42)
+		summary, fleet, events = run_fleet(OTBoxFlash.MODE_BLOB, [0, 0], store=store, report_images=False, experiment=run)
+		assert summary['flashed'] == ['mote-0', 'mote-1']
+		assert NodeInventory(run).box_of('mote-1') == 'box-0' # the motes discovered are kept for the run
+
+		summary, fleet, events = run_fleet(OTBoxFlash.MODE_BLOB, None, store=store, fleet=fleet, report_images=False, experiment=run)
+		assert summary == {'devices': 2, 'flashed': [], 'failed': [], 'skipped': ['mote-0', 'mote-1']}
+		assert [mote.attempts for mote in fleet[1]] == [1, 1]
+
+		# Within another IoT-LAB experiment the motes may have been programmed by someone else
+		summary, fleet, events = run_fleet(OTBoxFlash.MODE_BLOB, None, store=store, fleet=fleet, report_images=False, experiment=Experiment('run-a', iotlab_id=43))
+		assert summary['flashed'] == ['mote-0', 'mote-1']
+	finally:
+		shutil.rmtree(directory)
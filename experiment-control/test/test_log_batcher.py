@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import log_batcher
+from log_batcher import LogBatcher
+
+
+class Publisher:
+
+	def __init__(self):
+		self.messages  = []
+		self.times     = []
+		self.published = threading.Event()
+
+	def publish(self, topic, message):
+		self.messages.append((topic, message))
+		self.times.append(time.time())
+		self.published.set()
+
+	def records(self):
+		return [record for topic, batch in self.messages for record in batch]
+
+
+# Tells when the sender sleeps on the empty queue, i.e. until put() wakes it up
+class IdleCondition(threading._Condition):
+
+	def __init__(self):
+		threading._Condition.__init__(self)
+		self.idle = threading.Event()
+
+	def wait(self, timeout=None):
+		if timeout is None:
+			self.idle.set()
+		threading._Condition.wait(self, timeout)
+
+
+class WatchedThreading:
+
+	Thread    = threading.Thread
+	Condition = IdleCondition
+
+
+def record(n, mote='emulated1', metric='cpu'):
+	return {'_timestamp': n, '_type': 'openbenchmark.' + metric, '_mote_info': {'serial': mote}, 'n': n}
+
+def test_batches_by_size():
+	publisher = Publisher()
+	batcher = LogBatcher(publisher.publish, max_batch=10, max_delay=60, min_interval=0)
+	for n in range(25):
+		batcher.put(record(n))
+	batcher.close()
+
+	assert [len(batch) for topic, batch in publisher.messages] == [10, 10, 5]
+	assert [r['n'] for r in publisher.records()] == range(25)
+	assert all(topic == 'LOG_MODIFICATION_BATCH' for topic, batch in publisher.messages)
+
+def test_batches_by_delay(monkeypatch):
+	monkeypatch.setattr(log_batcher, 'threading', WatchedThreading)
+	publisher = Publisher()
+	batcher = LogBatcher(publisher.publish, max_batch=100, max_delay=0.05, min_interval=0)
+	assert batcher.condition.idle.wait(5)
+
+	# put() takes the lock the sender only releases once it sleeps: the record lands on an idle sender
+	started = time.time()
+	batcher.put(record(0))
+	assert publisher.published.wait(5)
+	assert time.time() - started < 0.05 + 0.5
+	assert [r['n'] for r in publisher.records()] == [0]
+	batcher.close()
+
+def test_leftovers_of_a_full_batch_keep_their_age():
+	publisher = Publisher()
+	batcher = LogBatcher(publisher.publish, max_batch=10, max_delay=1.0, min_interval=0.5)
+	batcher.put(record(0))
+	assert publisher.published.wait(5)
+
+	# A full batch waits for min_interval, the 5 records left over are due max_delay after they arrived, not after it
+	started = time.time()
+	for n in range(1, 16):
+		batcher.put(record(n))
+	deadline = time.time() + 5
+	while len(publisher.messages) < 3 and time.time() < deadline:
+		time.sleep(0.01)
+
+	assert [len(batch) for topic, batch in publisher.messages] == [1, 10, 5]
+	assert 0.95 <= publisher.times[2] - started < 1.3
+	batcher.close()
+
+def test_drop_policies():
+	for policy, kept in [(LogBatcher.DROP_OLDEST, [2, 3, 4]), (LogBatcher.DROP_NEWEST, [0, 1, 2])]:
+		publisher = Publisher()
+		batcher = LogBatcher(publisher.publish, policy, max_queue=3, max_batch=100, max_delay=60)
+		for n in range(5):
+			batcher.put(record(n))
+		batcher.close()
+
+		assert [r['n'] for r in publisher.records()] == kept
+		assert batcher.stats['dropped'] == 2
+
+def test_coalesce_keeps_latest_value_per_key():
+	publisher = Publisher()
+	batcher = LogBatcher(publisher.publish, LogBatcher.COALESCE, max_queue=2, max_batch=100, max_delay=60)
+	batcher.put(record(0, 'emulated1'), 'emulated1')
+	batcher.put(record(1, 'emulated2'), 'emulated2')
+	batcher.put(record(2, 'emulated1'), 'emulated1')
+	batcher.put(record(3, 'emulated3'), 'emulated3')
+	batcher.close()
+
+	assert [r['n'] for r in publisher.records()] == [1, 3]
+	assert batcher.stats['coalesced'] == 1
+	assert batcher.stats['dropped'] == 1
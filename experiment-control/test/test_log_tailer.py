@@ -0,0 +1,70 @@
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from log_tailer import LogTailer
+
+
+def setup_function(function):
+	global logDir, logFile
+	logDir  = tempfile.mkdtemp()
+	logFile = os.path.join(logDir, 'networkEvent.log')
+
+def teardown_function(function):
+	shutil.rmtree(logDir)
+
+def append(path, data):
+	with open(path, 'ab') as f:
+		f.write(data)
+
+
+def test_reads_only_new_lines():
+	tailer = LogTailer()
+	append(logFile, '{"n": 1}\n{"n": 2}\n')
+	assert tailer.read(logFile) == ['{"n": 1}', '{"n": 2}']
+	assert tailer.read(logFile) == []
+
+	append(logFile, '{"n": 3}\n')
+	assert tailer.read(logFile) == ['{"n": 3}']
+
+def test_partial_lines_wait_for_their_end():
+	tailer = LogTailer()
+	append(logFile, '{"n": 1}\n{"n"')
+	assert tailer.read(logFile) == ['{"n": 1}']
+
+	append(logFile, ': 2}\n')
+	assert tailer.read(logFile) == ['{"n": 2}']
+
+def test_rotation():
+	tailer = LogTailer()
+	append(logFile, '{"n": 1}\n')
+	assert tailer.read(logFile) == ['{"n": 1}']
+
+	# Written after the last event, then rotated away before the next one
+	append(logFile, '{"n": 2}\n')
+	os.rename(logFile, logFile + '.1')
+	append(logFile, '{"n": 3}\n')
+
+	assert tailer.read(logFile) == ['{"n": 2}', '{"n": 3}']
+	assert tailer.read(logFile + '.1') == []
+
+def test_truncation():
+	tailer = LogTailer()
+	append(logFile, '{"n": 1}\n{"n": 2}\n')
+	tailer.read(logFile)
+
+	open(logFile, 'wb').close()
+	append(logFile, '{"n": 3}\n')
+	assert tailer.read(logFile) == ['{"n": 3}']
+
+def test_skip_existing():
+	append(logFile, '{"n": 1}\n')
+	tailer = LogTailer()
+	tailer.skip_existing(logDir)
+
+	append(logFile, '{"n": 2}\n')
+	assert tailer.read(logFile) == ['{"n": 2}']
+	assert tailer.read(os.path.join(logDir, 'missing.log')) == []
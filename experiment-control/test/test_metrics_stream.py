@@ -0,0 +1,66 @@
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from metrics_stream import MetricsStream
+
+MOTE = 'bbbb::0012:4b00:14b5:b648'
+
+
+def packet(event, asn, token, hop_limit):
+	return {'event': event, 'timestamp': asn, 'packetToken': token, 'source': MOTE, 'destination': 'bbbb::1', 'hopLimit': hop_limit}
+
+def experiment():
+	stream = MetricsStream(window=100)
+	stream.add({'event': 'synchronizationCompleted', 'timestamp': 15, 'source': MOTE})
+	stream.add({'event': 'secureJoinCompleted', 'timestamp': 30, 'source': MOTE})
+	stream.add({'event': 'networkFormationCompleted', 'timestamp': 57, 'source': MOTE})
+	for n in range(10):
+		stream.add(packet('packetSent', 100 + n * 10, [n, 1], 255))
+		if n != 3:
+			stream.add(packet('packetReceived', 100 + n * 10 + n + 1, [n, 1], 252))
+	stream.add({'event': 'radioDutyCycleMeasurement', 'timestamp': 2151, 'dutyCycle': 0.5, 'source': MOTE})
+	stream.add({'event': 'radioDutyCycleMeasurement', 'timestamp': 2152, 'dutyCycle': 1.0, 'source': MOTE})
+	return stream
+
+def test_kpis():
+	summary = experiment().summary()
+	node = summary['nodes'][MOTE]
+
+	assert summary['packets_sent'] == 10
+	assert summary['packets_received'] == 9
+	assert node['pdr'] == 0.9
+	assert node['hops'] == 3
+	assert node['latency'] == {50: 6, 90: 10, 99: 10}
+	assert node['join'] == {'synchronizationCompleted': 15, 'secureJoinCompleted': 30, 'networkFormationCompleted': 57}
+	assert node['duty_cycle'] == 0.75
+
+def test_window_percentiles():
+	stream = experiment()
+	assert stream.percentiles(MOTE, 1) == {50: 6, 90: 9, 99: 9}
+	assert stream.percentiles(MOTE, 2) == {50: 10, 90: 10, 99: 10}
+
+def test_ignores_other_records():
+	stream = MetricsStream()
+	assert not stream.add({'_timestamp': 1.5, '_type': 'openbenchmark.cpu'})
+	assert not stream.add({'event': 'packetSent', 'timestamp': 10})
+	assert stream.summary()['packets_sent'] == 0
+
+def test_persist_and_load():
+	directory = tempfile.mkdtemp()
+	try:
+		stream = experiment()
+		stream.persist(directory)
+		stream.add(packet('packetSent', 500, [20, 1], 255))
+		stream.add(packet('packetReceived', 520, [20, 1], 254))
+		stream.persist(directory)
+
+		assert MetricsStream.load(directory).summary() == stream.summary()
+
+		MetricsStream().persist(directory) # a new experiment replaces the previous files
+		assert MetricsStream.load(directory).summary()['packets_sent'] == 0
+	finally:
+		shutil.rmtree(directory)
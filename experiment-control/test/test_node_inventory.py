@@ -0,0 +1,78 @@
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmark'))
+
+import experiment
+from experiment import Experiment
+from node_inventory import NodeInventory
+from reservation import Reservation
+from fake_frontend import FakeFrontend
+from fake_iotlab import FakeIotlabCli
+from event_log import EventLog
+
+NODES = ['a8-106.saclay.iot-lab.info', 'a8-107.saclay.iot-lab.info']
+
+
+def reservation(frontend, run):
+	reservation = Reservation('user', frontend.host, frontend.pool(), run)
+	reservation.socketIoHandler = EventLog()
+	reservation.executor.publish = reservation.socketIoHandler.publish
+	return reservation
+
+def test_one_round_trip_per_run(monkeypatch):
+	monkeypatch.setattr(experiment, 'EXPERIMENTS_DIR', tempfile.mkdtemp())
+	cli = FakeIotlabCli(NODES, [('Running', 0)], submitted=False)
+	frontend = FakeFrontend(cli.handle).start()
+	try:
+		run = Experiment('run-a')
+		reservation(frontend, run).reserve_experiment(30, 'saclay,a8,106+107')
+		assert run.iotlab_id == FakeIotlabCli.EXPERIMENT_ID
+
+		assert reservation(frontend, run).get_reserved_nodes(True) == NODES
+		calls = len(cli.calls)
+
+		# What the other stages and actions of the run ask again, e.g. OTBoxStartup through its own Reservation
+		other = reservation(frontend, Experiment.load('run-a'))
+		assert other.get_reserved_nodes(True) == NODES
+		assert other.check_experiment() and other.experiment_exists()
+		assert len(cli.calls) == calls
+
+		other.inventory.ttl = 0
+		assert other.check_experiment()
+		assert len(cli.calls) == calls + 1
+
+		# A new submission drops the inventory of the previous IoT-LAB experiment
+		run.update(iotlab_id=None)
+		reservation(frontend, run).reserve_experiment(30, 'saclay,a8,106+107')
+		assert not os.path.exists(NodeInventory(run).path)
+	finally:
+		frontend.stop()
+		shutil.rmtree(experiment.EXPERIMENTS_DIR)
+
+def test_node_lookups_are_scoped_to_the_iotlab_experiment(monkeypatch):
+	monkeypatch.setattr(experiment, 'EXPERIMENTS_DIR', tempfile.mkdtemp())
+	try:
+		run = Experiment('run-a', iotlab_id=42)
+		inventory = NodeInventory(run)
+		inventory.store({'id': 42, 'state': 'Running', 'nodes': NODES})
+		inventory.add_motes('node-a8-106', ['14-15-92-00-00-00-00-01'])
+		inventory.save_motes()
+
+		loaded = NodeInventory(Experiment('run-a', iotlab_id=42))
+		assert loaded.reservation()['nodes'] == NODES
+		assert loaded.box('a8-107.saclay.iot-lab.info') == 'node-a8-107'
+		assert loaded.hostname('node-a8-106') == 'a8-106.saclay.iot-lab.info'
+		assert loaded.eui64s('node-a8-106') == ['14-15-92-00-00-00-00-01']
+		assert loaded.box_of('14-15-92-00-00-00-00-01') == 'node-a8-106'
+
+		other = NodeInventory(Experiment('run-a', iotlab_id=43))
+		assert other.reservation() is None and other.box_of('14-15-92-00-00-00-00-01') is None
+
+		loaded.invalidate()
+		assert NodeInventory(run).reservation() is None
+	finally:
+		shutil.rmtree(experiment.EXPERIMENTS_DIR)
@@ -0,0 +1,100 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmark'))
+
+import reservation
+from experiment import Experiment
+from orchestrator import Orchestrator, ExperimentSteps
+from firmware_store import FirmwareStore
+from otbox_flash import OTBoxFlash
+from inproc_broker import InProcessBroker
+from fake_otbox import FakeMote, FakeBox
+from event_log import EventLog
+
+FIRMWARE = os.path.join(os.path.dirname(__file__), '..', 'firmware', '03oos_openwsn_prog')
+TESTBED  = 'iotlab'
+
+
+class FakeSteps:
+
+	def __init__(self, fail=None):
+		self.fail = fail
+		self.calls = []
+
+	def __getattr__(self, name):
+		def step():
+			self.calls.append(name)
+			if name == self.fail:
+				raise Exception("no node answered")
+			return name
+		return step
+
+
+def test_runs_the_stages_in_order():
+	steps = FakeSteps()
+	events = EventLog()
+
+	started = time.time()
+	assert Orchestrator(steps, events.publish).run()
+
+	assert steps.calls == ['reserve', 'boot', 'otbox', 'flash', 'ov_start', 'monitor']
+	assert events.topics('STAGE_STARTED') == Orchestrator.STAGES
+	assert time.time() - started < 1 # each stage starts on the readiness event of the previous one
+
+def test_stops_at_the_failed_stage():
+	steps = FakeSteps(fail='otbox')
+	events = EventLog()
+
+	assert not Orchestrator(steps, events.publish).run()
+	assert steps.calls == ['reserve', 'boot', 'otbox', 'terminate'] # OV and otbox.py are not left running
+	assert events.topics('ORCHESTRATION_FAIL') == [{'stage': 'otbox', 'error': 'no node answered'}]
+
+	steps = FakeSteps(fail='reserve')
+	assert not Orchestrator(steps, events.publish, terminate=False).run()
+	assert steps.calls == ['reserve']
+
+class FakeReservation:
+
+	submitted = []
+
+	def __init__(self, user, domain, experiment=None):
+		pass
+
+	def reserve_experiment(self, duration, nodes):
+		self.submitted.append((duration, nodes))
+
+	def get_reserved_nodes(self, logging):
+		return ['a8-1.saclay.iot-lab.info']
+
+def test_reserves_the_run_duration_and_more(monkeypatch):
+	monkeypatch.setattr(reservation, 'Reservation', FakeReservation)
+	steps = ExperimentSteps(Experiment('run-a', nodes='saclay,a8,1', duration=30), 'user', TESTBED, 'broker', FIRMWARE, OTBoxFlash.MODE_BLOB, 'coalesce')
+	steps.reserve()
+	steps.reserve_more = 36 # held while the previous run of a campaign collects
+	steps.reserve()
+	assert FakeReservation.submitted == [(30, 'saclay,a8,1'), (66, 'saclay,a8,1')]
+
+def test_flash_session_waits_for_boxes():
+	broker = InProcessBroker()
+	motes = [FakeMote(broker.client('m%d' % i), TESTBED, 'mote-%d' % i).start() for i in range(4)]
+	boxes = [FakeBox(broker.client('box%d' % i), TESTBED, 'box-%d' % i, motes[i * 2:i * 2 + 2]).start() for i in range(2)]
+
+	directory = tempfile.mkdtemp()
+	flasher = OTBoxFlash(FIRMWARE, 'inproc', TESTBED, OTBoxFlash.MODE_BLOB, broker.client('exp-auto'), True, None, EventLog(), store=FirmwareStore(directory))
+	flasher.TRACK_POLL = 0.05
+	assert flasher.open()
+	try:
+		flasher.devices = flasher.wait_for_boxes(2, 5)
+		assert flasher.devices == ['mote-0', 'mote-1', 'mote-2', 'mote-3']
+		assert flasher.flash()['flashed'] == flasher.devices
+	finally:
+		flasher.close()
+		shutil.rmtree(directory)
+
+	for client in motes + boxes:
+		client.stop()
@@ -0,0 +1,118 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmark'))
+
+from command_executor import CommandExecutor, CommandResult
+from otbox_provision import OTBoxProvisioner
+from otbox_startup import OTBoxStartup
+from socket_io_handler import SocketIoEmitter
+from ssh_pool import SshPool
+from fake_a8 import FakeA8
+from fake_frontend import FakeFrontend
+from fake_relay import FakeRelay
+
+NODES = ['a8-{0}.saclay.iot-lab.info'.format(i) for i in range(1, 4)]
+
+FAKE_PIP = '''#!/bin/sh
+while [ "$1" != "--target" ]; do shift; done
+mkdir -p "$2" && touch "$2/requests.py"
+'''
+
+
+class LocalShell:
+
+	# Runs the commands in a local directory standing in for the home directory on the frontend, pip installs nothing
+	def __init__(self, directory):
+		self.directory = directory
+		bin_dir = os.path.join(directory, 'bin')
+		os.makedirs(bin_dir)
+		with open(os.path.join(bin_dir, 'pip'), 'w') as f:
+			f.write(FAKE_PIP)
+		os.chmod(os.path.join(bin_dir, 'pip'), 0755)
+		self.env = dict(os.environ, PATH=bin_dir + os.pathsep + os.environ['PATH'])
+
+	def run(self, command, node_name=None, timeout=None):
+		result = CommandResult(command, node_name)
+		process = subprocess.Popen(command, shell=True, cwd=self.directory, env=self.env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		output, error = process.communicate()
+		result.output, result.error, result.exit_status = output.splitlines(), error.splitlines(), process.returncode
+		return result
+
+
+def start(frontend):
+	startup = OTBoxStartup('user', frontend.host, 'iotlab', NODES)
+	startup.booted_nodes = NODES
+	startup.launch()
+	return startup
+
+def test_startups_share_one_provisioning(monkeypatch):
+	a8 = FakeA8()
+	frontend = FakeFrontend(a8.handle).start()
+	monkeypatch.setattr(SocketIoEmitter, 'emitter', SocketIoEmitter(FakeRelay().connect))
+	monkeypatch.setitem(SshPool.pools, ('user', frontend.host, 22), frontend.pool())
+	try:
+		assert start(frontend).provisioner.revision == a8.upstream
+		assert a8.calls == {'ls-remote': 1, 'clone': 1, 'fetch': 0, 'pip': 1} # pip on one node for all of them
+
+		startup = start(frontend)
+		assert len(startup.active_nodes) == len(NODES)
+		assert a8.calls == {'ls-remote': 1, 'clone': 1, 'fetch': 0, 'pip': 1}
+		assert len(a8.launched) == 2 * len(NODES)
+		assert all('PYTHONPATH=../otbox-deps/' in command for command in a8.launched)
+	finally:
+		frontend.stop()
+
+def test_updates_only_what_changed():
+	a8 = FakeA8()
+	frontend = FakeFrontend(a8.handle).start()
+	executor = CommandExecutor(frontend.pool())
+	try:
+		assert OTBoxProvisioner(executor).provision() == OTBoxProvisioner.CLONED
+		assert OTBoxProvisioner(executor).provision() == OTBoxProvisioner.CURRENT
+		assert OTBoxProvisioner(executor, refresh_interval=0).provision() == OTBoxProvisioner.CHECKED
+
+		a8.upstream = '2' * 40
+		assert OTBoxProvisioner(executor).provision() == OTBoxProvisioner.CURRENT # upstream not asked before the refresh
+		assert OTBoxProvisioner(executor, refresh_interval=0).provision() == OTBoxProvisioner.UPDATED
+		assert a8.revision == '2' * 40
+		assert a8.calls['clone'] == 1 and a8.calls['fetch'] == 1
+
+		# Another run has otbox.py running from the tree: neither asked upstream nor checked out
+		a8.upstream = '3' * 40
+		kept = OTBoxProvisioner(executor, refresh_interval=0)
+		assert kept.provision(update=False) == OTBoxProvisioner.KEPT
+		assert kept.revision == a8.revision == '2' * 40
+		assert a8.calls == {'ls-remote': 3, 'clone': 1, 'fetch': 1, 'pip': 0}
+
+		a8.revision = None # tree removed behind our back
+		assert OTBoxProvisioner(executor).provision(update=False) == OTBoxProvisioner.FAILED
+		assert OTBoxProvisioner(executor).provision() == OTBoxProvisioner.CLONED
+
+		provisioner = OTBoxProvisioner(executor, requirements=['requests', 'paho-mqtt'])
+		provisioner.provision()
+		assert provisioner.ensure_bundle('node-a8-1').startswith('../otbox-deps/')
+		assert provisioner.ensure_bundle('node-a8-1') is not None
+		reordered = OTBoxProvisioner(executor, requirements=['paho-mqtt', 'requests'])
+		reordered.provision()
+		assert reordered.bundle_ready and a8.calls['pip'] == 1
+	finally:
+		frontend.stop()
+
+def test_racing_bundle_builds_keep_one_bundle():
+	directory = tempfile.mkdtemp()
+	try:
+		shell = LocalShell(directory)
+		# Both startups found no bundle, the second one renames its build once the first one is in place
+		first, second = OTBoxProvisioner(shell), OTBoxProvisioner(shell)
+		assert first.ensure_bundle('node-a8-1') == second.ensure_bundle('node-a8-2')
+
+		bundle = os.path.join(directory, first.bundle)
+		assert os.listdir(bundle) == ['requests.py']
+		assert os.listdir(os.path.dirname(bundle)) == [os.path.basename(bundle)]
+	finally:
+		shutil.rmtree(directory)
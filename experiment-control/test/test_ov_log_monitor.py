@@ -0,0 +1,74 @@
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import experiment
+from experiment import Experiment
+from ov_log_monitor import OVLogMonitor
+from socket_io_handler import SocketIoEmitter
+
+
+class Relay:
+
+	def __init__(self):
+		self.topics = []
+
+	def connect(self):
+		return self
+
+	def emit(self, name, envelope):
+		self.topics.append(envelope['topic'])
+
+	def disconnect(self):
+		pass
+
+
+def test_returns_once_the_run_is_idle(monkeypatch):
+	directory = tempfile.mkdtemp()
+	monkeypatch.setattr(experiment, 'EXPERIMENTS_DIR', directory)
+	relay = Relay()
+	monkeypatch.setattr(SocketIoEmitter, 'emitter', SocketIoEmitter(relay.connect))
+
+	ov = socket.socket() # OpenVisualizer listening
+	ov.bind(('localhost', 0))
+	ov.listen(1)
+	run = Experiment('run-a', ov_dir=os.path.join(directory, 'openvisualizer'), ov_port=ov.getsockname()[1])
+	os.makedirs(run.log_dir)
+
+	monitor = OVLogMonitor(experiment=run, idle_timeout=0.5)
+	monitor.CHECK_INTERVAL = 0.1
+
+	def write_record():
+		time.sleep(0.2)
+		with open(os.path.join(run.log_dir, 'openv_events.log'), 'a') as f:
+			f.write(json.dumps({'_timestamp': time.time(), '_type': 'openbenchmark.cpu', '_mote_info': {'serial': 'emulated1'}}) + '\n')
+	threading.Thread(target=write_record).start()
+
+	try:
+		# In the orchestrator the monitor runs in the orchestrator process: it must return, not exit
+		monitor_thread = threading.Thread(target=monitor.start)
+		monitor_thread.start()
+		monitor_thread.join(15)
+		assert not monitor_thread.is_alive()
+		SocketIoEmitter.emitter.flush()
+
+		assert relay.topics.count('EXP_TERMINATE') == 1
+		assert monitor.event_handler.batcher.stats['received'] == 1
+		assert os.path.exists(run.metrics_dir)
+
+		# The logs are archived in the background
+		archives = os.path.join(run.run_dir, 'logs')
+		deadline = time.time() + 10
+		while not [name for name in os.listdir(archives) if name.endswith('.tar.gz')] and time.time() < deadline:
+			time.sleep(0.05)
+		assert not os.path.exists(os.path.join(run.log_dir, 'openv_events.log'))
+	finally:
+		ov.close()
+		shutil.rmtree(directory)
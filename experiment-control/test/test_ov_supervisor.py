@@ -0,0 +1,99 @@
+import os
+import shutil
+import socket
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import experiment
+from experiment import Experiment
+from ov_supervisor import OVSupervisor
+from event_log import EventLog
+
+# Stands in for OpenVisualizer: floods both pipes, crashes as long as argv[2] runs remain, then serves argv[1]
+FAKE_OV = '''
+import os, socket, sys, time
+lines = int(sys.argv[3])
+for i in range(lines):
+	sys.stdout.write('stdout line %d %s\\n' % (i, 'x' * 100))
+	sys.stderr.write('stderr line %d %s\\n' % (i, 'y' * 100))
+counter = sys.argv[4]
+crashes = int(open(counter).read()) if os.path.exists(counter) else int(sys.argv[2])
+if crashes > 0:
+	open(counter, 'w').write(str(crashes - 1))
+	sys.stderr.write('boom\\n')
+	sys.exit(3)
+server = socket.socket()
+server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+server.bind(('localhost', int(sys.argv[1])))
+server.listen(5)
+time.sleep(60)
+'''
+
+
+def free_port():
+	probe = socket.socket()
+	probe.bind(('localhost', 0))
+	port = probe.getsockname()[1]
+	probe.close()
+	return port
+
+def supervisor(monkeypatch, crashes, lines=0, **kwargs):
+	directory = tempfile.mkdtemp()
+	monkeypatch.setattr(experiment, 'EXPERIMENTS_DIR', directory)
+	run = Experiment.load('run-a', ov_port=free_port())
+	script = os.path.join(directory, 'fake_ov.py')
+	with open(script, 'w') as f:
+		f.write(FAKE_OV)
+
+	events = EventLog()
+	args = [sys.executable, script, str(run.ov_port), str(crashes), str(lines), os.path.join(directory, 'crashes')]
+	return OVSupervisor(run, args, events.publish, restart_min=0.05, restart_max=0.1, **kwargs), events, directory
+
+def test_drains_the_pipes_and_reports_readiness(monkeypatch):
+	ov, events, directory = supervisor(monkeypatch, 0, lines=20000) # ~2 MB on each pipe
+	try:
+		assert ov.start().wait_ready(15)
+		ov.stop()
+		assert ov.state == OVSupervisor.STOPPED
+		assert [state['state'] for state in events.topics('OV_STATE')] == ['starting', 'ready', 'stopped']
+		assert ov.output.stats['received'] == 40000
+
+		line = [message for topic, message in events.events if topic == 'OV_OUTPUT_BATCH'][-1][-1]
+		assert line['stream'] in ['stdout', 'stderr'] and line['line'].startswith(line['stream'] + ' line')
+	finally:
+		ov.stop()
+		shutil.rmtree(directory)
+
+def test_restarts_after_a_crash(monkeypatch):
+	ov, events, directory = supervisor(monkeypatch, 2)
+	try:
+		assert ov.start().wait_ready(15)
+		states = events.topics('OV_STATE')
+		assert [state['state'] for state in states] == ['starting', 'crashed', 'starting', 'crashed', 'starting', 'ready']
+		assert states[1]['returncode'] == 3 and states[1]['stderr'] == ['boom']
+		assert ov.restarts == 2
+	finally:
+		ov.stop()
+		shutil.rmtree(directory)
+
+def test_gives_up_and_is_not_restarted_once_terminated(monkeypatch):
+	ov, events, directory = supervisor(monkeypatch, 100, max_restarts=2)
+	try:
+		assert not ov.start().wait_ready(15)
+		assert ov.state == OVSupervisor.FAILED
+		assert len([state for state in events.topics('OV_STATE') if state['state'] == 'starting']) == 3
+	finally:
+		ov.stop()
+		shutil.rmtree(directory)
+
+	ov, events, directory = supervisor(monkeypatch, 0)
+	try:
+		assert ov.start().wait_ready(15)
+		assert ov.experiment.terminate() == []
+		assert ov.done.wait(5)
+		assert [state['state'] for state in events.topics('OV_STATE')][-1] == 'stopped'
+	finally:
+		ov.stop()
+		shutil.rmtree(directory)
@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmark'))
+
+from reservation_watcher import ReservationWatcher
+from reservation import Reservation
+from fake_frontend import FakeFrontend
+from fake_iotlab import FakeIotlabCli
+from event_log import EventLog
+
+NODES = ['a8-106.saclay.iot-lab.info', 'a8-107.saclay.iot-lab.info']
+
+
+def test_returns_when_running():
+	cli = FakeIotlabCli(NODES, [('Waiting', 0.3), ('Launching', 0.3), ('Running', 0)])
+	events = EventLog()
+
+	result = ReservationWatcher(cli.state, events.publish, deadline=5, poll_min=0.05, poll_max=0.1).watch()
+
+	assert result['success']
+	assert result['elapsed'] < 0.8
+	assert sorted(result['durations'].keys()) == ['Launching', 'Waiting']
+	assert events.topics('RESERVATION_STATE') == ['Waiting', 'Launching', 'Running']
+
+def test_stops_on_error_and_deadline():
+	cli = FakeIotlabCli(NODES, [('Waiting', 0.1), ('Error', 0)])
+	result = ReservationWatcher(cli.state, EventLog().publish, deadline=5, poll_min=0.05).watch()
+	assert not result['success'] and result['state'] == 'Error'
+
+	cli = FakeIotlabCli(NODES, [('Waiting', 60)])
+	started = time.time()
+	result = ReservationWatcher(cli.state, EventLog().publish, deadline=0.3, poll_min=0.05).watch()
+	assert not result['success'] and result['state'] == 'Waiting'
+	assert time.time() - started < 0.6
+
+def test_reservation_through_fake_frontend():
+	cli = FakeIotlabCli(NODES, [('Waiting', 0.2), ('Running', 0)])
+	frontend = FakeFrontend(cli.handle).start()
+	try:
+		reservation = Reservation('user', frontend.host, frontend.pool())
+		events = EventLog()
+		reservation.socketIoHandler = events
+		reservation.executor.publish = events.publish
+
+		assert reservation.get_reserved_nodes(True) == NODES
+		assert events.topics('RESERVATION_FAIL') == []
+		assert len(events.topics('RESERVATION_SUCCESS')) == 1
+
+		cli.timeline = [('Error', 0)]
+		assert reservation.get_reserved_nodes(True) == []
+		assert events.topics('RESERVATION_FAIL') == ['Error']
+		assert len(events.topics('RESERVATION_SUCCESS')) == 1
+	finally:
+		frontend.stop()
@@ -0,0 +1,63 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from scheduler import Scheduler, monotonic
+
+
+def test_runs_tasks_in_due_order():
+	scheduler = Scheduler()
+	calls = []
+	try:
+		scheduler.schedule(0.2, calls.append, 'late')
+		scheduler.schedule(0.05, calls.append, 'early')
+		cancelled = scheduler.schedule(0.1, calls.append, 'cancelled')
+		cancelled.cancel()
+		time.sleep(0.4)
+		assert calls == ['early', 'late']
+	finally:
+		scheduler.close()
+
+def test_periodic_tasks_on_one_thread():
+	before = threading.active_count()
+	scheduler = Scheduler()
+	ticks = []
+	threads = set()
+	try:
+		def tick(name):
+			ticks.append((name, monotonic()))
+			threads.add(threading.current_thread())
+		fast = scheduler.every(0.02, tick, 'fast')
+		scheduler.every(0.1, tick, 'slow')
+		time.sleep(0.5)
+
+		# One scheduler thread for both tasks; loose bounds on the tick counts, shared CI machines stall
+		assert threading.active_count() == before + 1
+		assert len(threads) == 1
+		assert 10 <= len([t for name, t in ticks if name == 'fast']) <= 26
+		assert 2 <= len([t for name, t in ticks if name == 'slow']) <= 6
+
+		fast.cancel()
+		count = len(ticks)
+		time.sleep(0.25)
+		assert len([t for name, t in ticks[count:] if name == 'fast']) == 0
+		# A failing task is reported and keeps its schedule
+		scheduler.every(0.02, lambda: 1 / 0)
+		time.sleep(0.1)
+		assert scheduler.thread.is_alive()
+	finally:
+		scheduler.close()
+
+def test_idle_scheduler_costs_no_cpu():
+	scheduler = Scheduler()
+	try:
+		scheduler.every(3600, lambda: None)
+		time.sleep(0.1)
+		cpu = sum(os.times()[:2])
+		time.sleep(1)
+		assert sum(os.times()[:2]) - cpu < 0.25 # a busy loop would cost about the whole second
+	finally:
+		scheduler.close()
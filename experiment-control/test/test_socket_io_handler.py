@@ -0,0 +1,101 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from socket_io_handler import SocketIoEmitter, SocketIoHandler
+
+
+class FakeRelay:
+
+	def __init__(self, down_for=0, emit_cost=0):
+		self.down_for  = down_for # number of connection attempts refused
+		self.emit_cost = emit_cost
+		self.attempts  = 0
+		self.events    = []
+		self.envelopes = []
+
+	def connect(self):
+		self.attempts += 1
+		if self.attempts <= self.down_for:
+			raise IOError("Connection refused")
+		return self
+
+	def emit(self, name, envelope):
+		time.sleep(self.emit_cost)
+		self.envelopes.append(envelope)
+		self.events.append((envelope['topic'], envelope['payload']) + ((envelope['channel'],) if envelope['channel'] else ()))
+
+	def disconnect(self):
+		pass
+
+
+def test_publish_does_not_wait_for_the_relay():
+	relay = FakeRelay(emit_cost=0.05)
+	handler = SocketIoHandler(emitter=SocketIoEmitter(relay.connect))
+
+	started = time.time()
+	for n in range(20):
+		handler.publish('NODE_BOOTED', 'node-a8-{0}'.format(n))
+	assert time.time() - started < 0.05
+
+	assert handler.emitter.flush(5)
+	assert relay.events == [('NODE_BOOTED', 'node-a8-{0}'.format(n)) for n in range(20)]
+	assert relay.attempts == 1
+
+def test_buffers_while_the_relay_is_down():
+	relay = FakeRelay(down_for=3)
+	emitter = SocketIoEmitter(relay.connect, retry_min=0.01, retry_max=0.02)
+	emitter.publish('RESERVATION_SUCCESS', '1234')
+	emitter.publish('NODE_BOOTED', 'node-a8-1')
+	emitter.close(5)
+
+	assert relay.events == [('RESERVATION_SUCCESS', '1234'), ('NODE_BOOTED', 'node-a8-1')]
+	assert emitter.stats['failures'] == 3
+
+def test_drops_oldest_events_past_the_buffer_size():
+	relay = FakeRelay(down_for=1000000)
+	emitter = SocketIoEmitter(relay.connect, max_buffer=3, retry_min=0.01, retry_max=0.01)
+	for n in range(5):
+		emitter.publish('CMD_OUTPUT', str(n))
+
+	assert [event['payload'] for event in emitter.buffer] == ['2', '3', '4']
+	assert emitter.stats['dropped'] == 2
+	emitter.close(0.1)
+
+def test_routes_to_the_experiment_channel():
+	relay = FakeRelay()
+	emitter = SocketIoEmitter(relay.connect)
+	SocketIoHandler('exp-2', emitter).publish('NODE_BOOTED', 'node-a8-1')
+	SocketIoHandler(emitter=emitter).publish('NODE_BOOTED', 'node-a8-2')
+	emitter.close(5)
+
+	assert relay.events == [('NODE_BOOTED', 'node-a8-1', 'exp-2'), ('NODE_BOOTED', 'node-a8-2')]
+
+def test_events_are_sent_as_envelopes():
+	relay = FakeRelay()
+	emitter = SocketIoEmitter(relay.connect)
+	SocketIoHandler('2', emitter, 'run-a').publish('FLASH_COMPLETE', {'flashed': ['mote-1']})
+	SocketIoHandler(emitter=emitter).publish('NODE_BOOTED', 'node-a8-2')
+	emitter.close(5)
+
+	first, second = relay.envelopes
+	assert first['exp'] == 'run-a' and first['channel'] == '2' and second['exp'] is None
+	assert first['payload'] == {'flashed': ['mote-1']} # encoded once, by the transport
+	assert [first['seq'], second['seq']] == [0, 1]
+	assert first['ts'] <= second['ts']
+
+def test_warm_up_connects_before_the_first_event():
+	relay = FakeRelay()
+	emitter = SocketIoEmitter(relay.connect)
+	emitter.warm_up()
+	deadline = time.time() + 5
+	while emitter.socketIO is None and time.time() < deadline:
+		time.sleep(0.01)
+	assert relay.attempts == 1 and relay.events == []
+
+	emitter.publish('NODE_BOOTED', 'node-a8-1')
+	emitter.close(5)
+	assert relay.events == [('NODE_BOOTED', 'node-a8-1')]
+	assert relay.attempts == 1
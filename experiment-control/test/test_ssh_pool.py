@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmark'))
+
+import paramiko
+import pytest
+
+from fake_frontend import FakeFrontend
+
+NODE = 'node-a8-1'
+
+
+class CommandLog:
+
+	def __init__(self, name):
+		self.name     = name
+		self.commands = []
+
+	def handle(self, command):
+		self.commands.append(command)
+		return (0, self.name + ': ' + command + '\n', '')
+
+
+def output(streams):
+	stdin, stdout, stderr = streams
+	return stdout.read().strip()
+
+def wait_inactive(client, timeout=5):
+	deadline = time.time() + timeout
+	while client.get_transport().is_active() and time.time() < deadline:
+		time.sleep(0.05)
+	assert not client.get_transport().is_active()
+
+def start(nodes=None, accept_auth=True):
+	node = FakeFrontend(CommandLog('node').handle, accept_auth=accept_auth).start()
+	frontend_log = CommandLog('frontend')
+	forwarded = dict((name, (node.host, node.port)) for name in nodes) if nodes is not None else None
+	frontend = FakeFrontend(frontend_log.handle, nodes=forwarded).start()
+	return node, frontend, frontend_log
+
+
+def test_node_commands_go_through_one_jump_connection():
+	node, frontend, frontend_log = start([NODE])
+	pool = frontend.pool()
+	try:
+		assert output(pool.node_exec_command(NODE, 'uptime')) == 'node: uptime'
+		assert output(pool.node_exec_command(NODE, 'hostname')) == 'node: hostname'
+		assert pool.jump_hosts
+		assert len(node.transports) == 1 # kept open between commands
+		assert frontend_log.commands == []
+
+		# Unreachable node: the error is raised, jumping is still the way to go
+		with pytest.raises(paramiko.ChannelException):
+			pool.node_exec_command('node-a8-2', 'uptime')
+		assert pool.jump_hosts
+	finally:
+		pool.close()
+		frontend.stop()
+		node.stop()
+
+def test_reconnects_when_the_transport_dies():
+	node, frontend, frontend_log = start([NODE])
+	pool = frontend.pool()
+	try:
+		assert output(pool.exec_command('uptime')) == 'frontend: uptime'
+		assert output(pool.node_exec_command(NODE, 'uptime')) == 'node: uptime'
+		client, node_client = pool.client, pool.node_clients[NODE]
+
+		node.disconnect()
+		frontend.disconnect()
+		wait_inactive(client)
+		wait_inactive(node_client)
+
+		assert output(pool.exec_command('uptime')) == 'frontend: uptime'
+		assert output(pool.node_exec_command(NODE, 'uptime')) == 'node: uptime'
+		assert pool.client is not client and pool.node_clients[NODE] is not node_client
+		assert len(frontend.transports) == 2 and len(node.transports) == 2
+	finally:
+		pool.close()
+		frontend.stop()
+		node.stop()
+
+def test_hops_through_the_frontend_when_forwarding_is_refused():
+	node, frontend, frontend_log = start() # IoT-LAB: no port forwarding
+	pool = frontend.pool()
+	try:
+		assert output(pool.node_exec_command(NODE, 'uptime')).startswith('frontend: ')
+		assert output(pool.node_exec_command(NODE, 'hostname')).startswith('frontend: ')
+		assert pool.jump_hosts is False
+		assert frontend_log.commands == ['ssh -o "StrictHostKeyChecking no" root@' + NODE + ' "' + command + '"' for command in ['uptime', 'hostname']]
+	finally:
+		pool.close()
+		frontend.stop()
+		node.stop()
+
+def test_hops_through_the_frontend_when_the_node_rejects_the_key():
+	node, frontend, frontend_log = start([NODE], accept_auth=False)
+	pool = frontend.pool()
+	try:
+		assert output(pool.node_exec_command(NODE, 'uptime')).startswith('frontend: ')
+		assert pool.jump_hosts is False
+		assert len(frontend_log.commands) == 1 and 'root@' + NODE in frontend_log.commands[0]
+	finally:
+		pool.close()
+		frontend.stop()
+		node.stop()
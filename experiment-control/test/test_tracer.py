@@ -0,0 +1,93 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from boot_prober import BootProber
+from tracer import Tracer, NULL_SPAN, span
+from worker_pool import run_parallel
+
+
+def test_disabled_tracing_returns_the_null_span():
+	assert Tracer.tracer is None
+	with span('ssh.exec', node='node-a8-1') as traced:
+		assert traced is NULL_SPAN
+		traced.set(exit_status=0)
+
+	started = time.time()
+	for i in range(100000):
+		with span('mqtt.publish', bytes=i):
+			pass
+	assert time.time() - started < 1
+
+def test_nested_spans_to_jsonl_and_summary():
+	directory = tempfile.mkdtemp()
+	path = os.path.join(directory, 'traces', 'otbox.jsonl')
+	try:
+		Tracer.start(path, Tracer.JSONL, exp_id='run-a')
+		with span('otbox.launch', nodes=2):
+			def launch(node):
+				with span('otbox.start', node=node):
+					with span('ssh.exec', node=node) as traced:
+						traced.set(exit_status=0)
+			run_parallel(launch, ['node-a8-1', 'node-a8-2'], 2)
+		with span('otbox.boot_wait'):
+			BootProber(lambda node_name: True, lambda topic, message: None, concurrency=2).run(['a8-1', 'a8-2', 'a8-3'])
+		def connect():
+			with span('ssh.connect', host='node-a8-1'):
+				pass
+		unrelated = threading.Thread(target=connect) # started outside the pool: no parent
+		unrelated.start()
+		unrelated.join()
+		try:
+			with span('ssh.connect', host='saclay.iot-lab.info'):
+				raise IOError('refused')
+		except IOError:
+			pass
+		summary = Tracer.stop()
+
+		assert Tracer.tracer is None
+		with open(path) as f:
+			spans = [json.loads(line) for line in f]
+		by_name = dict((record['name'], record) for record in spans)
+		starts = [record for record in spans if record['name'] == 'otbox.start']
+		execs = [record for record in spans if record['name'] == 'ssh.exec']
+
+		assert sorted(record['parent'] for record in execs) == sorted(record['id'] for record in starts)
+		assert all(record['parent'] == by_name['otbox.launch']['id'] for record in starts) # handed to the workers
+		assert [record['parent'] for record in spans if record['name'] == 'boot.probe'] == [by_name['otbox.boot_wait']['id']] * 3
+		assert [record['parent'] for record in spans if record['name'] == 'ssh.connect'] == [None, None]
+		assert execs[0]['attrs']['exp_id'] == 'run-a' and execs[0]['attrs']['exit_status'] == 0
+		assert by_name['ssh.connect']['error'] == 'IOError: refused'
+
+		assert [entry['name'] for entry in summary] == ['otbox.launch', 'otbox.start', 'ssh.exec', 'otbox.boot_wait', 'boot.probe', 'ssh.connect']
+		assert summary[1]['count'] == 2 and summary[5]['errors'] == 1
+		assert summary[0]['total'] >= summary[1]['max']
+	finally:
+		Tracer.stop()
+		shutil.rmtree(directory)
+
+def test_chrome_trace():
+	directory = tempfile.mkdtemp()
+	path = os.path.join(directory, 'flash.json')
+	try:
+		Tracer.start(path, Tracer.CHROME)
+		with span('flash', mode='blob'):
+			with span('mqtt.publish', bytes=42):
+				time.sleep(0.01)
+		Tracer.stop()
+
+		with open(path) as f:
+			events = json.load(f)['traceEvents']
+		assert [event['name'] for event in events] == ['mqtt.publish', 'flash']
+		assert all(event['ph'] == 'X' and event['tid'] == 1 for event in events)
+		assert events[0]['dur'] >= 10000 and events[0]['args']['bytes'] == 42
+		assert events[1]['ts'] <= events[0]['ts'] and events[0]['args']['parent'] == events[1]['args']['id']
+	finally:
+		Tracer.stop()
+		shutil.rmtree(directory)
@@ -0,0 +1,38 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from worker_pool import run_parallel
+
+
+def test_results_in_input_order_on_at_most_concurrency_threads():
+	lock = threading.Lock()
+	running = [0, 0] # active, peak
+
+	def square(item):
+		with lock:
+			running[0] += 1
+			running[1] = max(running[1], running[0])
+		time.sleep(0.02 * (10 - item)) # the first items finish last
+		with lock:
+			running[0] -= 1
+		return item * item
+
+	started = time.time()
+	assert run_parallel(square, range(10), 5) == [item * item for item in range(10)]
+	assert running[1] == 5
+	assert time.time() - started < 0.02 * 55 # less than one item after the other
+
+def test_exceptions_are_returned_in_place():
+	def check(item):
+		if item == 'bad':
+			raise ValueError(item)
+		return item
+
+	results = run_parallel(check, ['a', 'bad', 'b'], 0) # at least one thread
+	assert results[0] == 'a' and results[2] == 'b'
+	assert isinstance(results[1], ValueError)
+	assert run_parallel(check, [], 4) == []
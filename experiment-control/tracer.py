@@ -0,0 +1,212 @@
+import itertools
+import json
+import os
+import threading
+import time
+
+# Spans timing what a run spends its time on: SSH connects and commands, boot probes, MQTT publishes, OV startup...
+# A span is opened with `with span(name, **attributes):` and nests into the span open on the same thread, if any.
+# A worker thread has no open span of its own: its target is wrapped with propagate(), so that its spans nest into
+# the span that was open where the work was handed over, e.g. boot.probe spans into otbox.boot_wait.
+# Each span also carries the attributes given to Tracer.start(), e.g. the experiment id, next to its own (node...).
+# Tracing is off unless Tracer.start() was called: span() then returns NULL_SPAN, which does nothing.
+# Finished spans are written to a JSON-lines file as they end, or to a Chrome trace (chrome://tracing, Perfetto)
+# when the tracer stops. summary() aggregates the spans per name: count, total, mean and max duration, errors.
+
+class Span:
+
+	ids = itertools.count(1)
+
+	def __init__(self, tracer, name, parent, attributes):
+		self.tracer     = tracer
+		self.name       = name
+		self.id         = next(self.ids)
+		self.parent     = parent
+		self.attributes = attributes
+		self.thread     = threading.current_thread()
+		self.start      = None
+		self.duration   = None
+		self.error      = None
+
+	# Attributes only known once the work is done, e.g. the exit status of a command
+	def set(self, **attributes):
+		self.attributes.update(attributes)
+		return self
+
+	def __enter__(self):
+		self.tracer.stack().append(self)
+		self.start = time.time()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.duration = time.time() - self.start
+		if exc_type is not None:
+			self.error = exc_type.__name__ + ": " + str(exc_value)
+		stack = self.tracer.stack()
+		if stack and stack[-1] is self:
+			stack.pop()
+		self.tracer.finish(self)
+		return False
+
+	def record(self):
+		return {
+			'name'     : self.name,
+			'id'       : self.id,
+			'parent'   : self.parent,
+			'start'    : self.start,
+			'duration' : self.duration,
+			'thread'   : self.thread.name,
+			'error'    : self.error,
+			'attrs'    : dict(self.tracer.attributes, **self.attributes)
+		}
+
+
+class NullSpan:
+
+	def set(self, **attributes):
+		return self
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		return False
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+
+	JSONL         = 'jsonl'
+	CHROME        = 'chrome'
+	FORMATS       = [JSONL, CHROME]
+	EXTENSIONS    = {JSONL: 'jsonl', CHROME: 'json'}
+	SUMMARY_TOPIC = 'TRACE_SUMMARY'
+
+	tracer        = None # tracer of the process, None while tracing is off
+
+	@classmethod
+	def start(cls, path, format=JSONL, **attributes):
+		cls.tracer = cls(path, format, attributes)
+		return cls.tracer
+
+	# Stops tracing, returns the summary of the spans
+	@classmethod
+	def stop(cls):
+		tracer, cls.tracer = cls.tracer, None
+		if tracer is None:
+			return []
+		tracer.close()
+		return tracer.summary()
+
+	def __init__(self, path, format=JSONL, attributes=None):
+		self.path       = path
+		self.format     = format
+		self.attributes = attributes or {}
+		self.spans      = []
+		self.local      = threading.local()
+		self.lock       = threading.Lock()
+		self.pid        = os.getpid()
+
+		directory = os.path.dirname(path)
+		if directory and not os.path.exists(directory):
+			os.makedirs(directory)
+		self.file = open(path, 'w') if format == self.JSONL else None
+
+	def stack(self):
+		stack = getattr(self.local, 'stack', None)
+		if stack is None:
+			stack = self.local.stack = []
+		return stack
+
+	# Id of the innermost span open on this thread, else of the span the thread was started from
+	def current(self):
+		stack = self.stack()
+		return stack[-1].id if stack else getattr(self.local, 'parent', None)
+
+	def span(self, name, attributes):
+		return Span(self, name, self.current(), attributes)
+
+	def finish(self, span):
+		with self.lock:
+			self.spans.append(span)
+			if self.file is not None:
+				self.file.write(json.dumps(span.record()) + '\n')
+				self.file.flush()
+
+	def summary(self):
+		with self.lock:
+			spans = list(self.spans)
+
+		names = {}
+		for span in sorted(spans, key=lambda span: span.start):
+			entry = names.get(span.name)
+			if entry is None:
+				entry = names[span.name] = {'name': span.name, 'count': 0, 'total': 0.0, 'max': 0.0, 'errors': 0, 'first': span.start}
+			entry['count']  += 1
+			entry['total']  += span.duration
+			entry['max']     = max(entry['max'], span.duration)
+			entry['errors'] += 1 if span.error is not None else 0
+
+		summary = sorted(names.values(), key=lambda entry: entry['first'])
+		for entry in summary:
+			entry['mean'] = entry['total'] / entry['count']
+			del entry['first']
+		return summary
+
+	def chrome_trace(self):
+		threads = {}
+		events = []
+		for span in self.spans:
+			record = span.record()
+			args = dict(record['attrs'], id=span.id, parent=span.parent)
+			if span.error is not None:
+				args['error'] = span.error
+			events.append({
+				'name' : span.name,
+				'cat'  : span.name.split('.')[0],
+				'ph'   : 'X',
+				'ts'   : int(span.start * 1e6),
+				'dur'  : int(span.duration * 1e6),
+				'pid'  : self.pid,
+				'tid'  : threads.setdefault(span.thread.ident, len(threads) + 1),
+				'args' : args
+			})
+		return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+	def close(self):
+		with self.lock:
+			if self.file is not None:
+				self.file.close()
+				self.file = None
+			elif self.format == self.CHROME:
+				with open(self.path, 'w') as f:
+					json.dump(self.chrome_trace(), f)
+
+
+def span(name, **attributes):
+	tracer = Tracer.tracer
+	if tracer is None:
+		return NULL_SPAN
+	return tracer.span(name, attributes)
+
+# Wraps the target of a worker thread: the spans it opens get the span open here, now, as parent
+def propagate(func):
+	tracer = Tracer.tracer
+	if tracer is None:
+		return func
+	parent = tracer.current()
+
+	def run(*args, **kwargs):
+		previous, tracer.local.parent = getattr(tracer.local, 'parent', None), parent
+		try:
+			return func(*args, **kwargs)
+		finally:
+			tracer.local.parent = previous
+	return run
+
+def format_summary(summary):
+	lines = ['{0:<28} {1:>6} {2:>10} {3:>10} {4:>10} {5:>6}'.format('span', 'count', 'total (s)', 'mean (s)', 'max (s)', 'errors')]
+	for entry in summary:
+		lines.append('{name:<28} {count:>6} {total:>10.3f} {mean:>10.3f} {max:>10.3f} {errors:>6}'.format(**entry))
+	return '\n'.join(lines)
@@ -0,0 +1,38 @@
+import Queue
+import threading
+
+from tracer import propagate
+
+# Runs func(item) for every item on at most `concurrency` threads and returns the results in input order.
+# func is expected to handle its own errors; an exception that escapes it is stored in place of the result.
+def run_parallel(func, items, concurrency):
+	results = [None] * len(items)
+	queue = Queue.Queue()
+
+	for index, item in enumerate(items):
+		queue.put((index, item))
+
+	def worker():
+		while True:
+			try:
+				index, item = queue.get_nowait()
+			except Queue.Empty:
+				return
+
+			try:
+				results[index] = func(item)
+			except Exception, e:
+				results[index] = e
+
+	workers = []
+	target = propagate(worker) # spans opened by func nest into the caller's
+	for i in range(min(max(1, concurrency), len(items))):
+		thread = threading.Thread(target=target)
+		thread.daemon = True
+		thread.start()
+		workers.append(thread)
+
+	for thread in workers:
+		thread.join()
+
+	return results
@@ -10,9 +10,10 @@ class CommandHandler {
 
     private $reserve_nodes_cmd = "python " . self::COMMAND_MAIN . " -reserve 2>&1"; //2>&1 added to insure that all output is given as a return of shell_exec function
     private $otbox_start_cmd = "python " . self::COMMAND_MAIN . " -otbox 2>&1";
-    private $ov_start_cmd = "python " . self::COMMAND_MAIN . " -ov-start 2>&1";
+    private $ov_start_cmd = "python " . self::COMMAND_MAIN . " --action=ov-start > /dev/null 2>/dev/null &"; //Keeps supervising OV, reports its state over Socket.IO
     private $ov_monitor_cmd = "python " . self::COMMAND_MAIN . " -ov-monitor > /dev/null 2>/dev/null &";
     private $exp_terminate = "python " . self::COMMAND_MAIN . " -terminate 2>&1";
+    private $orchestrate_cmd = "python " . self::COMMAND_MAIN . " --action=orchestrate > /dev/null 2>/dev/null &"; //Runs all the steps in one process, reporting progress over Socket.IO
 
     function reserve_nodes() {
         return shell_exec($this->reserve_nodes_cmd);
@@ -30,6 +31,10 @@ class CommandHandler {
         return shell_exec($this->ov_monitor_cmd);
     }
 
+    function orchestrate() {
+        return shell_exec($this->orchestrate_cmd);
+    }
+
     function exp_terminate() {
         return shell_exec($this->exp_terminate);
     }
@@ -10,14 +10,8 @@ class ExperimentController extends Controller
     function start() {
         $cmd_handler = new CommandHandler();
 
-        $cmd_handler->reserve_nodes();
-        $cmd_handler->otbox_start();
-
-        sleep($cmd_handler::OV_GUARD_TIME); //A guard time to wait for the nodes to start sending serial data before running OV
-        $cmd_handler->ov_start();
-
-        sleep($cmd_handler::OV_LOG_GUARD_TIME); //A guard time to wait for OV to start writing the log
-        return $cmd_handler->ov_monitor();
+        //Each step starts as soon as the previous one reports ready, no guard time is needed
+        return $cmd_handler->orchestrate();
     }
 
     function upload() {